@@ -3,6 +3,18 @@ set -e
 
 python manage.py migrate --noinput
 
-python manage.py collectstatic --noinput
+# Each gunicorn worker writes its metrics to this directory and /metrics
+# adds them up. Set after the management commands so they write none
+export PROMETHEUS_MULTIPROC_DIR="${PROMETHEUS_MULTIPROC_DIR:-/tmp/prometheus}"
+rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
 
-exec gunicorn --bind 0.0.0.0:8000 --workers 3 --timeout 120 library_management_system.wsgi:application
+# Worker class, worker and thread counts are set in gunicorn.conf.py from the
+# environment and the container's CPU quota. SERVER_MODE=asgi serves the ASGI
+# application with uvicorn workers, so the async views can wait on slow
+# clients without holding a worker each
+if [ "${SERVER_MODE:-wsgi}" = "asgi" ]; then
+    exec gunicorn --config gunicorn.conf.py library_management_system.asgi:application
+fi
+
+exec gunicorn --config gunicorn.conf.py library_management_system.wsgi:application
@@ -0,0 +1,136 @@
+"""
+Gunicorn settings, read from the environment (see the README).
+
+Anything not set is derived from the CPU quota of the container's cgroup,
+so a pod runs as many workers as the cores it is allotted rather than as
+many as the node has. gthread workers default to 4 threads each, so
+workers x threads is about four times the core count. Every worker thread
+holds its own MySQL connection, and a connection budget can lower the
+workers and threads. The budget does not bound asgi mode (uvicorn workers),
+where each async request may hold a connection of its own.
+"""
+
+import math
+import os
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+
+def cpu_limit(root=CGROUP_ROOT):
+    """
+    Returns the number of CPUs the container may use: the cgroup v2 or v1
+    CPU quota if one is set, otherwise the CPUs this process may run on.
+    """
+    try:
+        with open(os.path.join(root, 'cpu.max')) as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(os.path.join(root, 'cpu', 'cpu.cfs_quota_us')) as f:
+            quota = int(f.read())
+        with open(os.path.join(root, 'cpu', 'cpu.cfs_period_us')) as f:
+            period = int(f.read())
+        if quota > 0:
+            return quota / period
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+def env_int(name, default):
+    value = os.environ.get(name, '')
+    return int(value) if value else default
+
+
+cpus = max(1, math.ceil(cpu_limit()))
+
+if os.environ.get('SERVER_MODE', 'wsgi') == 'asgi':
+    worker_class = 'uvicorn_worker.UvicornWorker'
+else:
+    worker_class = os.environ.get('GUNICORN_WORKER_CLASS') or 'sync'
+
+# sync workers block on I/O, so run a few more than there are cores; threads
+# and event loops already overlap I/O within one worker per core
+default_workers = 2 * cpus + 1 if worker_class == 'sync' else cpus
+workers = env_int('GUNICORN_WORKERS', default_workers)
+threads = env_int('GUNICORN_THREADS', 4 if worker_class == 'gthread' else 1)
+worker_connections = env_int('GUNICORN_WORKER_CONNECTIONS', 100)
+
+# Database connections: Django keeps one per thread (or greenlet), so a
+# worker holds up to `threads` of them (`worker_connections` with gevent).
+# DB_MAX_CONNECTIONS_PER_PROCESS caps that per worker and
+# DB_MAX_CONNECTIONS_PER_POD caps the pod total by running fewer workers, so
+# the pods of a fully scaled-out deployment stay under MySQL's max_connections.
+# A uvicorn worker (SERVER_MODE=asgi) runs the database calls of each async
+# request in a thread of that request, so concurrent requests can open more
+# connections than the budget; only the number of workers is lowered.
+process_cap = env_int('DB_MAX_CONNECTIONS_PER_PROCESS', 0)
+pod_cap = env_int('DB_MAX_CONNECTIONS_PER_POD', 0)
+if worker_class == 'gevent':
+    if process_cap:
+        worker_connections = min(worker_connections, process_cap)
+    if pod_cap:
+        worker_connections = min(worker_connections, pod_cap)
+        workers = max(1, min(workers, pod_cap // worker_connections))
+else:
+    if process_cap:
+        threads = min(threads, process_cap)
+    if pod_cap:
+        threads = min(threads, pod_cap)
+        workers = max(1, min(workers, pod_cap // threads))
+
+# Recycle workers now and then, staggered so they do not all restart at once
+max_requests = env_int('GUNICORN_MAX_REQUESTS', 1000)
+max_requests_jitter = env_int('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10)
+
+bind = ['0.0.0.0:8000']
+if os.environ.get('METRICS_PORT'):
+    bind.append(f"0.0.0.0:{os.environ['METRICS_PORT']}")
+timeout = env_int('GUNICORN_TIMEOUT', 120)
+keepalive = env_int('GUNICORN_KEEPALIVE', 5)
+backlog = env_int('GUNICORN_BACKLOG', 2048)
+
+
+def merge_worker_metrics(directory, pid):
+    """
+    Folds the counter and histogram files of an exited worker into one
+    archive file per metric type, so workers recycled by max_requests do not
+    each leave their files behind in the metrics directory.
+    """
+    from prometheus_client.mmap_dict import MmapedDict
+
+    for kind in ('counter', 'histogram'):
+        dead = os.path.join(directory, f'{kind}_{pid}.db')
+        if not os.path.exists(dead):
+            continue
+        archive = os.path.join(directory, f'{kind}_archive.db')
+        totals = {}
+        for path in (archive, dead):
+            if os.path.exists(path):
+                for key, value, _, _ in MmapedDict.read_all_values_from_file(path):
+                    totals[key] = totals.get(key, 0.0) + value
+        # Written aside and renamed, so a scrape reads the old or the new archive
+        merged = MmapedDict(f'{archive}.tmp')
+        try:
+            for key, value in totals.items():
+                merged.write_value(key, value, 0.0)
+        finally:
+            merged.close()
+        os.replace(f'{archive}.tmp', archive)
+        os.remove(dead)
+
+
+def child_exit(server, worker):
+    """
+    Drops the in-flight gauge of a worker that exited, so /metrics does not
+    keep counting requests it was serving, and merges its other metrics into
+    the archive files.
+    """
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid, directory)
+        merge_worker_metrics(directory, worker.pid)
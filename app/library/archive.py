@@ -0,0 +1,51 @@
+"""
+This module contains the archival of old loans.
+
+Returned loans older than LOAN_RETENTION_DAYS are moved from the loans
+table to loan_archive, a chunk of loans per transaction, so the table that
+borrowing, returning and fine accrual work on holds current circulation
+and recent history only and stays small however much history builds up.
+Archived loans keep their ids and are still listed by the history pages
+of my_loans and manage_loans and by the ``loan_history`` export.
+
+Open loans are never archived, so the active loan counters do not change.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ArchivedLoan, Loan
+
+ARCHIVED_FIELDS = ['loan_id', 'member_id', 'book_id', 'loan_date', 'due_date', 'return_date', 'fine']
+
+
+def archivable_loans(today=None):
+    """
+    Returns the returned loans older than the retention period on ``today``.
+    """
+    today = today or timezone.localdate()
+    cutoff = today - timedelta(days=settings.LOAN_RETENTION_DAYS)
+    return Loan.objects.filter(return_date__isnull=False, return_date__lt=cutoff)
+
+
+def archive_loans(today=None, chunk_size=1000):
+    """
+    Moves the loans of archivable_loans to the archive. Returns the number
+    of loans moved.
+    """
+    pending = archivable_loans(today).order_by('loan_id').values_list('loan_id', flat=True)
+    archived = 0
+    while True:
+        ids = list(pending[:chunk_size])
+        if not ids:
+            return archived
+        with transaction.atomic():
+            rows = Loan.objects.filter(loan_id__in=ids, return_date__isnull=False).values(*ARCHIVED_FIELDS)
+            moved = ArchivedLoan.objects.bulk_create(ArchivedLoan(**row) for row in rows)
+            Loan.objects.filter(loan_id__in=[loan.loan_id for loan in moved]).delete()
+        archived += len(moved)
+        if len(ids) < chunk_size:
+            return archived
@@ -0,0 +1,556 @@
+"""
+This module contains the benchmark scenarios run by ``manage.py benchmark``.
+
+Scenarios run against a throwaway test database, created the same way the
+test runner creates one, so they never touch real data. Each scenario
+returns rows of measurements that the command prints as a table.
+"""
+
+import asyncio
+import itertools
+import time
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.template.loader import render_to_string
+from django.test import AsyncClient, Client, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from . import catalogue_cache, circulation, reservations, seeding
+from .models import Book, Loan, Member, Staff
+from .urls import urlpatterns
+
+SCENARIOS = {}
+# How the urls scenario requests each URL pattern, by URL name
+ROUTES = {}
+
+# Library the urls scenario runs against (see library.seeding)
+URLS_DATASET = {'books': 5000, 'members': 500, 'staff': 5, 'loans': 20000, 'reservations': 2000}
+
+
+def scenario(name):
+    """
+    Registers a benchmark scenario under ``name``.
+    """
+    def register(func):
+        SCENARIOS[name] = func
+        return func
+    return register
+
+
+def route(*names):
+    """
+    Registers how the urls scenario requests the URL patterns ``names``.
+
+    The function is called with a Bench and the URL name and returns a
+    ``prepare`` function for measure_requests.
+    """
+    def register(func):
+        for name in names:
+            ROUTES[name] = func
+        return func
+    return register
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Creates a test database for the duration of the block and destroys it after.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of ``values``.
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+def measure_requests(requests, prepare):
+    """
+    Sends ``requests`` requests and returns latency percentiles in
+    milliseconds and the mean number of queries per request.
+
+    ``prepare(i)`` does any setup request ``i`` needs, untimed, and returns
+    a function that sends it. Streamed responses are read to the end.
+    """
+    timings = []
+    queries = 0
+    for i in range(requests):
+        send = prepare(i)
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            response = send()
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            timings.append((time.perf_counter() - start) * 1000)
+        queries += len(context.captured_queries)
+    return {
+        'requests': requests,
+        'queries': queries / requests,
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+    }
+
+
+def measure(client, url, requests, data=None):
+    """
+    Sends ``requests`` GET requests to ``url`` (see measure_requests).
+    """
+    return measure_requests(requests, lambda i: lambda: client.get(url, data))
+
+
+def measure_async(client, url, requests, concurrency=1, data=None):
+    """
+    Like measure, but sends the requests through the ASGI handler with an
+    AsyncClient, ``concurrency`` requests at a time.
+    """
+    timings = []
+
+    async def send():
+        start = time.perf_counter()
+        await client.get(url, data)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    async def run():
+        for sent in range(0, requests, concurrency):
+            await asyncio.gather(*(send() for _ in range(min(concurrency, requests - sent))))
+
+    # async_to_sync runs the async ORM calls on this thread, so they are captured
+    with CaptureQueriesContext(connection) as context:
+        async_to_sync(run)()
+    return {
+        'requests': requests,
+        'queries': len(context.captured_queries) / requests,
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+    }
+
+
+def login(client, member=None, staff=None):
+    """
+    Logs a test client in as a member or staff member, the way login_view does.
+    """
+    session = client.session
+    session['is_authenticated'] = True
+    if member is not None:
+        session['member_id'] = member.member_id
+        session['user_name'] = f'{member.first_name} {member.last_name}'
+        session['is_staff'] = False
+        session['is_admin'] = False
+    else:
+        session['staff_id'] = staff.staff_id
+        session['user_name'] = f'{staff.first_name} {staff.last_name}[{staff.role}]'
+        session['is_staff'] = True
+        session['is_admin'] = staff.role == 'Administrator'
+    session.save()
+    # Cookie-based sessions change their key whenever they are saved
+    client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+
+@scenario('sessions')
+def sessions_scenario(requests):
+    """
+    Queries and latency of an authenticated page view for each SESSION_MODE.
+    """
+    member = Member.objects.create(
+        first_name='Bench', last_name='Member', email='bench-sessions@test.ca',
+        date_joined=date(2025, 1, 1), credential='not-a-real-hash'
+    )
+    for i in range(10):
+        book = Book.objects.create(title=f'Session Book {i}', author='Bench', isbn=f'{9790000000000 + i}')
+        Loan.objects.create(
+            member=member, book=book, loan_date=date(2025, 1, 1), due_date=date(2025, 1, 1) + timedelta(days=14)
+        )
+
+    rows = []
+    for mode, engine in settings.SESSION_ENGINES.items():
+        with override_settings(SESSION_ENGINE=engine):
+            cache.clear()
+            client = Client()
+            login(client, member=member)
+            url = reverse('my_loans')
+            client.get(url)  # warm the session cache
+            rows.append({'name': f'SESSION_MODE={mode}', **measure(client, url, requests)})
+    return rows
+
+
+@scenario('server_modes')
+def server_modes_scenario(requests):
+    """
+    Async read-only pages through the WSGI and the ASGI handler (SERVER_MODE).
+    """
+    # In-process, so this compares per-request handler cost. Compare how many
+    # slow clients a pod holds by load testing a deployment in each mode
+    member = Member.objects.create(
+        first_name='Bench', last_name='Member', email='bench-modes@test.ca',
+        date_joined=date(2025, 1, 1), credential='not-a-real-hash'
+    )
+    staff = Staff.objects.create(
+        first_name='Bench', last_name='Staff', role='Administrator', email='bench-modes@staff.ca',
+        credential='not-a-real-hash'
+    )
+    for i in range(50):
+        book = Book.objects.create(title=f'Mode Book {i}', author='Bench', isbn=f'{9791000000000 + i}', availability=2)
+        Loan.objects.create(
+            member=member, book=book, loan_date=date(2025, 1, 1), due_date=date(2025, 1, 1) + timedelta(days=14)
+        )
+
+    rows = []
+    for name, user in [('book_list', None), ('my_loans', {'member': member}), ('manage_loans', {'staff': staff})]:
+        url = reverse(name)
+        cache.clear()
+        client = Client()
+        async_client = AsyncClient()
+        if user:
+            login(client, **user)
+            login(async_client, **user)
+        rows.append({'name': f'{name} wsgi', **measure(client, url, requests)})
+        rows.append({'name': f'{name} asgi', **measure_async(async_client, url, requests)})
+        rows.append({'name': f'{name} asgi x10', **measure_async(async_client, url, requests, concurrency=10)})
+    return rows
+
+
+@scenario('catalogue')
+def catalogue_scenario(requests):
+    """
+    Size and uncached render time of a 1,000 book catalogue page for staff.
+    """
+    books = 1000
+    Book.objects.bulk_create(
+        Book(title=f'Catalogue Book {i}', author='Bench', isbn=f'{9792000000000 + i}', availability=1)
+        for i in range(books)
+    )
+    staff = Staff.objects.create(
+        first_name='Bench', last_name='Staff', role='Librarian', email='bench-catalogue@staff.ca',
+        credential='not-a-real-hash'
+    )
+    client = Client()
+    login(client, staff=staff)
+    url = reverse('book_list')
+    data = {'page_size': books}
+
+    def prepare(i):
+        # A new catalogue version, so the book cards are rendered every time
+        catalogue_cache.bump_catalogue_version()
+        return lambda: client.get(url, data)
+
+    rows = []
+    with override_settings(MAX_PAGE_SIZE=books):
+        size = len(client.get(url, data).content)
+        rows.append({'name': f'book_list ({size / 1024:.0f} KB)', **measure_requests(requests, prepare)})
+
+    manage_url = reverse('book_manage', args=[Book.objects.first().pk])
+    size = len(client.get(manage_url).content)
+    rows.append({'name': f'book_manage ({size / 1024:.1f} KB)', **measure(client, manage_url, requests)})
+
+    # What the page used to add: the edit and delete form of every book inline
+    request = RequestFactory().get(url)
+    page = list(Book.objects.order_by('book_id'))
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        size = sum(len(render_to_string('library/book_manage_form.html', {'book': book}, request)) for book in page)
+        timings.append((time.perf_counter() - start) * 1000)
+    rows.append({
+        'name': f'inline forms, before ({size / 1024:.0f} KB)',
+        'requests': requests,
+        'queries': 0,
+        'p50_ms': percentile(timings, 50),
+        'p95_ms': percentile(timings, 95),
+        'p99_ms': percentile(timings, 99),
+    })
+    return rows
+
+
+@scenario('connections')
+def connections_scenario(requests):
+    """
+    Connect overhead per request with DB_CONN_MAX_AGE=0 and with persistent connections.
+    """
+    member = Member.objects.create(
+        first_name='Bench', last_name='Member', email='bench-connections@test.ca',
+        date_joined=date(2025, 1, 1), credential='not-a-real-hash'
+    )
+    client = Client()
+    login(client, member=member)
+    url = reverse('my_loans')
+    connects = []
+
+    def count_connect(sender, **kwargs):
+        connects.append(1)
+
+    def close_after_request(sender, **kwargs):
+        # What the request handler does in production; the test client skips it
+        close_old_connections()
+
+    rows = []
+    conn_max_age = connection.settings_dict['CONN_MAX_AGE']
+    connection_created.connect(count_connect)
+    request_finished.connect(close_after_request)
+    try:
+        for age in [0, 60]:
+            connection.settings_dict['CONN_MAX_AGE'] = age
+            connection.close()
+            client.get(url)
+            connects.clear()
+            row = measure(client, url, requests)
+            rows.append({'name': f'CONN_MAX_AGE={age} ({len(connects) / requests:.2f} connects/req)', **row})
+    finally:
+        connection_created.disconnect(count_connect)
+        request_finished.disconnect(close_after_request)
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    return rows
+
+
+class Bench:
+    """
+    Users and books of the seeded library the urls scenario runs against.
+    """
+
+    def __init__(self):
+        self.member = Member.objects.order_by('-active_loans', 'member_id').first()
+        self.staff = Staff.objects.filter(role='Librarian').first()
+        self.admin = Staff.objects.filter(role='Administrator').first()
+        self.book_ids = list(Book.objects.order_by('book_id').values_list('book_id', flat=True))
+        # Books with a copy on the shelf, handed out one per borrow
+        self.available = itertools.cycle(
+            Book.objects.filter(availability__gt=0).order_by('book_id').values_list('book_id', flat=True)
+        )
+
+    def client(self, user=None):
+        """
+        Returns a client logged in as 'member', 'staff' or 'admin', or an anonymous one.
+        """
+        client = Client()
+        if user == 'member':
+            login(client, member=self.member)
+        elif user:
+            login(client, staff=self.admin if user == 'admin' else self.staff)
+        return client
+
+    def available_book(self):
+        return Book.objects.get(pk=next(self.available))
+
+
+@route('home', 'book_list', 'metrics')
+def anonymous_page(bench, name):
+    client = bench.client()
+    url = reverse(name)
+    return lambda i: lambda: client.get(url)
+
+
+@route('my_loans', 'my_reservations')
+def member_page(bench, name):
+    client = bench.client('member')
+    url = reverse(name)
+    return lambda i: lambda: client.get(url)
+
+
+@route('manage_loans', 'manage_reservations', 'manage_members')
+def staff_page(bench, name):
+    client = bench.client('staff')
+    url = reverse(name)
+    return lambda i: lambda: client.get(url)
+
+
+@route('manage_staff', 'sql_profiles')
+def admin_page(bench, name):
+    client = bench.client('admin')
+    url = reverse(name)
+    return lambda i: lambda: client.get(url)
+
+
+@route('register')
+def register_route(bench, name):
+    client = bench.client()
+    url = reverse(name)
+    return lambda i: lambda: client.post(url, {
+        'first_name': 'Bench', 'last_name': 'Member', 'email': f'bench-register-{i}@example.com',
+        'password': seeding.SEED_PASSWORD, 'address': '', 'contact': '',
+    })
+
+
+@route('login')
+def login_route(bench, name):
+    client = bench.client()
+    url = reverse(name)
+    emails = list(Member.objects.order_by('member_id').values_list('email', flat=True)[:1000])
+    return lambda i: lambda: client.post(url, {'email': emails[i % len(emails)], 'password': seeding.SEED_PASSWORD})
+
+
+@route('logout')
+def logout_route(bench, name):
+    client = Client()
+    url = reverse(name)
+
+    def prepare(i):
+        login(client, member=bench.member)
+        return lambda: client.get(url)
+    return prepare
+
+
+@route('add_book')
+def add_book_route(bench, name):
+    client = bench.client('staff')
+    url = reverse(name)
+    return lambda i: lambda: client.post(url, {
+        'newTitle': 'Bench Book', 'newAuthor': 'Bench Author', 'newPublisher': '', 'newYear': '2024',
+        'newISBN': f'978{9000000000 + i}', 'newGenre': 'Fiction', 'newAvailable': '1',
+    })
+
+
+@route('book_manage')
+def book_manage_route(bench, name):
+    client = bench.client('staff')
+
+    def prepare(i):
+        url = reverse(name, args=[bench.book_ids[i % len(bench.book_ids)]])
+        return lambda: client.get(url)
+    return prepare
+
+
+@route('edit_book')
+def edit_book_route(bench, name):
+    client = bench.client('staff')
+
+    def prepare(i):
+        book = Book.objects.get(pk=bench.book_ids[i % len(bench.book_ids)])
+        return lambda: client.post(reverse(name, args=[book.pk]), {
+            'editTitle': book.title, 'editAuthor': book.author, 'editPublisher': book.publisher or '',
+            'editYear': book.year or '', 'editISBN': book.isbn, 'editGenre': book.genre or '',
+            'editAvailable': book.availability,
+        })
+    return prepare
+
+
+@route('delete_book')
+def delete_book_route(bench, name):
+    client = bench.client('staff')
+
+    def prepare(i):
+        book = Book.objects.create(title='Bench Book', author='Bench', isbn=f'977{9000000000 + i}')
+        return lambda: client.get(reverse(name, args=[book.pk]))
+    return prepare
+
+
+@route('borrow_book')
+def borrow_book_route(bench, name):
+    client = bench.client('member')
+
+    def prepare(i):
+        url = reverse(name, args=[next(bench.available)])
+        return lambda: client.get(url)
+    return prepare
+
+
+@route('reserve_book')
+def reserve_book_route(bench, name):
+    client = bench.client('member')
+
+    def prepare(i):
+        # A different book each time; a second reservation of one book is refused
+        url = reverse(name, args=[bench.book_ids[-1 - i % len(bench.book_ids)]])
+        return lambda: client.get(url)
+    return prepare
+
+
+@route('return_book')
+def return_book_route(bench, name):
+    client = bench.client('member')
+
+    def prepare(i):
+        loan = circulation.borrow(bench.member, bench.available_book())
+        return lambda: client.get(reverse(name, args=[loan.pk]))
+    return prepare
+
+
+@route('fulfill_reservation', 'cancel_reservation', 'manage_cancel_reservation')
+def reservation_route(bench, name):
+    client = bench.client('staff' if name == 'manage_cancel_reservation' else 'member')
+
+    def prepare(i):
+        reservation = reservations.reserve(bench.member, bench.available_book())
+        return lambda: client.get(reverse(name, args=[reservation.pk]))
+    return prepare
+
+
+@route('manage_members_remove')
+def remove_member_route(bench, name):
+    client = bench.client('staff')
+
+    def prepare(i):
+        member = Member.objects.create(
+            first_name='Bench', last_name='Member', email=f'bench-remove-{i}@example.com',
+            date_joined=date(2025, 1, 1), credential='not-a-real-hash'
+        )
+        return lambda: client.get(reverse(name, args=[member.pk]))
+    return prepare
+
+
+@route('export_data')
+def export_route(bench, name):
+    client = bench.client('staff')
+    url = reverse(name, args=['loans', 'jsonl'])
+    since = (date.today() - timedelta(days=30)).isoformat()
+    return lambda i: lambda: client.get(url, {'from': since})
+
+
+@route('register_staff')
+def register_staff_route(bench, name):
+    client = bench.client('admin')
+    url = reverse(name)
+    return lambda i: lambda: client.post(url, {
+        'staffFirstName': 'Bench', 'staffLastName': 'Staff', 'staffPassword': seeding.SEED_PASSWORD,
+        'staffRole': 'Librarian', 'staffContact': '5550000000', 'staffEmail': f'bench-staff-{i}@example.com',
+    })
+
+
+@route('resign_staff')
+def resign_staff_route(bench, name):
+    client = bench.client('admin')
+
+    def prepare(i):
+        staff = Staff.objects.create(
+            first_name='Bench', last_name='Staff', role='Librarian', email=f'bench-resign-{i}@example.com',
+            credential='not-a-real-hash'
+        )
+        return lambda: client.get(reverse(name, args=[staff.pk]))
+    return prepare
+
+
+@scenario('urls')
+def urls_scenario(requests):
+    """
+    Every URL pattern in library/urls.py against a seeded library.
+    """
+    seeding.seed(**URLS_DATASET, admin_password=seeding.SEED_PASSWORD)
+    bench = Bench()
+    rows = []
+    # Logins are measured, not throttled
+    with override_settings(LOGIN_THROTTLE_ENABLED=False):
+        for pattern in urlpatterns:
+            prepare = ROUTES[pattern.name](bench, pattern.name)
+            rows.append({'name': pattern.name, **measure_requests(requests, prepare)})
+    return rows
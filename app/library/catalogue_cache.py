@@ -0,0 +1,130 @@
+"""
+This module contains the versioned cache for rendered catalogue pages.
+
+Cached pages are keyed by a catalogue version number. Every write that can
+change what the catalogue shows (adding, editing or deleting a book, or a
+borrow/return changing availability) bumps the version, so the old entries
+are simply never read again and expire on their own.
+
+The version lives in the cache, so only a cache shared by every worker and
+pod (settings.SHARED_CACHE) sees every bump. With a per-process cache the
+other workers would keep serving old pages, so pages are neither cached
+nor revalidated there.
+"""
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+VERSION_KEY = 'catalogue:version'
+# When the version last changed, for Last-Modified
+MODIFIED_KEY = 'catalogue:modified'
+# Query parameters that change the rendered catalogue body
+PAGE_PARAMS = ('q', 'cursor', 'page_size')
+
+
+def get_catalogue_version():
+    """
+    Returns the current catalogue version.
+    """
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock rather than 1 so a version lost from the cache
+        # cannot come back and match pages cached before it was lost
+        cache.add(VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalogue_version():
+    """
+    Moves the catalogue to a new version, invalidating all cached pages.
+    """
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), timeout=None)
+    cache.set(MODIFIED_KEY, time.time(), timeout=None)
+
+
+def invalidate_catalogue():
+    """
+    Invalidates cached catalogue pages after a write.
+
+    The version is bumped straight away and again when the surrounding
+    transaction commits, so a page rendered from the old data while the
+    transaction was still open is not kept either.
+    """
+    bump_catalogue_version()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump_catalogue_version)
+
+
+def enabled():
+    """
+    Whether catalogue pages are cached and revalidated.
+    """
+    return settings.SHARED_CACHE
+
+
+def _query_digest(params):
+    # JSON keeps every value apart, whatever characters it contains
+    query = json.dumps([[name, params.get(name, '')] for name in PAGE_PARAMS])
+    return hashlib.sha1(query.encode()).hexdigest()
+
+
+def page_key(params, role):
+    """
+    Returns the cache key of a catalogue page for the given query parameters
+    and viewer role (anonymous, member or staff).
+    """
+    return f'catalogue:{get_catalogue_version()}:{role}:{_query_digest(params)}'
+
+
+def get_page(key):
+    return cache.get(key) if enabled() else None
+
+
+def set_page(key, page):
+    if enabled():
+        cache.set(key, page, settings.CATALOGUE_CACHE_TIMEOUT)
+
+
+async def aget_catalogue_version():
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, time.time_ns(), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+async def apage_key(params, role):
+    return f'catalogue:{await aget_catalogue_version()}:{role}:{_query_digest(params)}'
+
+
+async def aget_validators(params, role, viewer):
+    """
+    Returns the ETag and Last-Modified timestamp of a catalogue page for the
+    given query parameters, viewer role and viewer id. Both change whenever
+    the catalogue version does, so they are known without rendering.
+    """
+    version = await aget_catalogue_version()
+    modified = await cache.aget(MODIFIED_KEY)
+    if modified is None:
+        await cache.aadd(MODIFIED_KEY, time.time(), timeout=None)
+        modified = await cache.aget(MODIFIED_KEY)
+    digest = hashlib.sha1(f'{version}:{role}:{viewer}:{_query_digest(params)}'.encode()).hexdigest()
+    return f'"{digest}"', int(modified)
+
+
+async def aget_page(key):
+    return await cache.aget(key) if enabled() else None
+
+
+async def aset_page(key, page):
+    if enabled():
+        await cache.aset(key, page, settings.CATALOGUE_CACHE_TIMEOUT)
@@ -0,0 +1,148 @@
+"""
+This module contains the inventory operations for borrowing and returning books.
+
+Availability is changed with conditional UPDATE statements inside a
+transaction together with the matching loan row, so concurrent requests
+across workers and pods cannot oversell copies or return a loan twice.
+"""
+
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import counters, metrics
+from .catalogue_cache import invalidate_catalogue
+from .fines import fine_for
+from .models import Book, Loan, Reservation
+from .reservations import release_copy
+
+LOAN_PERIOD = timedelta(days=14)  # 2 weeks loan period
+
+
+class CirculationError(Exception):
+    """
+    Base class for borrow and return failures that should be shown to the user.
+    """
+
+
+class BookUnavailable(CirculationError):
+    """
+    Raised when no copy of the book is left to borrow.
+    """
+
+
+class AlreadyReturned(CirculationError):
+    """
+    Raised when a loan has already been returned.
+    """
+
+
+class HoldUnavailable(CirculationError):
+    """
+    Raised when a reservation no longer has a copy held for the member.
+    """
+
+
+def borrow(member, book):
+    """
+    Takes one copy of ``book`` and creates a loan for ``member``.
+
+    The availability check and decrement are a single
+    ``UPDATE ... WHERE availability > 0`` so two concurrent borrows of the
+    last copy cannot both succeed. Raises BookUnavailable when no copy is left.
+    """
+    loan_date = timezone.localdate()
+    with transaction.atomic():
+        taken = Book.objects.filter(pk=book.pk, availability__gt=0).update(availability=F('availability') - 1)
+        if not taken:
+            raise BookUnavailable(book)
+        invalidate_catalogue()
+        counters.adjust(book.pk, member.pk, active_loans=1)
+        metrics.count_event('borrow')
+        return Loan.objects.create(
+            member=member,
+            book=book,
+            loan_date=loan_date,
+            due_date=loan_date + LOAN_PERIOD
+        )
+
+
+def fulfill(member, reservation):
+    """
+    Takes a copy from the shelf for a pending reservation and confirms it.
+
+    The reservation is only confirmed if a copy was actually taken. Raises
+    BookUnavailable when no copy is left and HoldUnavailable when the
+    reservation stopped being pending in the meantime.
+    """
+    with transaction.atomic():
+        loan = borrow(member, reservation.book)
+        confirmed = Reservation.objects.filter(pk=reservation.pk, status='pending').update(status='confirmed')
+        if not confirmed:
+            raise HoldUnavailable(reservation)
+        counters.adjust(reservation.book_id, reservation.member_id, pending_reservations=-1)
+    reservation.status = 'confirmed'
+    return loan
+
+
+def collect_hold(member, reservation):
+    """
+    Lends ``member`` the copy held for their ready reservation.
+
+    The held copy was never put back into availability, so only the
+    reservation changes. Raises HoldUnavailable when the hold has expired,
+    was cancelled or belongs to someone else.
+    """
+    loan_date = timezone.localdate()
+    with transaction.atomic():
+        collected = Reservation.objects.filter(pk=reservation.pk, member=member, status='ready').update(
+            status='confirmed'
+        )
+        if not collected:
+            raise HoldUnavailable(reservation)
+        counters.adjust(reservation.book_id, member.pk, active_loans=1, pending_reservations=-1)
+        metrics.count_event('borrow')
+        reservation.status = 'confirmed'
+        return Loan.objects.create(
+            member=member,
+            book_id=reservation.book_id,
+            loan_date=loan_date,
+            due_date=loan_date + LOAN_PERIOD
+        )
+
+
+def calculate_fine(loan, return_date):
+    """
+    Returns the fine for returning ``loan`` on ``return_date``, under the
+    same policy the nightly accrual job applies to open loans.
+    """
+    return fine_for(loan.due_date, return_date)
+
+
+def return_loan(loan):
+    """
+    Marks ``loan`` as returned and finalizes its fine. The copy is held for
+    the next member in the book's reservation queue, in the same
+    transaction, or put back on the shelf when nobody is waiting.
+
+    The loan is only updated while its return date is still empty, so a
+    double-submitted return cannot put two copies back. Raises
+    AlreadyReturned when another request returned it first.
+    """
+    return_date = timezone.localdate()
+    fine = calculate_fine(loan, return_date)
+    with transaction.atomic():
+        returned = Loan.objects.filter(pk=loan.pk, return_date__isnull=True).update(
+            return_date=return_date,
+            fine=fine
+        )
+        if not returned:
+            raise AlreadyReturned(loan)
+        counters.adjust(loan.book_id, loan.member_id, active_loans=-1)
+        metrics.count_event('return')
+        release_copy(loan.book_id, return_date)
+    loan.return_date = return_date
+    loan.fine = fine
+    return loan
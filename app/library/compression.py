@@ -0,0 +1,175 @@
+"""
+This module contains the gzip and brotli compression of dynamic responses.
+
+Static files are compressed ahead of time (see STORAGES in settings); this
+covers the HTML pages, exports and other responses the views produce.
+Streamed responses are compressed as they are produced and flushed every
+STREAM_FLUSH_BYTES of input, so a streamed export keeps streaming without
+giving up the compression ratio to a flush per line.
+
+Pages that contain a CSRF token are sent uncompressed. A compressed page
+that reflects attacker-controlled input next to a secret leaks the secret
+through the compressed size (BREACH), and the CSRF token is the secret on
+these pages.
+"""
+
+import re
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = (
+    'text/', 'application/json', 'application/javascript', 'application/x-ndjson', 'application/xml',
+    'image/svg+xml',
+)
+GZIP_LEVEL = 6
+# Quality 4 compresses better than gzip at a similar speed; the top
+# qualities are for static files compressed once
+BROTLI_QUALITY = 4
+STREAM_FLUSH_BYTES = 32 * 1024
+CSRF_FIELD = b'name="csrfmiddlewaretoken"'
+
+
+def accepted_encodings(accept_encoding):
+    """
+    Returns the codings an Accept-Encoding header allows (q > 0).
+    """
+    encodings = set()
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        refused = re.search(r'q=0(\.0*)?\s*$', params.strip())
+        if coding.strip() and not refused:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def choose_encoding(request):
+    """
+    Returns 'br', 'gzip' or None for the request's Accept-Encoding header.
+    """
+    encodings = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+
+def is_compressible(request, response):
+    """
+    Whether a response may be compressed, whatever the client accepts.
+    """
+    if response.status_code != 200 or response.has_header('Content-Encoding'):
+        return False
+    if not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES):
+        return False
+    if response.streaming:
+        return True
+    # The {% csrf_token %} field; CsrfViewMiddleware has cleared its own
+    # "token used" flag by the time the response gets here
+    if CSRF_FIELD in response.content:
+        return False
+    return len(response.content) >= settings.COMPRESSION_MIN_SIZE
+
+
+class _Gzip:
+    def __init__(self):
+        # wbits 31: zlib stream with a gzip header
+        self.compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class _Brotli:
+    def __init__(self):
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+COMPRESSORS = {'gzip': _Gzip, 'br': _Brotli}
+
+
+class _StreamCompressor:
+    def __init__(self, compressor):
+        self.compressor = compressor
+        self.pending = 0
+
+    def chunk(self, data):
+        output = self.compressor.compress(data)
+        self.pending += len(data)
+        if self.pending >= STREAM_FLUSH_BYTES:
+            output += self.compressor.flush()
+            self.pending = 0
+        return output
+
+
+def _compress_stream(chunks, compressor):
+    stream = _StreamCompressor(compressor)
+    for data in chunks:
+        if output := stream.chunk(data):
+            yield output
+    yield compressor.finish()
+
+
+async def _acompress_stream(chunks, compressor):
+    stream = _StreamCompressor(compressor)
+    async for data in chunks:
+        if output := stream.chunk(data):
+            yield output
+    yield compressor.finish()
+
+
+def compress_response(request, response):
+    """
+    Compresses a response in place if it is compressible and the client
+    accepts gzip or brotli. Returns the response.
+    """
+    if not is_compressible(request, response):
+        return response
+    # The response depends on Accept-Encoding even when it is not compressed
+    patch_vary_headers(response, ('Accept-Encoding',))
+    encoding = choose_encoding(request)
+    if encoding is None:
+        return response
+
+    compressor = COMPRESSORS[encoding]()
+    if response.streaming:
+        if response.is_async:
+            response.streaming_content = _acompress_stream(response.streaming_content, compressor)
+        else:
+            response.streaming_content = _compress_stream(response.streaming_content, compressor)
+        response.headers.pop('Content-Length', None)
+    else:
+        compressed = compressor.compress(response.content) + compressor.finish()
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response.headers['Content-Length'] = str(len(compressed))
+
+    # The compressed body is a different representation, so a strong ETag
+    # would be wrong (the same rule as Django's GZipMiddleware)
+    if response.has_header('ETag'):
+        response.headers['ETag'] = re.sub(r'^"', 'W/"', response.headers['ETag'])
+    response.headers['Content-Encoding'] = encoding
+    return response
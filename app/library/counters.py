@@ -0,0 +1,123 @@
+"""
+This module maintains the denormalized loan and reservation counters.
+
+``Book`` and ``Member`` carry ``active_loans`` (unreturned loans) and
+``pending_reservations`` (reservations still pending or ready for pickup),
+so "does this book have open loans" or "how many members wait for it" is a
+column read instead of a COUNT or EXISTS subquery. Every loan or
+reservation state change adjusts them with ``F()`` expressions in the same
+transaction. ``reconcile`` recomputes them from the loan and reservation
+tables and reports any drift.
+"""
+
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .catalogue_cache import invalidate_catalogue
+from .models import Book, Loan, Member, Reservation
+
+OPEN_RESERVATION_STATUSES = ('pending', 'ready')
+COUNTERS = ('active_loans', 'pending_reservations')
+
+
+def adjust(book_id, member_id, active_loans=0, pending_reservations=0):
+    """
+    Adds the given deltas to the counters of a book and a member.
+
+    Call inside the transaction that changes the loan or reservation. The
+    book row is updated before the member row, the same order as borrowing
+    locks them, so concurrent adjustments cannot deadlock.
+    """
+    changes = {}
+    if active_loans:
+        changes['active_loans'] = F('active_loans') + active_loans
+    if pending_reservations:
+        changes['pending_reservations'] = F('pending_reservations') + pending_reservations
+    if not changes:
+        return
+    Book.objects.filter(pk=book_id).update(**changes)
+    Member.objects.filter(pk=member_id).update(**changes)
+    if pending_reservations:
+        # The catalogue shows how many members wait for each book
+        invalidate_catalogue()
+
+
+def drop_open_reservations(book):
+    """
+    Takes the open reservations of a book that is about to be deleted off
+    the counters of the members who made them. Call inside the transaction
+    that deletes the book, whose delete removes the reservations.
+    """
+    waiting = (
+        Reservation.objects.filter(book=book, status__in=OPEN_RESERVATION_STATUSES)
+        .order_by()
+        .values('member')
+        .annotate(count=Count('*'))
+    )
+    for row in waiting:
+        adjust(book.pk, row['member'], pending_reservations=-row['count'])
+
+
+def _count(model, owner, condition):
+    """
+    Returns a correlated subquery counting ``model`` rows of the outer
+    book or member that match ``condition``.
+    """
+    rows = (
+        model.objects.filter(condition, **{owner: OuterRef('pk')})
+        .order_by()
+        .values(owner)
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def actual_counts(owner):
+    """
+    Returns the expressions computing the true counters of a book
+    (``owner='book'``) or member (``owner='member'``).
+    """
+    return {
+        'active_loans': _count(Loan, owner, Q(return_date__isnull=True)),
+        'pending_reservations': _count(Reservation, owner, Q(status__in=OPEN_RESERVATION_STATUSES)),
+    }
+
+
+def _fix_in_chunks(model, drifted, counter, actual, chunk_size):
+    """
+    Recomputes ``counter`` on the ``drifted`` rows, a chunk of primary keys
+    per UPDATE in its own transaction. The keys are read first: MySQL
+    refuses an UPDATE whose subquery selects from the table being updated.
+    """
+    pending = drifted.order_by('pk').values_list('pk', flat=True)
+    last_pk = None
+    while True:
+        chunk = pending if last_pk is None else pending.filter(pk__gt=last_pk)
+        pks = list(chunk[:chunk_size])
+        if not pks:
+            return
+        with transaction.atomic():
+            model.objects.filter(pk__in=pks).update(**{counter: actual})
+        if len(pks) < chunk_size:
+            return
+        last_pk = pks[-1]
+
+
+def reconcile(fix=True, chunk_size=1000):
+    """
+    Recomputes the counters of every book and member with set-based
+    queries. Returns ``{model name: {counter: rows that drifted}}``; with
+    ``fix`` the drifted rows are corrected in chunks of ``chunk_size``.
+    """
+    report = {}
+    for model, owner in ((Book, 'book'), (Member, 'member')):
+        counts = actual_counts(owner)
+        report[model.__name__] = {}
+        for counter, actual in counts.items():
+            drifted = model.objects.annotate(actual=actual).exclude(**{counter: F('actual')})
+            report[model.__name__][counter] = drifted.count()
+            if fix and report[model.__name__][counter]:
+                _fix_in_chunks(model, drifted, counter, actual, chunk_size)
+    return report
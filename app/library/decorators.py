@@ -4,6 +4,7 @@ This module contains custom decorators for the library management system.
 
 from functools import wraps
 
+from asgiref.sync import iscoroutinefunction
 from django.contrib import messages
 from django.shortcuts import redirect
 
@@ -13,7 +14,18 @@ def login_required_custom(view_func):
     Custom decorator to ensure a user is authenticated before accessing a view.
     This decorator checks if the user is authenticated using the session variable
     and redirects to the login page if not authenticated.
+    Works on both sync and async views.
     """
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            # aget loads the session without blocking the event loop
+            if not await request.session.aget('is_authenticated', False):
+                messages.error(request, 'You need to log in to access this page.')
+                return redirect('login')
+            return await view_func(request, *args, **kwargs)
+        return _wrapped_async_view
+
     @wraps(view_func)
     def _wrapped_view(request, *args, **kwargs):
         """
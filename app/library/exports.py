@@ -0,0 +1,154 @@
+"""
+This module contains the streaming CSV and JSON Lines exports of loans,
+archived loans (``loan_history``), reservations and members.
+
+Rows are read in primary key order, one chunk at a time, as plain tuples
+(no model instances) and written out as they are read, so an export of
+millions of rows runs in constant memory. Chunks are fetched by keyset
+(``pk > last_pk``) rather than with a single ``.iterator()`` because
+mysqlclient buffers a whole result set on the client.
+
+Under ASGI a response streamed from a sync generator is read to the end
+before anything is sent, so the view streams through aiterate instead.
+"""
+
+import csv
+import json
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import ArchivedLoan, Loan, Member, Reservation
+
+CHUNK_SIZE = 2000
+
+EXPORTS = {
+    'loans': {
+        'model': Loan,
+        'date_field': 'loan_date',
+        'columns': [
+            'loan_id', 'member_id', 'member__first_name', 'member__last_name', 'member__email',
+            'book_id', 'book__title', 'book__isbn', 'loan_date', 'due_date', 'return_date', 'fine',
+        ],
+    },
+    'loan_history': {
+        'model': ArchivedLoan,
+        'date_field': 'loan_date',
+        'columns': [
+            'loan_id', 'member_id', 'member__first_name', 'member__last_name', 'member__email',
+            'book_id', 'book__title', 'book__isbn', 'loan_date', 'due_date', 'return_date', 'fine',
+        ],
+    },
+    'reservations': {
+        'model': Reservation,
+        'date_field': 'reservation_date',
+        'columns': [
+            'reservation_id', 'member_id', 'member__first_name', 'member__last_name', 'member__email',
+            'book_id', 'book__title', 'book__isbn', 'reservation_date', 'status',
+        ],
+    },
+    'members': {
+        'model': Member,
+        'date_field': 'date_joined',
+        'columns': [
+            'member_id', 'first_name', 'last_name', 'email', 'contact', 'address', 'date_joined',
+        ],
+    },
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def header(dataset):
+    """
+    Returns the column names of an export, e.g. ``member_first_name``.
+    """
+    return [column.replace('__', '_') for column in EXPORTS[dataset]['columns']]
+
+
+def export_rows(dataset, date_from=None, date_to=None, chunk_size=CHUNK_SIZE, using=None):
+    """
+    Yields the rows of an export as tuples, optionally limited to an
+    inclusive date range on the export's date column. ``using`` picks the
+    database to read from.
+    """
+    export = EXPORTS[dataset]
+    model = export['model']
+    pk_name = model._meta.pk.name
+    queryset = model.objects.using(using)
+    if date_from:
+        queryset = queryset.filter(**{f'{export["date_field"]}__gte': date_from})
+    if date_to:
+        queryset = queryset.filter(**{f'{export["date_field"]}__lte': date_to})
+    queryset = queryset.order_by(pk_name).values_list(*export['columns'])
+
+    last_pk = None
+    while True:
+        chunk = queryset if last_pk is None else queryset.filter(**{f'{pk_name}__gt': last_pk})
+        rows = list(chunk[:chunk_size])
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_pk = rows[-1][0]
+
+
+class _Echo:
+    """
+    A file-like object whose write() returns what it was given, so csv.writer
+    can produce lines for a generator.
+    """
+
+    def write(self, value):
+        return value
+
+
+# Spreadsheets run a cell starting with one of these as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def spreadsheet_safe(value):
+    """
+    Prefixes text that a spreadsheet would run as a formula with ``'``, so
+    names entered at registration are shown as text.
+    """
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(dataset, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(header(dataset))
+    for row in rows:
+        yield writer.writerow([spreadsheet_safe(value) for value in row])
+
+
+def stream_jsonl(dataset, rows):
+    columns = header(dataset)
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def stream_export(dataset, file_format, date_from=None, date_to=None, using=None):
+    """
+    Returns a generator of text lines for an export in ``csv`` or ``jsonl``.
+    """
+    rows = export_rows(dataset, date_from, date_to, using=using)
+    if file_format == 'csv':
+        return stream_csv(dataset, rows)
+    return stream_jsonl(dataset, rows)
+
+
+async def aiterate(lines, batch_size=CHUNK_SIZE):
+    """
+    Returns an async iterator over the text ``lines`` of stream_export for
+    ASGI responses. The lines are read ``batch_size`` at a time in a thread
+    and each batch is sent as one piece.
+    """
+    take = sync_to_async(lambda: ''.join(islice(lines, batch_size)))
+    while text := await take():
+        yield text
@@ -0,0 +1,80 @@
+"""
+This module contains the overdue fine policy and the batch accrual job.
+
+The fine of an open loan only depends on its due date, so accrual groups
+open overdue loans by due date and sets each group's fine with UPDATE
+statements, a chunk of rows at a time, instead of computing fines row by
+row. Rows that already hold the right fine are skipped, so running the job
+again on the same day changes nothing.
+"""
+
+import math
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Loan
+
+
+def fine_for(due_date, on_date):
+    """
+    Returns the fine owed on ``on_date`` for a loan due on ``due_date``:
+    FINE_DAILY_RATE per day overdue after FINE_GRACE_DAYS, capped at
+    FINE_MAX_AMOUNT when that is set.
+    """
+    days = (on_date - due_date).days - settings.FINE_GRACE_DAYS
+    if days <= 0:
+        return Decimal('0.00')
+    fine = Decimal(days) * settings.FINE_DAILY_RATE
+    if settings.FINE_MAX_AMOUNT:
+        fine = min(fine, settings.FINE_MAX_AMOUNT)
+    return fine.quantize(Decimal('0.01'))
+
+
+def _update_in_chunks(loans, fine, chunk_size):
+    """
+    Sets ``fine`` on ``loans`` in chunks of primary keys, each chunk in its
+    own short transaction. Returns the number of loans updated.
+    """
+    pending = loans.exclude(fine=fine).order_by('loan_id').values_list('loan_id', flat=True)
+    updated = 0
+    while True:
+        ids = list(pending[:chunk_size])
+        if not ids:
+            return updated
+        with transaction.atomic():
+            updated += Loan.objects.filter(loan_id__in=ids, return_date__isnull=True).update(fine=fine)
+        if len(ids) < chunk_size:
+            return updated
+
+
+def accrue_fines(today=None, chunk_size=1000):
+    """
+    Brings the fine of every open overdue loan up to date for ``today``.
+    Returns the number of loans whose fine changed.
+    """
+    today = today or timezone.localdate()
+    # Loans due on or after this date have not run past their grace period
+    last_fined_due_date = today - timedelta(days=settings.FINE_GRACE_DAYS + 1)
+    open_loans = Loan.objects.filter(return_date__isnull=True, due_date__lte=last_fined_due_date)
+    if not settings.FINE_DAILY_RATE:
+        # No loan owes anything, and there is no cap to work out
+        return _update_in_chunks(open_loans, Decimal('0.00'), chunk_size)
+    updated = 0
+
+    if settings.FINE_MAX_AMOUNT:
+        # Every loan due on or before this date has reached the cap
+        days_to_cap = math.ceil(settings.FINE_MAX_AMOUNT / settings.FINE_DAILY_RATE)
+        capped_due_date = last_fined_due_date - timedelta(days=days_to_cap - 1)
+        updated += _update_in_chunks(
+            open_loans.filter(due_date__lte=capped_due_date), fine_for(capped_due_date, today), chunk_size
+        )
+        open_loans = open_loans.filter(due_date__gt=capped_due_date)
+
+    due_dates = open_loans.order_by('due_date').values_list('due_date', flat=True).distinct()
+    for due_date in due_dates:
+        updated += _update_in_chunks(open_loans.filter(due_date=due_date), fine_for(due_date, today), chunk_size)
+    return updated
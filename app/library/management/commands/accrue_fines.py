@@ -0,0 +1,33 @@
+"""
+Brings the fines of all open overdue loans up to date.
+
+Meant to run nightly (see the accrueFines CronJob in the Helm chart), but
+safe to run at any time: a second run on the same day changes nothing.
+"""
+
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.fines import accrue_fines
+
+
+class Command(BaseCommand):
+    help = 'Updates the fines of open overdue loans in set-based batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Accrue fines as of this date, YYYY-MM-DD (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Loans per UPDATE')
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError('--date must be YYYY-MM-DD')
+
+        started = time.perf_counter()
+        updated = accrue_fines(today, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated the fines of {updated} loans in {time.perf_counter() - started:.1f}s'
+        ))
@@ -0,0 +1,39 @@
+"""
+Moves returned loans older than LOAN_RETENTION_DAYS to the loan archive.
+
+Meant to run nightly (see the archiveLoans CronJob in the Helm chart), but
+safe to run at any time: each chunk is moved in its own transaction, so an
+interrupted run leaves nothing half-archived and the next run carries on.
+"""
+
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.archive import archivable_loans, archive_loans
+
+
+class Command(BaseCommand):
+    help = 'Moves returned loans past the retention period to the loan archive in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Apply the retention period as of this date, YYYY-MM-DD (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Loans per transaction')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the loans that would be archived')
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError('--date must be YYYY-MM-DD')
+
+        if options['dry_run']:
+            self.stdout.write(f'{archivable_loans(today).count()} loans would be archived')
+            return
+
+        started = time.perf_counter()
+        archived = archive_loans(today, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} loans in {time.perf_counter() - started:.1f}s'
+        ))
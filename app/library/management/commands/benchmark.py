@@ -0,0 +1,31 @@
+"""
+Runs benchmark scenarios from library.benchmarks against a throwaway database.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.benchmarks import SCENARIOS, benchmark_database
+
+
+class Command(BaseCommand):
+    help = 'Runs benchmark scenarios against a test database and prints latency and queries per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenarios', nargs='*', help=f'Scenarios to run (default: all). Choices: {", ".join(SCENARIOS)}')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per measurement')
+
+    def handle(self, *args, **options):
+        names = options['scenarios'] or list(SCENARIOS)
+        unknown = [name for name in names if name not in SCENARIOS]
+        if unknown:
+            raise CommandError(f'Unknown scenario: {", ".join(unknown)}')
+
+        with benchmark_database():
+            for name in names:
+                self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {SCENARIOS[name].__doc__.strip()}'))
+                self.stdout.write(f'{"":40} {"requests":>8} {"queries":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+                for row in SCENARIOS[name](options['requests']):
+                    self.stdout.write(
+                        f'{row["name"]:40} {row["requests"]:>8} {row["queries"]:>8.2f} '
+                        f'{row["p50_ms"]:>8.2f} {row["p95_ms"]:>8.2f} {row["p99_ms"]:>8.2f}'
+                    )
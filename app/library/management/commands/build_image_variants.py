@@ -0,0 +1,47 @@
+"""
+Writes resized WebP variants of the large static images next to them.
+
+The variants are committed with the images, so Pillow is only needed to
+regenerate them after an image changes, not to build or run the app.
+collectstatic then hashes and serves them like any other static file.
+"""
+
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+STATIC_DIR = Path(__file__).resolve().parents[2] / 'static'
+
+# Source image -> widths of the WebP variants (see base.html)
+VARIANTS = {
+    'library/images/library_bg.jpg': (960, 1500),
+}
+
+
+def variant_path(source, width):
+    return source.with_name(f'{source.stem}-{width}.webp')
+
+
+class Command(BaseCommand):
+    help = 'Generates resized WebP variants of the background image (needs Pillow)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quality', type=int, default=70, help='WebP quality (0-100)')
+
+    def handle(self, *args, **options):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise CommandError('Pillow is required: pip install Pillow')
+
+        for name, widths in VARIANTS.items():
+            source = STATIC_DIR / name
+            with Image.open(source) as image:
+                image = image.convert('RGB')
+                for width in widths:
+                    height = round(image.height * width / image.width)
+                    variant = image if width >= image.width else image.resize((width, height), Image.LANCZOS)
+                    path = variant_path(source, width)
+                    variant.save(path, 'WEBP', quality=options['quality'], method=6)
+                    self.stdout.write(f'{path.relative_to(STATIC_DIR)}: {path.stat().st_size / 1024:.0f} KB')
+        self.stdout.write(self.style.SUCCESS('Image variants written'))
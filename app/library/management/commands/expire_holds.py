@@ -0,0 +1,27 @@
+"""
+Expires reservation holds that ran out and passes each copy to the next
+member in the book's queue, or back to the shelf.
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.reservations import expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Expires reservation holds past their hold date and passes the copies on'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Expire holds that ended before this date, YYYY-MM-DD (default: today)')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['date']) if options['date'] else None
+        except ValueError:
+            raise CommandError('--date must be YYYY-MM-DD')
+
+        expired = expire_holds(today, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Expired {expired} reservation holds'))
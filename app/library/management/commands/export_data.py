@@ -0,0 +1,29 @@
+"""
+Writes a streaming export of loans, reservations or members to a file or stdout.
+"""
+
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from library.exports import EXPORTS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Exports loans, reservations or members as CSV or JSON Lines in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First date to include (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last date to include (YYYY-MM-DD)')
+        parser.add_argument('--output', help='Output file (default: stdout)')
+
+    def handle(self, *args, **options):
+        lines = stream_export(options['dataset'], options['format'], options['date_from'], options['date_to'])
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,172 @@
+"""
+Streams books from a CSV or JSON Lines file into the catalogue.
+
+Rows flow through a generator pipeline (read -> validate -> batch) so memory
+use does not depend on the size of the file. Each batch is de-duplicated
+against existing ISBNs with one query and written with one bulk insert in
+its own transaction. The last committed line is stored in a checkpoint file,
+so an interrupted import can be resumed with --resume.
+"""
+
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from library.catalogue_cache import invalidate_catalogue
+from library.models import Book, BookSearchToken
+from library.search import index_books, uses_token_index
+from library.validators import is_number, validate_book
+
+FIELDS = ('title', 'author', 'publisher', 'year', 'isbn', 'genre', 'availability')
+# Availability is left alone: it counts the copies on the shelf now, which a
+# catalogue file cannot know while copies are out on loan
+UPDATE_FIELDS = ['title', 'author', 'publisher', 'year', 'genre']
+MAX_REPORTED_ERRORS = 20
+
+
+def read_csv(stream):
+    for line_no, row in enumerate(csv.DictReader(stream), start=1):
+        yield line_no, row
+
+
+def read_jsonl(stream):
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_no, row if isinstance(row, dict) else {}
+
+
+def clean(rows):
+    """
+    Turns raw rows into unsaved Book objects.
+    Yields (line_no, book, error) with either a book or an error message.
+    """
+    for line_no, row in rows:
+        values = {field: str(row.get(field) or '').strip() for field in FIELDS}
+        isbn = values['isbn'].replace('-', '').replace(' ', '')
+        error = validate_book(isbn, values['year'])
+        if not error and not (values['title'] and values['author']):
+            error = 'Missing title or author'
+        if not error and values['availability'] and not is_number(values['availability']):
+            error = 'Invalid availability'
+        if error:
+            yield line_no, None, error
+            continue
+        yield line_no, Book(
+            title=values['title'],
+            author=values['author'],
+            publisher=values['publisher'] or None,
+            year=int(values['year']),
+            isbn=isbn,
+            genre=values['genre'] or None,
+            availability=int(values['availability'] or 1),
+        ), None
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Imports books from a CSV or JSON Lines file (use - for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON Lines file with the columns: ' + ', '.join(FIELDS))
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Input format (default: from the file extension)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per transaction')
+        parser.add_argument('--upsert', action='store_true', help='Update books whose ISBN already exists instead of skipping them')
+        parser.add_argument('--checkpoint', help='Checkpoint file (default: <path>.checkpoint)')
+        parser.add_argument('--resume', action='store_true', help='Skip the lines committed by a previous run')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or ('csv' if path.endswith('.csv') else 'jsonl')
+        checkpoint = None if path == '-' else Path(options['checkpoint'] or f'{path}.checkpoint')
+        start_after = 0
+        if options['resume']:
+            if checkpoint is None:
+                raise CommandError('--resume needs a file, not stdin')
+            if checkpoint.exists():
+                start_after = int(checkpoint.read_text().strip() or 0)
+
+        try:
+            stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        except OSError as exc:
+            raise CommandError(exc)
+
+        stats = {'created': 0, 'updated': 0, 'duplicates': 0, 'invalid': 0}
+        started = time.perf_counter()
+        with stream:
+            rows = read_csv(stream) if file_format == 'csv' else read_jsonl(stream)
+            rows = ((line_no, row) for line_no, row in rows if line_no > start_after)
+            last_line = start_after
+            for batch in batched(clean(rows), options['batch_size']):
+                books = []
+                for line_no, book, error in batch:
+                    if error:
+                        stats['invalid'] += 1
+                        if stats['invalid'] <= MAX_REPORTED_ERRORS:
+                            self.stderr.write(f'Line {line_no}: {error}')
+                    else:
+                        books.append(book)
+                self.write_batch(books, options['upsert'], stats)
+                last_line = batch[-1][0]
+                if checkpoint is not None:
+                    checkpoint.write_text(str(last_line))
+
+                elapsed = time.perf_counter() - started
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Line {last_line}: {stats} ({(last_line - start_after) / elapsed:.0f} rows/s)')
+
+        elapsed = time.perf_counter() - started
+        rows_read = last_line - start_after
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {rows_read} rows in {elapsed:.1f}s ({rows_read / max(elapsed, 1e-9):.0f} rows/s): '
+            f'{stats["created"]} created, {stats["updated"]} updated, '
+            f'{stats["duplicates"]} duplicates skipped, {stats["invalid"]} invalid'
+        ))
+
+    def write_batch(self, books, upsert, stats):
+        """
+        Inserts one batch in a single transaction, skipping or updating books
+        whose ISBN already exists.
+        """
+        # Later rows win when the same ISBN appears twice in a batch
+        by_isbn = {book.isbn: book for book in books}
+        stats['duplicates'] += len(books) - len(by_isbn)
+
+        with transaction.atomic():
+            existing = set(Book.objects.filter(isbn__in=by_isbn).values_list('isbn', flat=True))
+            new_books = [book for isbn, book in by_isbn.items() if isbn not in existing]
+            if upsert:
+                # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+                unique_fields = ['isbn'] if connection.features.supports_update_conflicts_with_target else None
+                Book.objects.bulk_create(
+                    by_isbn.values(), update_conflicts=True, unique_fields=unique_fields, update_fields=UPDATE_FIELDS
+                )
+                stats['updated'] += len(existing)
+            else:
+                Book.objects.bulk_create(new_books)
+                stats['duplicates'] += len(existing)
+            stats['created'] += len(new_books)
+
+            if uses_token_index():
+                # bulk_create skips the post_save signal that keeps the search index
+                written = list(by_isbn) if upsert else [book.isbn for book in new_books]
+                BookSearchToken.objects.filter(book__isbn__in=written).delete()
+                index_books(Book.objects.filter(isbn__in=written).only('book_id', 'title', 'author'))
+            if new_books or upsert:
+                invalidate_catalogue()
@@ -0,0 +1,41 @@
+"""
+Deletes expired rows from the django_session table in small batches.
+"""
+
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+class Command(BaseCommand):
+    help = (
+        'Deletes expired sessions from the database in batches, so the purge '
+        'never holds long locks on django_session'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        engine = import_module(settings.SESSION_ENGINE)
+        if not issubclass(engine.SessionStore, DatabaseSessionStore):
+            self.stdout.write(f'{settings.SESSION_ENGINE} does not store sessions in the database')
+            return
+
+        now = timezone.now()
+        deleted = 0
+        while True:
+            # expire_date is indexed, so each batch is an index range scan
+            keys = list(
+                Session.objects.filter(expire_date__lt=now)
+                .values_list('session_key', flat=True)[:options['batch_size']]
+            )
+            if not keys:
+                break
+            deleted += Session.objects.filter(session_key__in=keys).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired sessions'))
@@ -0,0 +1,35 @@
+"""
+Rebuilds the catalogue search token index from the books table.
+"""
+
+from django.core.management.base import BaseCommand
+
+from library.models import Book, BookSearchToken
+from library.search import index_books
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the book_search_tokens table used by catalogue search without FULLTEXT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        BookSearchToken.objects.all().delete()
+
+        indexed = 0
+        last_id = 0
+        while True:
+            books = list(
+                Book.objects.filter(book_id__gt=last_id)
+                .only('book_id', 'title', 'author')
+                .order_by('book_id')[:batch_size]
+            )
+            if not books:
+                break
+            index_books(books, batch_size=batch_size)
+            indexed += len(books)
+            last_id = books[-1].book_id
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} books'))
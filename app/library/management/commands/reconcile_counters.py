@@ -0,0 +1,26 @@
+"""
+Recomputes the denormalized loan and reservation counters of books and
+members and reports how many rows had drifted.
+"""
+
+from django.core.management.base import BaseCommand
+
+from library.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the active loan and pending reservation counters and reports drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+
+    def handle(self, *args, **options):
+        report = reconcile(fix=not options['dry_run'])
+        drifted = 0
+        for model, counts in report.items():
+            for counter, rows in counts.items():
+                drifted += rows
+                self.stdout.write(f'{model}.{counter}: {rows} rows drifted')
+        action = 'found' if options['dry_run'] else 'fixed'
+        style = self.style.WARNING if drifted else self.style.SUCCESS
+        self.stdout.write(style(f'{drifted} drifted counters {action}'))
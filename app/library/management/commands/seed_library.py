@@ -0,0 +1,62 @@
+"""
+Fills the database with synthetic books, members, loans and reservations.
+
+Meant for load testing and benchmarks, not for production databases: it
+refuses to run with DEBUG off unless --force is given. An administrator is
+only seeded with --admin-password (or SEED_ADMIN_PASSWORD). See
+library.seeding for how the data is generated.
+"""
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from library.seeding import SEED_PASSWORD, seed
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic library data with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100000)
+        parser.add_argument('--members', type=int, default=10000)
+        parser.add_argument('--staff', type=int, default=10)
+        parser.add_argument('--loans', type=int, default=500000)
+        parser.add_argument('--reservations', type=int, default=50000)
+        parser.add_argument('--years', type=float, default=3, help='Years of loan and reservation history')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk insert')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed generates the same data')
+        parser.add_argument(
+            '--admin-password', default=os.environ.get('SEED_ADMIN_PASSWORD'),
+            help='Make the first seeded staff member an administrator with this password (default: SEED_ADMIN_PASSWORD)'
+        )
+        parser.add_argument('--force', action='store_true', help='Seed even though DEBUG is off')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('DEBUG is off, so this may be a production database; pass --force to seed it anyway')
+        started = time.perf_counter()
+        try:
+            created = seed(
+                books=options['books'],
+                members=options['members'],
+                loans=options['loans'],
+                reservations=options['reservations'],
+                staff=options['staff'],
+                years=options['years'],
+                batch_size=options['batch_size'],
+                seed=options['seed'],
+                admin_password=options['admin_password'],
+            )
+        except ValueError as exc:
+            raise CommandError(exc)
+
+        elapsed = time.perf_counter() - started
+        rows = sum(created.values())
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s): '
+            + ', '.join(f'{count} {name}' for name, count in created.items())
+        ))
+        self.stdout.write(f'Seeded members and librarians log in with the password "{SEED_PASSWORD}"')
@@ -0,0 +1,120 @@
+"""
+This module contains the Prometheus metrics served at /metrics.
+
+Each gunicorn worker is its own process with its own copy of every metric.
+With PROMETHEUS_MULTIPROC_DIR set (entrypoint.sh sets it) workers write
+their samples to files in that directory and /metrics adds them up, so a
+scrape sees the whole pod instead of whichever worker answered it. When a
+worker exits gunicorn.conf.py merges its files into one archive file per
+metric type, so the directory does not grow as workers are recycled.
+
+Database queries are counted by an execute wrapper installed on every new
+connection. It adds to per-request totals kept in a context variable,
+which follows the request into the threads that run async ORM calls.
+"""
+
+import os
+import time
+from contextvars import ContextVar
+
+from django.db import transaction
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+REQUEST_SECONDS = Histogram(
+    'library_request_duration_seconds', 'Request latency by URL name', ['view', 'method']
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    'library_requests_in_flight', 'Requests being served', multiprocess_mode='livesum'
+)
+REQUEST_QUERIES = Histogram(
+    'library_request_db_queries', 'Database queries per request by URL name', ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100)
+)
+REQUEST_DB_SECONDS = Histogram(
+    'library_request_db_duration_seconds', 'Database time per request by URL name', ['view']
+)
+PASSWORD_HASH_SECONDS = Histogram(
+    'library_password_hash_duration_seconds', 'bcrypt time per operation (hash, check)', ['operation'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+)
+CIRCULATION_EVENTS = Counter(
+    'library_circulation_events', 'Committed borrows, returns and reservations', ['event']
+)
+LOGIN_THROTTLED = Counter(
+    'library_login_throttled', 'Login attempts rejected by the throttle per bucket scope', ['scope']
+)
+
+# [queries, seconds] of the request being served, or None outside requests
+_query_stats = ContextVar('library_query_stats', default=None)
+
+
+def record_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding each query to the current request's totals.
+    """
+    stats = _query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats[0] += 1
+        stats[1] += time.perf_counter() - start
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """
+    connection_created receiver adding record_queries to a new connection.
+    """
+    if record_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_queries)
+
+
+def start_request():
+    """
+    Starts collecting query totals for a request. Returns a token for finish_request.
+    """
+    REQUESTS_IN_FLIGHT.inc()
+    return _query_stats.set([0, 0.0]), time.perf_counter()
+
+
+def finish_request(request, token):
+    """
+    Records the latency and query totals of a request started with start_request.
+    """
+    context_token, start = token
+    stats = _query_stats.get()
+    _query_stats.reset(context_token)
+    REQUESTS_IN_FLIGHT.dec()
+    match = getattr(request, 'resolver_match', None)
+    view = match.url_name if match and match.url_name else 'unresolved'
+    REQUEST_SECONDS.labels(view, request.method).observe(time.perf_counter() - start)
+    REQUEST_QUERIES.labels(view).observe(stats[0])
+    REQUEST_DB_SECONDS.labels(view).observe(stats[1])
+
+
+def count_event(event):
+    """
+    Counts a borrow, return or reservation once its transaction commits.
+    """
+    transaction.on_commit(CIRCULATION_EVENTS.labels(event).inc)
+
+
+def render(attempts=3):
+    """
+    Returns the metrics of this pod in the Prometheus text format.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        for attempt in range(attempts):
+            try:
+                return generate_latest(registry)
+            except FileNotFoundError:
+                # gunicorn merged an exited worker's files between listing and reading them
+                if attempt == attempts - 1:
+                    raise
+    return generate_latest(REGISTRY)
@@ -0,0 +1,164 @@
+"""
+This module contains the middleware of the library management system.
+"""
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import compression, metrics, profiling, routers
+
+
+class MetricsMiddleware:
+    """
+    Records latency, requests in flight and database queries per request for
+    /metrics, labelled by URL name. Runs natively in sync and async mode so
+    async views are not moved to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = metrics.start_request()
+        try:
+            return self.get_response(request)
+        finally:
+            metrics.finish_request(request, token)
+
+    async def __acall__(self, request):
+        token = metrics.start_request()
+        try:
+            return await self.get_response(request)
+        finally:
+            metrics.finish_request(request, token)
+
+
+class SQLProfilerMiddleware:
+    """
+    Records the SQL of sampled and slow requests (see library.profiling).
+    Not loaded unless SQL_PROFILER_ENABLED is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SQL_PROFILER_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.profiler = profiling.Profiler(settings.SQL_PROFILER_SAMPLE_RATE, settings.SQL_PROFILER_SLOW_MS)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = self.profiler.start()
+        try:
+            return self.get_response(request)
+        finally:
+            self.profiler.finish(request, token)
+
+    async def __acall__(self, request):
+        token = self.profiler.start()
+        try:
+            return await self.get_response(request)
+        finally:
+            self.profiler.finish(request, token)
+
+
+class CompressionMiddleware:
+    """
+    Compresses dynamic responses with brotli or gzip (see library.compression).
+    Not loaded unless COMPRESSION_ENABLED is set.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.COMPRESSION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return compression.compress_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return compression.compress_response(request, await self.get_response(request))
+
+
+class ReplicaPinMiddleware:
+    """
+    Tracks the database writes of a request and pins a client that wrote to
+    the primary for a while (see library.routers). Not loaded unless a
+    replica is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not routers.replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = routers.start_request(request)
+        return routers.finish_request(self.get_response(request), token)
+
+    async def __acall__(self, request):
+        token = routers.start_request(request)
+        return routers.finish_request(await self.get_response(request), token)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    Serves the collected static files with WhiteNoise. WhiteNoiseMiddleware
+    is sync only, which under ASGI would have Django adapt the middleware
+    around it and move every request through a thread; this one also runs
+    natively in async mode, reading the file in a thread chunk by chunk.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+        response = await sync_to_async(self.serve)(static_file, request)
+        if response.file_to_stream is not None:
+            # The file stays registered to be closed with the response
+            response.streaming_content = self._read_chunks(response, response.file_to_stream)
+        return response
+
+    @staticmethod
+    async def _read_chunks(response, file):
+        while chunk := await sync_to_async(file.read)(response.block_size):
+            yield chunk
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute(
+            "CREATE FULLTEXT INDEX books_title_author_ft ON books (title, author)"
+        )
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "mysql":
+        schema_editor.execute("DROP INDEX books_title_author_ft ON books")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BookSearchToken",
+            fields=[
+                ("token_id", models.AutoField(primary_key=True, serialize=False)),
+                ("token", models.CharField(max_length=50)),
+                (
+                    "book",
+                    models.ForeignKey(
+                        db_column="book_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="search_tokens",
+                        to="library.book",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "book_search_tokens",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("token", "book"), name="book_search_token_unique"
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
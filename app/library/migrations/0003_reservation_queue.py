@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0002_book_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reservation",
+            name="hold_expires",
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name="reservation",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("ready", "Ready"),
+                    ("confirmed", "Confirmed"),
+                    ("cancelled", "Cancelled"),
+                    ("expired", "Expired"),
+                ],
+                default="pending",
+                max_length=10,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["book", "status", "reservation_date", "reservation_id"],
+                name="reservation_queue_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["status", "hold_expires"], name="reservation_hold_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-17 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0003_reservation_queue"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                fields=["member", "-loan_date"], name="loan_member_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                fields=["book", "return_date"], name="loan_book_open_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(
+                fields=["return_date", "due_date"], name="loan_open_due_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="loan",
+            index=models.Index(fields=["-loan_date", "-loan_id"], name="loan_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["book", "member", "status"], name="reservation_member_book_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["member", "-reservation_date"],
+                name="reservation_member_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="reservation",
+            index=models.Index(
+                fields=["-reservation_date", "-reservation_id"],
+                name="reservation_date_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="staff",
+            index=models.Index(fields=["role"], name="staff_role_idx"),
+        ),
+    ]
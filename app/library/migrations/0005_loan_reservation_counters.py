@@ -0,0 +1,59 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:10
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_rows(model, owner, condition):
+    rows = (
+        model.objects.filter(condition, **{owner: OuterRef("pk")})
+        .order_by()
+        .values(owner)
+        .annotate(count=Count("*"))
+        .values("count")
+    )
+    return Coalesce(Subquery(rows, output_field=IntegerField()), 0)
+
+
+def fill_counters(apps, schema_editor):
+    Loan = apps.get_model("library", "Loan")
+    Reservation = apps.get_model("library", "Reservation")
+    for model_name, owner in (("Book", "book"), ("Member", "member")):
+        apps.get_model("library", model_name).objects.update(
+            active_loans=count_rows(Loan, owner, Q(return_date__isnull=True)),
+            pending_reservations=count_rows(
+                Reservation, owner, Q(status__in=["pending", "ready"])
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0004_hot_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="book",
+            name="active_loans",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="book",
+            name="pending_reservations",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="member",
+            name="active_loans",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="member",
+            name="pending_reservations",
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2.5 on 2026-10-17 04:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("library", "0005_loan_reservation_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedLoan",
+            fields=[
+                ("loan_id", models.IntegerField(primary_key=True, serialize=False)),
+                ("loan_date", models.DateField()),
+                ("due_date", models.DateField()),
+                ("return_date", models.DateField()),
+                (
+                    "fine",
+                    models.DecimalField(decimal_places=2, default=0.0, max_digits=10),
+                ),
+                (
+                    "book",
+                    models.ForeignKey(
+                        db_column="book_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="library.book",
+                    ),
+                ),
+                (
+                    "member",
+                    models.ForeignKey(
+                        db_column="member_id",
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="library.member",
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "loan_archive",
+                "indexes": [
+                    models.Index(
+                        fields=["member", "-loan_date"],
+                        name="loan_archive_member_date_idx",
+                    ),
+                    models.Index(
+                        fields=["-loan_date", "-loan_id"], name="loan_archive_date_idx"
+                    ),
+                ],
+            },
+        ),
+    ]
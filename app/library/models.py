@@ -19,6 +19,8 @@ class Member(models.Model):
         email (EmailField): Member's email address (unique)
         date_joined (DateField): Date when the member joined the library
         credential (CharField): Hashed password for authentication
+        active_loans (IntegerField): Number of unreturned loans (maintained by library.counters)
+        pending_reservations (IntegerField): Number of pending or ready reservations (maintained by library.counters)
     """
     member_id = models.AutoField(primary_key=True)
     first_name = models.CharField(max_length=50)
@@ -28,6 +30,8 @@ class Member(models.Model):
     email = models.EmailField(unique=True)
     date_joined = models.DateField()
     credential = models.CharField(max_length=255)
+    active_loans = models.IntegerField(default=0)
+    pending_reservations = models.IntegerField(default=0)
 
     class Meta:
         db_table = 'members'
@@ -48,6 +52,8 @@ class Book(models.Model):
         isbn (CharField): International Standard Book Number (unique)
         availability (IntegerField): Number of copies available
         genre (CharField): Genre/category of the book (optional)
+        active_loans (IntegerField): Number of unreturned loans (maintained by library.counters)
+        pending_reservations (IntegerField): Number of pending or ready reservations (maintained by library.counters)
     """
     book_id = models.AutoField(primary_key=True)
     title = models.CharField(max_length=255)
@@ -57,6 +63,8 @@ class Book(models.Model):
     isbn = models.CharField(max_length=13, unique=True, default="1234567891234")
     availability = models.IntegerField(default=0)
     genre = models.CharField(max_length=50, null=True, blank=True)
+    active_loans = models.IntegerField(default=0)
+    pending_reservations = models.IntegerField(default=0)
 
     class Meta:
         db_table = 'books'
@@ -64,6 +72,29 @@ class Book(models.Model):
     def __str__(self):
         return self.title
 
+class BookSearchToken(models.Model):
+    """
+    Represents one word of a book's title or author in the catalogue search
+    index. Used for searching on databases without a FULLTEXT index.
+    
+    Attributes:
+        token_id (AutoField): Primary key for the token
+        book (ForeignKey): Reference to the indexed book
+        token (CharField): Lowercase word from the title or author
+    """
+    token_id = models.AutoField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_column='book_id', related_name='search_tokens')
+    token = models.CharField(max_length=50)
+
+    class Meta:
+        db_table = 'book_search_tokens'
+        constraints = [
+            models.UniqueConstraint(fields=['token', 'book'], name='book_search_token_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} - {self.book_id}"
+
 class Loan(models.Model):
     """
     Represents a book loan transaction between a member and the library.
@@ -87,10 +118,54 @@ class Loan(models.Model):
 
     class Meta:
         db_table = 'loans'
+        indexes = [
+            # A member's loans, newest first (my_loans)
+            models.Index(fields=['member', '-loan_date'], name='loan_member_date_idx'),
+            # Open loans of a book (delete_book)
+            models.Index(fields=['book', 'return_date'], name='loan_book_open_idx'),
+            # Open loans by due date (fine accrual)
+            models.Index(fields=['return_date', 'due_date'], name='loan_open_due_idx'),
+            # All loans, newest first (manage_loans pages)
+            models.Index(fields=['-loan_date', '-loan_id'], name='loan_date_idx'),
+        ]
 
     def __str__(self):
         return f"Loan {self.loan_id} - {self.book.title}"
 
+class ArchivedLoan(models.Model):
+    """
+    A returned loan moved out of the loans table once it is older than
+    LOAN_RETENTION_DAYS (see library.archive). Keeps the loan's id.
+
+    Attributes:
+        loan_id (IntegerField): Primary key, the id the loan had in loans
+        member (ForeignKey): Reference to the borrowing member
+        book (ForeignKey): Reference to the borrowed book
+        loan_date (DateField): Date when the book was borrowed
+        due_date (DateField): Expected return date
+        return_date (DateField): Actual return date
+        fine (DecimalField): Fine charged for the loan
+    """
+    loan_id = models.IntegerField(primary_key=True)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, db_column='member_id')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_column='book_id')
+    loan_date = models.DateField()
+    due_date = models.DateField()
+    return_date = models.DateField()
+    fine = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
+
+    class Meta:
+        db_table = 'loan_archive'
+        indexes = [
+            # A member's past loans, newest first (my_loans history)
+            models.Index(fields=['member', '-loan_date'], name='loan_archive_member_date_idx'),
+            # All past loans, newest first (manage_loans history pages)
+            models.Index(fields=['-loan_date', '-loan_id'], name='loan_archive_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived loan {self.loan_id} - {self.book.title}"
+
 class Reservation(models.Model):
     """
     Represents a book reservation made by a member.
@@ -100,12 +175,19 @@ class Reservation(models.Model):
         member (ForeignKey): Reference to the reserving member
         book (ForeignKey): Reference to the reserved book
         reservation_date (DateField): Date when the reservation was made
-        status (CharField): Current status of the reservation (pending/confirmed/cancelled)
+        status (CharField): Current status of the reservation (pending/ready/confirmed/cancelled/expired)
+        hold_expires (DateField): Last day a returned copy is held for the member (optional)
+
+    Pending reservations of a book form a queue ordered by reservation date
+    and id. A returned copy is held for the head of the queue, which then
+    becomes ready until it is borrowed or the hold expires.
     """
     STATUS_CHOICES = [
         ('pending', 'Pending'),
+        ('ready', 'Ready'),
         ('confirmed', 'Confirmed'),
         ('cancelled', 'Cancelled'),
+        ('expired', 'Expired'),
     ]
 
     reservation_id = models.AutoField(primary_key=True)
@@ -113,9 +195,21 @@ class Reservation(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE, db_column='book_id')
     reservation_date = models.DateField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    hold_expires = models.DateField(null=True, blank=True)
 
     class Meta:
         db_table = 'reservations'
+        indexes = [
+            # Queue order of a book's reservations in one status
+            models.Index(fields=['book', 'status', 'reservation_date', 'reservation_id'], name='reservation_queue_idx'),
+            models.Index(fields=['status', 'hold_expires'], name='reservation_hold_idx'),
+            # A member's reservation of a book (reserve_book)
+            models.Index(fields=['book', 'member', 'status'], name='reservation_member_book_idx'),
+            # A member's reservations, newest first (my_reservations)
+            models.Index(fields=['member', '-reservation_date'], name='reservation_member_date_idx'),
+            # All reservations, newest first (manage_reservations pages)
+            models.Index(fields=['-reservation_date', '-reservation_id'], name='reservation_date_idx'),
+        ]
 
     def __str__(self):
         return f"Reservation {self.reservation_id} - {self.book.title}"
@@ -143,6 +237,9 @@ class Staff(models.Model):
 
     class Meta:
         db_table = 'staffs'
+        indexes = [
+            models.Index(fields=['role'], name='staff_role_idx'),
+        ]
 
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
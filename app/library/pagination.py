@@ -0,0 +1,215 @@
+"""
+This module contains keyset (cursor) pagination for the list views.
+
+Instead of ``OFFSET`` and ``COUNT(*)``, each page is fetched with a ``WHERE``
+clause on the ordering columns of the last row seen, so every page costs the
+same as the first one as long as the ordering is backed by an index.
+"""
+
+import base64
+import json
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+def encode_cursor(direction, values):
+    """
+    Encodes a page direction and the ordering values of a row as an opaque,
+    URL-safe cursor string.
+    """
+    payload = json.dumps({'d': direction, 'k': values}, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decodes a cursor created by encode_cursor.
+    Returns None for a missing or malformed cursor.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        direction, values = payload['d'], payload['k']
+    except (ValueError, TypeError, KeyError):
+        return None
+    if direction not in ('next', 'prev') or not isinstance(values, list):
+        return None
+    return direction, values
+
+
+def get_page_size(request):
+    """
+    Returns the page size requested with ``page_size``, bounded by
+    settings.MAX_PAGE_SIZE, or settings.PAGE_SIZE by default.
+    """
+    try:
+        page_size = int(request.GET.get('page_size', settings.PAGE_SIZE))
+    except ValueError:
+        page_size = settings.PAGE_SIZE
+    return max(1, min(page_size, settings.MAX_PAGE_SIZE))
+
+
+def _keyset_filter(ordering, values, reverse=False):
+    """
+    Builds the Q object selecting rows after ``values`` in ``ordering``,
+    e.g. ``loan_date <= d AND ((loan_date < d) OR (loan_date = d AND loan_id < i))``.
+
+    The redundant range on the first field lets the database seek into an
+    index on the ordering instead of scanning it from the start.
+    """
+    condition = Q()
+    for i, field in enumerate(ordering):
+        name = field.lstrip('-')
+        descending = field.startswith('-') != reverse
+        term = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+        for previous, value in zip(ordering[:i], values):
+            term &= Q(**{previous.lstrip('-'): value})
+        condition |= term
+    if len(ordering) > 1:
+        first = ordering[0]
+        descending = first.startswith('-') != reverse
+        condition &= Q(**{f'{first.lstrip("-")}__{"lte" if descending else "gte"}': values[0]})
+    return condition
+
+
+def _reverse_ordering(ordering):
+    return [field[1:] if field.startswith('-') else '-' + field for field in ordering]
+
+
+class KeysetPage:
+    """
+    A page of results with cursors for the neighbouring pages.
+
+    Attributes:
+        object_list (list): Rows on this page
+        next_cursor (str): Cursor for the next page, or None on the last page
+        previous_cursor (str): Cursor for the previous page, or None on the first page
+    """
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _ordering_field(queryset, field):
+    """
+    Returns the model field or annotation output field that ``field`` of an
+    ordering refers to.
+    """
+    name = field.lstrip('-')
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    *relations, name = name.split('__')
+    opts = queryset.model._meta
+    for relation in relations:
+        opts = opts.get_field(relation).related_model._meta
+    return opts.get_field(name)
+
+
+def _clean_values(queryset, ordering, values):
+    """
+    Converts the cursor ``values`` with the fields of ``ordering``.
+    Returns None if they do not fit, so a tampered cursor gives the first
+    page instead of an error.
+    """
+    if len(values) != len(ordering):
+        return None
+    cleaned = []
+    for field, value in zip(ordering, values):
+        if value is None or not isinstance(value, (str, int, float)):
+            return None
+        try:
+            cleaned.append(_ordering_field(queryset, field).to_python(value))
+        except (ValidationError, TypeError, ValueError):
+            return None
+    return cleaned
+
+
+def _page_query(queryset, ordering, cursor):
+    """
+    Returns the ordered, filtered queryset of the page that follows
+    ``cursor``, the decoded cursor and whether it pages backwards.
+    """
+    decoded = decode_cursor(cursor)
+    if decoded:
+        values = _clean_values(queryset, ordering, decoded[1])
+        decoded = None if values is None else (decoded[0], values)
+
+    backwards = decoded is not None and decoded[0] == 'prev'
+    queryset = queryset.order_by(*(_reverse_ordering(ordering) if backwards else ordering))
+    if decoded:
+        queryset = queryset.filter(_keyset_filter(ordering, decoded[1], reverse=backwards))
+    return queryset, decoded, backwards
+
+
+def _build_page(rows, ordering, page_size, decoded, backwards):
+    keys = [field.lstrip('-') for field in ordering]
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(direction, row):
+        return encode_cursor(direction, [getattr(row, key) for key in keys])
+
+    next_cursor = previous_cursor = None
+    if rows:
+        if has_more or backwards:
+            next_cursor = cursor_for('next', rows[-1])
+        if decoded and (has_more or not backwards):
+            previous_cursor = cursor_for('prev', rows[0])
+    return KeysetPage(rows, next_cursor, previous_cursor)
+
+
+def paginate(queryset, ordering, cursor=None, page_size=None):
+    """
+    Returns the KeysetPage of ``queryset`` ordered by ``ordering`` that
+    follows ``cursor``. The last field of ``ordering`` must be unique
+    (normally the primary key) so that every row has a distinct position.
+
+    Only ``page_size + 1`` rows are read: the extra row tells whether a
+    further page exists without counting the table.
+    """
+    ordering = list(ordering)
+    page_size = page_size or settings.PAGE_SIZE
+    queryset, decoded, backwards = _page_query(queryset, ordering, cursor)
+    rows = list(queryset[:page_size + 1])
+    return _build_page(rows, ordering, page_size, decoded, backwards)
+
+
+async def apaginate(queryset, ordering, cursor=None, page_size=None):
+    """
+    Async version of paginate for async views.
+    """
+    ordering = list(ordering)
+    page_size = page_size or settings.PAGE_SIZE
+    queryset, decoded, backwards = _page_query(queryset, ordering, cursor)
+    rows = [row async for row in queryset[:page_size + 1]]
+    return _build_page(rows, ordering, page_size, decoded, backwards)
@@ -0,0 +1,93 @@
+"""
+This module contains password hashing for members and staff.
+
+bcrypt runs in the thread of the request. The bcrypt library releases the
+GIL while hashing, so the other threads of a gthread worker keep serving
+requests, but the request's own thread (or a sync worker) is busy for the
+whole hash.
+
+The bcrypt cost is either fixed with BCRYPT_ROUNDS or calibrated on the
+first hash in each process so that one hash takes about BCRYPT_TARGET_MS.
+Processes on different hardware may calibrate different costs, so
+deployments fix BCRYPT_ROUNDS (the Helm chart does). Logins rehash stored
+credentials whose cost is below the current one and never lower it, so
+processes that disagree on the cost do not rehash a password back and
+forth.
+"""
+
+import math
+import time
+from functools import lru_cache
+
+import bcrypt
+from django.conf import settings
+
+from .metrics import PASSWORD_HASH_SECONDS
+
+# bcrypt accepts costs from 4 to 31
+MIN_ROUNDS = 4
+MAX_ROUNDS = 31
+CALIBRATION_ROUNDS = 8
+
+def _timed(operation, func, *args):
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        PASSWORD_HASH_SECONDS.labels(operation).observe(time.perf_counter() - start)
+
+
+@lru_cache(maxsize=1)
+def _calibrated_rounds(target_ms, min_rounds):
+    """
+    Returns the cost at which one hash takes about ``target_ms`` on this
+    machine. Each extra round doubles the hashing time.
+    """
+    salt = bcrypt.gensalt(rounds=CALIBRATION_ROUNDS)
+    start = time.perf_counter()
+    bcrypt.hashpw(b'calibration', salt)
+    elapsed_ms = max((time.perf_counter() - start) * 1000, 0.001)
+    rounds = CALIBRATION_ROUNDS + round(math.log2(target_ms / elapsed_ms))
+    return max(min_rounds, min(rounds, MAX_ROUNDS))
+
+
+def get_rounds():
+    """
+    Returns the bcrypt cost for new hashes.
+    """
+    if settings.BCRYPT_ROUNDS:
+        return max(MIN_ROUNDS, min(settings.BCRYPT_ROUNDS, MAX_ROUNDS))
+    return _calibrated_rounds(settings.BCRYPT_TARGET_MS, settings.BCRYPT_MIN_ROUNDS)
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode()
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_password(password):
+    """
+    Returns the bcrypt hash of ``password`` at the current cost.
+    """
+    rounds = get_rounds()
+    return _timed('hash', _hash, password, rounds)
+
+
+def check_password(password, hashed):
+    """
+    Returns True if ``password`` matches the bcrypt hash ``hashed``.
+    """
+    return _timed('check', _check, password, hashed)
+
+
+def needs_rehash(hashed):
+    """
+    Returns True if ``hashed`` was made with a lower cost than the current one.
+    """
+    try:
+        return int(hashed.split('$')[2]) < get_rounds()
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,137 @@
+"""
+This module contains the sampling SQL profiler.
+
+With SQL_PROFILER_ENABLED set, SQLProfilerMiddleware collects the SQL of a
+request when it is sampled (SQL_PROFILER_SAMPLE_RATE) or, if
+SQL_PROFILER_SLOW_MS is set, of every request and keeps it only when the
+request took longer than that. A kept profile lists each statement with
+its duration, the statements that ran more than once (the N+1 pattern)
+and the view that ran them. Profiles go to an in-memory ring buffer per
+worker, shown to administrators at /manage-profiles/, and to the
+``library.sql_profiler`` logger, which SQL_PROFILER_LOG_FILE sends to a
+rotating file.
+
+Statements are recorded as Django sends them to the driver, with ``%s``
+placeholders instead of parameters, so repeats of one query with
+different values group together and no passwords or personal data end
+up in a profile. With the profiler disabled the middleware is not loaded
+and the execute wrapper returns after one context variable lookup.
+"""
+
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+logger = logging.getLogger('library.sql_profiler')
+
+# Most recent profiles of this worker, newest last
+PROFILES = deque(maxlen=settings.SQL_PROFILER_BUFFER_SIZE)
+
+# [(sql, seconds), ...] of the request being profiled, or None
+_statements = ContextVar('library_sql_statements', default=None)
+
+
+def record_statements(execute, sql, params, many, context):
+    """
+    Database execute wrapper adding each statement to the current profile.
+    """
+    statements = _statements.get()
+    if statements is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        statements.append((sql, time.perf_counter() - start))
+
+
+def install_statement_recorder(sender, connection, **kwargs):
+    """
+    connection_created receiver adding record_statements to a new connection.
+    """
+    if record_statements not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_statements)
+
+
+def duplicate_groups(statements):
+    """
+    Returns the statements that ran more than once, most repeated first, as
+    ``{'sql', 'count', 'ms'}`` dicts.
+    """
+    groups = {}
+    for sql, seconds in statements:
+        count, total = groups.get(sql, (0, 0.0))
+        groups[sql] = (count + 1, total + seconds)
+    return sorted(
+        (
+            {'sql': sql, 'count': count, 'ms': round(total * 1000, 3)}
+            for sql, (count, total) in groups.items() if count > 1
+        ),
+        key=lambda group: (-group['count'], -group['ms'])
+    )
+
+
+def build_profile(request, reason, seconds, statements):
+    """
+    Returns the profile of a finished request.
+    """
+    match = getattr(request, 'resolver_match', None)
+    return {
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'pid': os.getpid(),
+        'reason': reason,
+        'view': match.url_name if match and match.url_name else 'unresolved',
+        'method': request.method,
+        'path': request.path,
+        'ms': round(seconds * 1000, 3),
+        'query_count': len(statements),
+        'query_ms': round(sum(duration for _, duration in statements) * 1000, 3),
+        'queries': [{'sql': sql, 'ms': round(duration * 1000, 3)} for sql, duration in statements],
+        'duplicates': duplicate_groups(statements),
+    }
+
+
+def store(profile):
+    """
+    Adds a profile to the ring buffer and logs it as one JSON line.
+    """
+    PROFILES.append(profile)
+    logger.info(json.dumps(profile))
+
+
+class Profiler:
+    """
+    Decides per request whether to collect its SQL and whether to keep it.
+    """
+
+    def __init__(self, sample_rate, slow_ms):
+        self.sample_rate = sample_rate
+        self.slow_seconds = slow_ms / 1000 if slow_ms else None
+
+    def start(self):
+        """
+        Returns a token for finish, or None when the request is not profiled.
+        """
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled and self.slow_seconds is None:
+            return None
+        statements = []
+        return _statements.set(statements), statements, sampled, time.perf_counter()
+
+    def finish(self, request, token):
+        if token is None:
+            return
+        context_token, statements, sampled, start = token
+        seconds = time.perf_counter() - start
+        _statements.reset(context_token)
+        if sampled:
+            store(build_profile(request, 'sampled', seconds, statements))
+        elif seconds >= self.slow_seconds:
+            store(build_profile(request, 'slow', seconds, statements))
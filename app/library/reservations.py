@@ -0,0 +1,168 @@
+"""
+This module contains the per-book reservation queue.
+
+Pending reservations of a book are served first come, first served in
+(reservation_date, reservation_id) order, which is the tail of the
+``reservation_queue_idx`` index (book, status, reservation_date,
+reservation_id). The head of a queue is one index seek and a position is a
+count over the index range in front of the reservation, so neither reads
+the reservations table itself.
+
+A copy that comes back is held for the head of the queue instead of going
+back on the shelf. The hold lasts RESERVATION_HOLD_DAYS; holds that run out
+are expired by ``expire_holds`` and their copy passed on to the next member.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import counters, metrics
+from .catalogue_cache import invalidate_catalogue
+from .models import Book, Reservation
+
+QUEUE_ORDERING = ('reservation_date', 'reservation_id')
+
+
+def queue(book_id):
+    """
+    Returns the pending reservations of a book in queue order.
+    """
+    return Reservation.objects.filter(book_id=book_id, status='pending').order_by(*QUEUE_ORDERING)
+
+
+def next_in_line(book_id):
+    """
+    Returns the reservation at the head of a book's queue, or None.
+    """
+    return queue(book_id).first()
+
+
+def _ahead_of(reservation_date, reservation_id):
+    return Q(reservation_date__lt=reservation_date) | Q(
+        reservation_date=reservation_date, reservation_id__lt=reservation_id
+    )
+
+
+def queue_position(reservation):
+    """
+    Returns the 1-based position of a pending reservation in its queue, or
+    None when the reservation is not waiting.
+    """
+    if reservation.status != 'pending':
+        return None
+    ahead = queue(reservation.book_id).filter(_ahead_of(reservation.reservation_date, reservation.reservation_id))
+    return ahead.count() + 1
+
+
+def with_queue_position(reservations):
+    """
+    Annotates ``queue_position`` on a reservation queryset with one
+    correlated count per row, so listing positions stays a single query.
+    The annotation is only meaningful for pending reservations.
+    """
+    ahead = (
+        Reservation.objects.filter(book_id=OuterRef('book_id'), status='pending')
+        .filter(_ahead_of(OuterRef('reservation_date'), OuterRef('reservation_id')))
+        .order_by()
+        .values('book_id')
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return reservations.annotate(
+        queue_position=Coalesce(Subquery(ahead, output_field=IntegerField()), 0) + 1
+    )
+
+
+def hold_for_next(book_id, today=None):
+    """
+    Holds one copy of a book for the head of its queue.
+
+    Must run inside the transaction that freed the copy. The head is claimed
+    with a conditional ``UPDATE ... WHERE status = 'pending'``, so a
+    reservation cancelled concurrently is skipped rather than given the copy.
+    Returns the reservation now holding the copy, or None if nobody waits.
+    """
+    today = today or timezone.localdate()
+    hold_expires = today + timedelta(days=settings.RESERVATION_HOLD_DAYS)
+    while True:
+        head = next_in_line(book_id)
+        if head is None:
+            return None
+        if Reservation.objects.filter(pk=head.pk, status='pending').update(status='ready', hold_expires=hold_expires):
+            head.status = 'ready'
+            head.hold_expires = hold_expires
+            return head
+
+
+def release_copy(book_id, today=None):
+    """
+    Passes a freed copy of a book to the next member in its queue, or puts
+    it back on the shelf when the queue is empty. Returns the reservation
+    holding the copy, or None.
+    """
+    with transaction.atomic():
+        reservation = hold_for_next(book_id, today)
+        if reservation is None:
+            Book.objects.filter(pk=book_id).update(availability=F('availability') + 1)
+            invalidate_catalogue()
+        return reservation
+
+
+def reserve(member, book):
+    """
+    Adds ``member`` to the end of the queue for ``book``.
+    """
+    with transaction.atomic():
+        reservation = Reservation.objects.create(
+            member=member,
+            book=book,
+            reservation_date=timezone.localdate(),
+            status='pending'
+        )
+        counters.adjust(book.pk, member.pk, pending_reservations=1)
+        metrics.count_event('reservation')
+    return reservation
+
+
+def cancel(reservation):
+    """
+    Cancels a pending or ready reservation. A copy held for a ready
+    reservation is passed on. Returns False if it was neither.
+    """
+    with transaction.atomic():
+        if Reservation.objects.filter(pk=reservation.pk, status='ready').update(status='cancelled'):
+            release_copy(reservation.book_id)
+        elif not Reservation.objects.filter(pk=reservation.pk, status='pending').update(status='cancelled'):
+            return False
+        counters.adjust(reservation.book_id, reservation.member_id, pending_reservations=-1)
+    reservation.status = 'cancelled'
+    return True
+
+
+def expire_holds(today=None, chunk_size=500):
+    """
+    Expires holds that ran out before ``today`` and passes each copy on.
+    Every hold is expired in its own short transaction. Returns the number
+    of holds expired.
+    """
+    today = today or timezone.localdate()
+    expired = 0
+    while True:
+        holds = list(
+            Reservation.objects.filter(status='ready', hold_expires__lt=today)
+            .order_by('hold_expires', 'reservation_id')
+            .values_list('reservation_id', 'book_id', 'member_id')[:chunk_size]
+        )
+        for reservation_id, book_id, member_id in holds:
+            with transaction.atomic():
+                if Reservation.objects.filter(pk=reservation_id, status='ready').update(status='expired'):
+                    counters.adjust(book_id, member_id, pending_reservations=-1)
+                    release_copy(book_id, today)
+                    expired += 1
+        if len(holds) < chunk_size:
+            return expired
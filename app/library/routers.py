@@ -0,0 +1,144 @@
+"""
+This module contains the database router for the optional read replica.
+
+With DB_REPLICA_HOST set, settings add a ``replica`` database alias. Views
+decorated with ``replica_reads`` (the loan, reservation, member and staff
+lists and the exports, which only read) run their queries against it;
+every other view, and every write anywhere, uses the primary. The
+catalogue stays on the primary: its pages are cached per catalogue
+version, and a page rendered from a lagging replica would be cached as
+current until the next change.
+
+Replicas lag behind the primary, so a member who just borrowed a book
+could open My Loans and not see it. ReplicaPinMiddleware therefore sets a
+short-lived cookie on any response to a request that wrote, and requests
+carrying it read from the primary for DB_REPLICA_PIN_SECONDS. Sessions are
+always read from the primary, so a fresh login is never lost to lag.
+"""
+
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+DEFAULT = 'default'
+REPLICA = 'replica'
+PIN_COOKIE = 'db_pin'
+
+# Apps whose tables are always read from the primary and whose writes do
+# not pin the client
+PRIMARY_ONLY_APPS = {'sessions'}
+
+
+class RequestRouting:
+    """
+    Routing state of the request being served.
+    """
+
+    def __init__(self, pinned):
+        self.pinned = pinned
+        self.replica_view = False
+        self.wrote = False
+
+
+# RequestRouting of the request being served, or None outside requests
+_routing = ContextVar('library_db_routing', default=None)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def read_alias():
+    """
+    Returns the database alias reads in the current context go to.
+
+    Views whose queries run after they return, like streamed exports, pass
+    this to ``.using()`` while the view runs.
+    """
+    routing = _routing.get()
+    if routing is not None and routing.replica_view and not routing.pinned:
+        return REPLICA
+    return DEFAULT
+
+
+def start_request(request):
+    """
+    Starts routing a request. Returns a token for finish_request.
+    """
+    return _routing.set(RequestRouting(pinned=PIN_COOKIE in request.COOKIES))
+
+
+def finish_request(response, token):
+    """
+    Pins the client to the primary if the request wrote anything.
+    """
+    routing = _routing.get()
+    _routing.reset(token)
+    if routing.wrote:
+        response.set_cookie(
+            PIN_COOKIE, '1', max_age=settings.DB_REPLICA_PIN_SECONDS, httponly=True, samesite='Lax'
+        )
+    return response
+
+
+def replica_reads(view_func):
+    """
+    Marks a view that only reads, so its queries may go to the replica.
+    Works on both sync and async views.
+    """
+    def enter():
+        routing = _routing.get()
+        if routing is not None:
+            routing.replica_view = True
+        return routing
+
+    def leave(routing):
+        if routing is not None:
+            routing.replica_view = False
+
+    if iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_async_view(request, *args, **kwargs):
+            routing = enter()
+            try:
+                return await view_func(request, *args, **kwargs)
+            finally:
+                leave(routing)
+        return _wrapped_async_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        routing = enter()
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            leave(routing)
+    return _wrapped_view
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of replica_reads views to the replica and everything
+    else to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = _routing.get()
+        # Session saves are not library data and would pin every visitor
+        if routing is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            routing.wrote = True
+        return DEFAULT
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT
@@ -0,0 +1,146 @@
+"""
+This module contains the catalogue search used by the book list.
+
+Queries are answered by one of three index-backed paths:
+
+* ISBN: a query made only of digits is matched exactly or by prefix against
+  the unique ``isbn`` index. When no ISBN matches, the query is searched as
+  text, so numeric titles like "1984" are still found.
+* Full-text: on MySQL a FULLTEXT index on ``(title, author)`` is queried in
+  boolean mode and ranked by MySQL's relevance score.
+* Tokens: on other databases (SQLite in tests) an inverted index of
+  title/author words in ``book_search_tokens`` is queried by prefix and
+  ranked by the number of matching words.
+
+SEARCH_BACKEND selects between ``fulltext`` and ``tokens``; the default
+``auto`` picks full-text on MySQL and tokens everywhere else.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Book, BookSearchToken
+
+TOKEN_RE = re.compile(r'\w+')
+MAX_QUERY_TOKENS = 8
+
+
+def tokenize(text):
+    """
+    Splits text into the lowercase words stored in the token index.
+    """
+    max_length = BookSearchToken._meta.get_field('token').max_length
+    return {token[:max_length] for token in TOKEN_RE.findall((text or '').lower())}
+
+
+def uses_token_index(db_connection=None):
+    """
+    Returns True when searches go through the token table rather than a
+    FULLTEXT index, so the token table has to be kept up to date.
+    """
+    backend = settings.SEARCH_BACKEND
+    if backend == 'auto':
+        return (db_connection or connection).vendor != 'mysql'
+    return backend == 'tokens'
+
+
+def index_book(book):
+    """
+    Replaces the search tokens of a book with the words of its title and author.
+    """
+    tokens = tokenize(book.title) | tokenize(book.author)
+    with transaction.atomic():
+        BookSearchToken.objects.filter(book=book).delete()
+        BookSearchToken.objects.bulk_create(
+            BookSearchToken(book=book, token=token) for token in tokens
+        )
+
+
+def index_books(books, batch_size=1000):
+    """
+    Adds search tokens for books that have none yet, e.g. after a bulk insert.
+    """
+    BookSearchToken.objects.bulk_create(
+        (
+            BookSearchToken(book=book, token=token)
+            for book in books
+            for token in tokenize(book.title) | tokenize(book.author)
+        ),
+        batch_size=batch_size
+    )
+
+
+def _isbn_search(books, digits):
+    if len(digits) == Book._meta.get_field('isbn').max_length:
+        return books.filter(isbn=digits), ['book_id']
+    return books.filter(isbn__startswith=digits), ['book_id']
+
+
+def _fulltext_search(books, tokens):
+    # Boolean mode with a trailing * gives prefix matching on each word
+    terms = ' '.join(f'{token}*' for token in tokens)
+    relevance = RawSQL(
+        'MATCH (books.title, books.author) AGAINST (%s IN BOOLEAN MODE)',
+        (terms,)
+    )
+    return books.annotate(relevance=relevance).filter(relevance__gt=0), ['-relevance', 'book_id']
+
+
+def _token_search(books, tokens):
+    # A range rather than LIKE 'x%' so every database can use the token index
+    matches = Q()
+    for token in tokens:
+        matches |= Q(search_tokens__token__gte=token, search_tokens__token__lt=token + '\uffff')
+    # Filtering before annotating restricts the count to the matching tokens
+    books = books.filter(matches).annotate(relevance=Count('search_tokens', distinct=True))
+    return books, ['-relevance', 'book_id']
+
+
+def _isbn_digits(query):
+    """
+    Returns the query without ISBN separators if it is made only of digits,
+    otherwise None.
+    """
+    digits = query.strip().replace('-', '').replace(' ', '')
+    return digits if digits.isdigit() else None
+
+
+def _text_search(books, query):
+    tokens = sorted(tokenize(query))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return books, ['book_id']
+    if uses_token_index():
+        return _token_search(books, tokens)
+    return _fulltext_search(books, tokens)
+
+
+def search_books(books, query):
+    """
+    Filters the ``books`` queryset by a catalogue search query.
+
+    Returns the filtered queryset and the ordering to paginate it by, most
+    relevant first. The last ordering field is always ``book_id`` so the
+    result can be paginated with keyset cursors.
+    """
+    digits = _isbn_digits(query)
+    if digits:
+        isbn_books, ordering = _isbn_search(books, digits)
+        if isbn_books.exists():
+            return isbn_books, ordering
+    return _text_search(books, query)
+
+
+async def asearch_books(books, query):
+    """
+    Async version of search_books.
+    """
+    digits = _isbn_digits(query)
+    if digits:
+        isbn_books, ordering = _isbn_search(books, digits)
+        if await isbn_books.aexists():
+            return isbn_books, ordering
+    return _text_search(books, query)
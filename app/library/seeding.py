@@ -0,0 +1,238 @@
+"""
+This module generates synthetic library data for load testing and benchmarks.
+
+Books, members, loans and reservations are written with bulk inserts in
+batches, one transaction per batch, so millions of rows take minutes rather
+than hours. Values come from a seeded random generator, so the same
+arguments produce the same data. Rows are added next to any existing data:
+ISBNs and email addresses are numbered after the highest existing id.
+
+Loans spread evenly over the requested number of years. Loans from the
+last loan period may still be open, at most one per book, so every book
+keeps a copy on the shelf or none at all; older loans are returned, with
+fines for late returns. Recent reservations are pending in the queue of a
+book that is out on loan; older ones are confirmed, cancelled or expired.
+The denormalized counters and the availability of the new books are
+brought in line with set-based updates at the end.
+"""
+
+import random
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from . import counters, passwords
+from .catalogue_cache import invalidate_catalogue
+from .circulation import LOAN_PERIOD
+from .fines import fine_for
+from .models import Book, Loan, Member, Reservation, Staff
+from .search import index_books, uses_token_index
+
+# Every seeded member and librarian can log in with this password; an
+# administrator is only seeded with a password of its own
+SEED_PASSWORD = 'library-seed'
+
+WORDS = (
+    'Silent', 'River', 'Shadow', 'Garden', 'Winter', 'Empire', 'Glass', 'Harbor', 'Secret', 'Light',
+    'Stone', 'Forest', 'Memory', 'Night', 'Ocean', 'Crown', 'Paper', 'Storm', 'Golden', 'Last',
+    'Hidden', 'Broken', 'Northern', 'Iron', 'Summer', 'City', 'Letters', 'Journey', 'Mountain', 'Fire',
+)
+FIRST_NAMES = (
+    'Alex', 'Sam', 'Jordan', 'Taylor', 'Morgan', 'Casey', 'Riley', 'Jamie', 'Avery', 'Quinn',
+    'Maria', 'Wei', 'Amir', 'Yuki', 'Olga', 'Kwame', 'Lucia', 'Ravi', 'Noor', 'Mateo',
+)
+LAST_NAMES = (
+    'Smith', 'Chen', 'Garcia', 'Nguyen', 'Kim', 'Patel', 'Martin', 'Lopez', 'Brown', 'Wilson',
+    'Tanaka', 'Silva', 'Cohen', 'Murphy', 'Novak', 'Singh', 'Khan', 'Rossi', 'Dubois', 'Okafor',
+)
+GENRES = ('Fiction', 'Mystery', 'Science', 'History', 'Fantasy', 'Biography', 'Poetry', 'Children', 'Romance', 'Travel')
+PUBLISHERS = ('Penguin', 'HarperCollins', 'Vintage', 'Orbit', 'Tor', 'Scholastic', 'Bloomsbury', 'Norton')
+
+# Shares of old reservations by final status
+CLOSED_RESERVATION_STATUSES = (('confirmed', 6), ('cancelled', 3), ('expired', 1))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def _next_number(model, field):
+    return (model.objects.aggregate(last=Max(field))['last'] or 0) + 1
+
+
+def _random_date(rng, today, days):
+    return today - timedelta(days=rng.randrange(days))
+
+
+def _bulk_insert(model, rows, batch_size):
+    for batch in batched(rows, batch_size):
+        with transaction.atomic():
+            model.objects.bulk_create(batch)
+
+
+def seed_books(count, rng, batch_size=5000):
+    """
+    Inserts ``count`` books and returns the ids of the new books.
+    """
+    first = _next_number(Book, 'book_id')
+    this_year = timezone.localdate().year
+
+    def books():
+        for number in range(first, first + count):
+            yield Book(
+                title=' '.join(rng.sample(WORDS, rng.randint(2, 4))),
+                author=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                publisher=rng.choice(PUBLISHERS),
+                year=rng.randint(1900, this_year),
+                isbn=f'979{number:010d}',
+                genre=rng.choice(GENRES),
+                availability=rng.randint(1, 3),
+            )
+
+    for batch in batched(books(), batch_size):
+        with transaction.atomic():
+            Book.objects.bulk_create(batch)
+            if uses_token_index():
+                # bulk_create skips the post_save signal that keeps the search index
+                index_books(
+                    Book.objects.filter(isbn__in=[book.isbn for book in batch]).only('book_id', 'title', 'author'),
+                    batch_size=batch_size
+                )
+    return list(Book.objects.filter(book_id__gte=first).order_by('book_id').values_list('book_id', flat=True))
+
+
+def seed_members(count, rng, days, batch_size=5000):
+    """
+    Inserts ``count`` members who joined within the last ``days`` days and
+    returns the ids of the new members.
+    """
+    first = _next_number(Member, 'member_id')
+    today = timezone.localdate()
+    # One bcrypt hash for everyone; hashing each password would take hours
+    credential = passwords.hash_password(SEED_PASSWORD)
+
+    def members():
+        for number in range(first, first + count):
+            yield Member(
+                first_name=rng.choice(FIRST_NAMES),
+                last_name=rng.choice(LAST_NAMES),
+                email=f'seed-member-{number}@example.com',
+                contact=f'555{number % 10000000:07d}',
+                date_joined=_random_date(rng, today, days),
+                credential=credential,
+            )
+
+    _bulk_insert(Member, members(), batch_size)
+    return list(Member.objects.filter(member_id__gte=first).order_by('member_id').values_list('member_id', flat=True))
+
+
+def seed_staff(count, rng, admin_password=None, batch_size=5000):
+    """
+    Inserts ``count`` staff members. With ``admin_password`` the first of
+    them is an administrator logging in with it, otherwise all are
+    librarians.
+    """
+    first = _next_number(Staff, 'staff_id')
+    credential = passwords.hash_password(SEED_PASSWORD)
+    admin_credential = passwords.hash_password(admin_password) if admin_password else None
+    _bulk_insert(Staff, (
+        Staff(
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            role='Administrator' if admin_credential and number == first else 'Librarian',
+            contact=f'555{number % 10000000:07d}',
+            email=f'seed-staff-{number}@example.com',
+            credential=admin_credential if admin_credential and number == first else credential,
+        )
+        for number in range(first, first + count)
+    ), batch_size)
+
+
+def seed_loans(count, rng, book_ids, member_ids, days, batch_size=5000):
+    """
+    Inserts ``count`` loans over the last ``days`` days. Returns the ids of
+    the books that are out on loan.
+    """
+    today = timezone.localdate()
+    recent = today - LOAN_PERIOD
+    on_loan = set()
+
+    def loans():
+        for _ in range(count):
+            book_id = rng.choice(book_ids)
+            loan_date = _random_date(rng, today, days)
+            due_date = loan_date + LOAN_PERIOD
+            if loan_date > recent and book_id not in on_loan:
+                on_loan.add(book_id)
+                return_date = None
+            else:
+                return_date = min(today, loan_date + timedelta(days=rng.randint(1, 2 * LOAN_PERIOD.days)))
+            yield Loan(
+                book_id=book_id,
+                member_id=rng.choice(member_ids),
+                loan_date=loan_date,
+                due_date=due_date,
+                return_date=return_date,
+                fine=fine_for(due_date, return_date) if return_date else 0,
+            )
+
+    _bulk_insert(Loan, loans(), batch_size)
+    return sorted(on_loan)
+
+
+def seed_reservations(count, rng, book_ids, on_loan, member_ids, days, batch_size=5000):
+    """
+    Inserts ``count`` reservations over the last ``days`` days. Recent ones
+    queue for the books in ``on_loan``.
+    """
+    today = timezone.localdate()
+    recent = today - LOAN_PERIOD
+    statuses, weights = zip(*CLOSED_RESERVATION_STATUSES)
+
+    def reservations():
+        for _ in range(count):
+            reservation_date = _random_date(rng, today, days)
+            if reservation_date > recent and on_loan:
+                book_id, status = rng.choice(on_loan), 'pending'
+            else:
+                book_id, status = rng.choice(book_ids), rng.choices(statuses, weights)[0]
+            yield Reservation(
+                book_id=book_id,
+                member_id=rng.choice(member_ids),
+                reservation_date=reservation_date,
+                status=status,
+            )
+
+    _bulk_insert(Reservation, reservations(), batch_size)
+
+
+def seed(books, members, loans, reservations, staff=0, years=3, batch_size=5000, seed=0, admin_password=None):
+    """
+    Generates a library of the given size. Returns the number of rows
+    created per model. See seed_staff for ``admin_password``.
+
+    Loans and reservations are assigned to the new books and members only.
+    """
+    if (loans or reservations) and not (books and members):
+        raise ValueError('Loans and reservations need new books and members')
+    rng = random.Random(seed)
+    days = max(1, round(years * 365))
+
+    book_ids = seed_books(books, rng, batch_size)
+    member_ids = seed_members(members, rng, days, batch_size)
+    seed_staff(staff, rng, admin_password, batch_size)
+    on_loan = seed_loans(loans, rng, book_ids, member_ids, days, batch_size) if loans else []
+    if reservations:
+        seed_reservations(reservations, rng, book_ids, on_loan, member_ids, days, batch_size)
+
+    counters.reconcile(fix=True)
+    if book_ids:
+        # Every open loan took one of its book's copies
+        Book.objects.filter(book_id__gte=book_ids[0]).update(availability=F('availability') - F('active_loans'))
+    invalidate_catalogue()
+    return {'books': books, 'members': members, 'staff': staff, 'loans': loans, 'reservations': reservations}
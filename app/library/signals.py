@@ -0,0 +1,41 @@
+"""
+This module contains signal handlers for the library management system.
+"""
+
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .catalogue_cache import invalidate_catalogue
+from .metrics import install_query_recorder
+from .models import Book
+from .profiling import install_statement_recorder
+from .search import index_book, uses_token_index
+
+
+@receiver(post_save, sender=Book)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """
+    Re-indexes a book's title and author for catalogue search after it is saved.
+    Deleted books lose their tokens through the cascading foreign key.
+    """
+    if update_fields is not None and not {'title', 'author'} & set(update_fields):
+        return
+    if uses_token_index():
+        index_book(instance)
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+def invalidate_catalogue_cache(sender, **kwargs):
+    """
+    Invalidates cached catalogue pages when a book is added, edited or deleted.
+    """
+    invalidate_catalogue()
+
+
+# Counts the queries of each request for /metrics
+connection_created.connect(install_query_recorder)
+
+# Records the statements of profiled requests
+connection_created.connect(install_statement_recorder)
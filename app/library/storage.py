@@ -0,0 +1,21 @@
+"""
+This module contains the static files storage of the library management system.
+"""
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class StaticStorage(CompressedManifestStaticFilesStorage):
+    """
+    WhiteNoise's hashed and compressed storage (see STORAGES in settings).
+
+    Until collectstatic has written a manifest, as in the test suite, the
+    benchmarks or a fresh checkout, files are referenced by their plain
+    names instead of failing on a missing manifest entry. Once a manifest
+    exists every referenced file must be in it.
+    """
+
+    def stored_name(self, name):
+        if not self.hashed_files:
+            return name
+        return super().stored_name(name)
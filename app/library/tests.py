@@ -1,3 +1,1934 @@
-from django.test import TestCase
+"""
+Tests for the library management system.
 
-# Create your tests here.
+Run with ``DB_ENGINE=sqlite python manage.py test library`` when no MySQL
+server is available.
+"""
+
+import csv
+import gzip
+import itertools
+import json
+import os
+import re
+import runpy
+import tempfile
+import threading
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import brotli
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.templatetags.static import static
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from prometheus_client import mmap_dict
+
+from . import (
+    archive, benchmarks, catalogue_cache, circulation, counters, exports, fines, metrics, passwords, profiling,
+    reservations, routers, seeding, throttling
+)
+from .models import ArchivedLoan, Book, BookSearchToken, Loan, Member, Reservation, Staff
+from .pagination import encode_cursor
+from .search import search_books
+from .urls import urlpatterns
+
+
+def make_member(index=0, **kwargs):
+    """
+    Creates a member with a unique email address.
+    """
+    defaults = {
+        'first_name': f'Member{index}',
+        'last_name': 'Test',
+        'email': f'member{index}@test.ca',
+        'date_joined': date(2025, 1, 1),
+        'credential': 'not-a-real-hash',
+    }
+    defaults.update(kwargs)
+    return Member.objects.create(**defaults)
+
+
+def make_book(index=0, **kwargs):
+    """
+    Creates a book with a unique ISBN.
+    """
+    defaults = {
+        'title': f'Book {index}',
+        'author': f'Author {index}',
+        'isbn': f'{9780000000000 + index}',
+        'availability': 1,
+        'genre': 'Fiction',
+    }
+    defaults.update(kwargs)
+    return Book.objects.create(**defaults)
+
+
+def make_staff(index=0, role='Librarian', **kwargs):
+    """
+    Creates a staff member with a unique email address.
+    """
+    defaults = {
+        'first_name': f'Staff{index}',
+        'last_name': 'Test',
+        'role': role,
+        'email': f'staff{index}@test.ca',
+        'credential': 'not-a-real-hash',
+    }
+    defaults.update(kwargs)
+    return Staff.objects.create(**defaults)
+
+
+def make_loan(member, book, loan_date=None, **kwargs):
+    """
+    Creates a two week loan of the given book and keeps the counters in step.
+    """
+    loan_date = loan_date or date(2025, 1, 1)
+    loan = Loan.objects.create(
+        member=member,
+        book=book,
+        loan_date=loan_date,
+        due_date=loan_date + timedelta(days=14),
+        **kwargs
+    )
+    if loan.return_date is None:
+        counters.adjust(book.pk, member.pk, active_loans=1)
+    return loan
+
+
+def make_reservation(member, book, reservation_date=None, status='pending'):
+    """
+    Creates a reservation of the given book and keeps the counters in step.
+    """
+    reservation = Reservation.objects.create(
+        member=member,
+        book=book,
+        reservation_date=reservation_date or date(2025, 1, 1),
+        status=status
+    )
+    if status in counters.OPEN_RESERVATION_STATUSES:
+        counters.adjust(book.pk, member.pk, pending_reservations=1)
+    return reservation
+
+
+def metric_sample(name, **labels):
+    """
+    Returns the value of a Prometheus sample of this process, 0 if unset.
+    """
+    return metrics.REGISTRY.get_sample_value(name, labels) or 0
+
+
+class LibraryTestCase(TestCase):
+    """
+    Base test case with helpers to log in the way login_view does.
+    The cache is cleared before each test so cached pages and login
+    throttles do not leak between tests.
+    """
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def save_session(self, session):
+        # Cookie-based sessions change their key whenever they are saved
+        session.save()
+        self.client.cookies[settings.SESSION_COOKIE_NAME] = session.session_key
+
+    def login_member(self, member):
+        session = self.client.session
+        session['member_id'] = member.member_id
+        session['is_authenticated'] = True
+        session['user_name'] = f'{member.first_name} {member.last_name}'
+        session['is_staff'] = False
+        session['is_admin'] = False
+        self.save_session(session)
+
+    def login_staff(self, staff):
+        session = self.client.session
+        session['staff_id'] = staff.staff_id
+        session['is_authenticated'] = True
+        session['user_name'] = f'{staff.first_name} {staff.last_name}[{staff.role}]'
+        session['is_staff'] = True
+        session['is_admin'] = staff.role == 'Administrator'
+        self.save_session(session)
+
+
+class QueryBudgetTestCase(LibraryTestCase):
+    """
+    Base test case for asserting that a view stays within its query budget.
+
+    A budget is the maximum number of queries a request may run. Each view is
+    rendered twice with a different number of rows, so a query that runs once
+    per row (N+1) breaks the budget even when the budget is generous.
+    """
+
+    def assertWithinQueryBudget(self, url, budget, data=None):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        executed = len(context.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{i}. {query["sql"]}' for i, query in enumerate(context.captured_queries, start=1)
+            )
+            self.fail(f'{url} ran {executed} queries, budget is {budget}:\n{queries}')
+        return response
+
+    def assertConstantQueries(self, url, budget, add_rows):
+        """
+        Renders ``url`` before and after ``add_rows()`` and checks both
+        requests run the same number of queries within ``budget``.
+        """
+        with CaptureQueriesContext(connection) as before:
+            self.assertWithinQueryBudget(url, budget)
+        add_rows()
+        with CaptureQueriesContext(connection) as after:
+            self.assertWithinQueryBudget(url, budget)
+        self.assertEqual(
+            len(before.captured_queries),
+            len(after.captured_queries),
+            f'{url} query count grows with the number of rows'
+        )
+
+
+class ViewQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Query budgets for the list views. Session access counts towards the budget.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = make_staff(role='Administrator')
+        self.member = make_member()
+        self.books = [make_book(i) for i in range(3)]
+        for book in self.books:
+            make_loan(self.member, book)
+            make_reservation(self.member, book)
+
+    def add_rows(self, count=10):
+        def add():
+            start = Book.objects.count()
+            for i in range(start, start + count):
+                member = make_member(i + 1)
+                book = make_book(i)
+                make_loan(member, book)
+                make_loan(self.member, book)
+                make_reservation(member, book)
+                make_reservation(self.member, book)
+                make_staff(i + 1)
+        return add
+
+    def test_book_list(self):
+        self.assertConstantQueries(reverse('book_list'), 1, self.add_rows())
+
+    def test_book_list_as_staff(self):
+        self.login_staff(self.staff)
+        self.assertConstantQueries(reverse('book_list'), 2, self.add_rows())
+
+    def test_book_list_search(self):
+        self.assertWithinQueryBudget(reverse('book_list'), 1, {'q': 'Book'})
+
+    def test_my_loans(self):
+        self.login_member(self.member)
+        self.assertConstantQueries(reverse('my_loans'), 3, self.add_rows())
+
+    def test_my_reservations(self):
+        self.login_member(self.member)
+        self.assertConstantQueries(reverse('my_reservations'), 3, self.add_rows())
+
+    def test_manage_loans(self):
+        self.login_staff(self.staff)
+        self.assertConstantQueries(reverse('manage_loans'), 2, self.add_rows())
+
+    def test_manage_reservations(self):
+        self.login_staff(self.staff)
+        self.assertConstantQueries(reverse('manage_reservations'), 2, self.add_rows())
+
+    def test_manage_members(self):
+        self.login_staff(self.staff)
+        self.assertConstantQueries(reverse('manage_members'), 2, self.add_rows())
+
+    def test_manage_staff(self):
+        self.login_staff(self.staff)
+        self.assertConstantQueries(reverse('manage_staff'), 2, self.add_rows())
+
+    def test_manage_loans_renders_related_fields(self):
+        self.login_staff(self.staff)
+        response = self.assertWithinQueryBudget(reverse('manage_loans'), 2)
+        self.assertContains(response, self.member.email)
+        self.assertContains(response, self.books[0].title)
+
+
+class KeysetPaginationTests(LibraryTestCase):
+    """
+    Tests for cursor pagination of the catalogue and management tables.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = make_staff(role='Administrator')
+        self.member = make_member()
+        self.books = [make_book(i) for i in range(7)]
+        # Several loans share a loan date so the primary key breaks ties
+        self.loans = [
+            make_loan(self.member, book, loan_date=date(2025, 1, 1 + i // 2))
+            for i, book in enumerate(self.books)
+        ]
+
+    def walk(self, url, key, page_size=3):
+        """
+        Follows next cursors to the end, then previous cursors back to the start.
+        Returns the rows seen going forwards and backwards.
+        """
+        forwards, pages = [], []
+        cursor = None
+        while True:
+            response = self.client.get(url, {'page_size': page_size, 'cursor': cursor or ''})
+            page = response.context[key]
+            self.assertLessEqual(len(page), page_size)
+            pages.append(page)
+            forwards.extend(page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        backwards = list(pages[-1])
+        cursor = pages[-1].previous_cursor
+        while cursor:
+            page = self.client.get(url, {'page_size': page_size, 'cursor': cursor}).context[key]
+            backwards = list(page) + backwards
+            cursor = page.previous_cursor
+        return forwards, backwards
+
+    def test_book_list_pages_in_book_id_order(self):
+        forwards, backwards = self.walk(reverse('book_list'), 'books')
+        self.assertEqual(forwards, self.books)
+        self.assertEqual(backwards, self.books)
+
+    def test_manage_loans_pages_by_loan_date_descending(self):
+        self.login_staff(self.staff)
+        expected = sorted(self.loans, key=lambda loan: (loan.loan_date, loan.loan_id), reverse=True)
+        forwards, backwards = self.walk(reverse('manage_loans'), 'loans', page_size=2)
+        self.assertEqual(forwards, expected)
+        self.assertEqual(backwards, expected)
+
+    def test_first_page_has_no_previous_cursor(self):
+        page = self.client.get(reverse('book_list'), {'page_size': 3}).context['books']
+        self.assertFalse(page.has_previous)
+        self.assertTrue(page.has_next)
+
+    def test_search_is_kept_when_paging(self):
+        response = self.client.get(reverse('book_list'), {'q': 'Book', 'page_size': 3})
+        self.assertContains(response, 'q=Book&amp;page_size=3&amp;cursor=')
+
+    def test_cursor_with_wrong_value_types_returns_first_page(self):
+        for values in (['abc'], [{'x': 1}], [None], [[1]]):
+            page = self.client.get(reverse('book_list'), {'cursor': encode_cursor('next', values)}).context['books']
+            self.assertFalse(page.has_previous)
+        self.login_staff(self.staff)
+        cursor = encode_cursor('next', ['notadate', 1])
+        self.assertEqual(self.client.get(reverse('manage_loans'), {'cursor': cursor}).status_code, 200)
+
+    def test_malformed_cursor_returns_first_page(self):
+        page = self.client.get(reverse('book_list'), {'cursor': 'not-a-cursor', 'page_size': 3}).context['books']
+        self.assertEqual(list(page), self.books[:3])
+
+    def test_page_size_is_capped(self):
+        with self.settings(MAX_PAGE_SIZE=2):
+            page = self.client.get(reverse('book_list'), {'page_size': 100}).context['books']
+        self.assertEqual(len(page), 2)
+
+    def test_pages_do_not_count_or_offset(self):
+        first = self.client.get(reverse('book_list'), {'page_size': 3}).context['books']
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('book_list'), {'page_size': 3, 'cursor': first.next_cursor})
+        for query in context.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+
+@override_settings(SEARCH_BACKEND='tokens')
+class CatalogueSearchTests(LibraryTestCase):
+    """
+    Tests for catalogue search through the token index.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.hobbit = make_book(1, title='The Hobbit', author='J. R. R. Tolkien', isbn='9780261102217')
+        self.rings = make_book(2, title='The Lord of the Rings', author='J. R. R. Tolkien', isbn='9780261103252')
+        self.dune = make_book(3, title='Dune', author='Frank Herbert', isbn='9780441172719')
+
+    def search(self, query, **params):
+        return list(self.client.get(reverse('book_list'), {'q': query, **params}).context['books'])
+
+    def test_matches_title_and_author_words(self):
+        self.assertEqual(self.search('dune'), [self.dune])
+        self.assertEqual(self.search('herbert'), [self.dune])
+
+    def test_matches_word_prefixes(self):
+        self.assertEqual(self.search('tolk'), [self.hobbit, self.rings])
+
+    def test_ranks_books_matching_more_words_first(self):
+        self.assertEqual(self.search('rings tolkien'), [self.rings, self.hobbit])
+
+    def test_isbn_exact_and_prefix(self):
+        self.assertEqual(self.search('9780441172719'), [self.dune])
+        self.assertEqual(self.search('978-0261'), [self.hobbit, self.rings])
+
+    def test_numeric_title_without_isbn_match(self):
+        nineteen = make_book(4, title='1984', author='George Orwell', isbn='9780451524935')
+        self.assertEqual(self.search('1984'), [nineteen])
+
+    def test_no_match(self):
+        self.assertEqual(self.search('asimov'), [])
+
+    def test_ranked_results_paginate(self):
+        first = self.client.get(reverse('book_list'), {'q': 'rings tolkien', 'page_size': 1}).context['books']
+        second = self.client.get(
+            reverse('book_list'), {'q': 'rings tolkien', 'page_size': 1, 'cursor': first.next_cursor}
+        ).context['books']
+        self.assertEqual(list(first) + list(second), [self.rings, self.hobbit])
+        self.assertFalse(second.has_next)
+
+    def test_edit_reindexes_book(self):
+        self.dune.title = 'Children of Dune'
+        self.dune.save()
+        self.assertEqual(self.search('children'), [self.dune])
+
+    def test_delete_removes_tokens(self):
+        self.dune.delete()
+        self.assertFalse(BookSearchToken.objects.filter(token='dune').exists())
+
+    def test_rebuild_search_index(self):
+        BookSearchToken.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search('hobbit'), [self.hobbit])
+
+    def test_fulltext_backend_uses_match_against(self):
+        with self.settings(SEARCH_BACKEND='fulltext'):
+            books, ordering = search_books(Book.objects.all(), 'hobbit')
+        self.assertIn('MATCH (books.title, books.author) AGAINST', str(books.query))
+        self.assertEqual(ordering, ['-relevance', 'book_id'])
+
+
+class ConcurrentCirculationTests(TransactionTestCase):
+    """
+    Stress tests that borrow and return one book from many threads at once.
+    """
+
+    THREADS = 16
+
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(availability=5)
+        self.members = [make_member(i) for i in range(self.THREADS)]
+
+    def run_concurrently(self, func, args_list):
+        """
+        Calls ``func`` once per item of ``args_list``, each in its own thread,
+        all released at the same time. Returns the results and exceptions.
+        """
+        barrier = threading.Barrier(len(args_list))
+        results = [None] * len(args_list)
+
+        def worker(index, args):
+            try:
+                barrier.wait()
+                results[index] = func(*args)
+            except Exception as exc:
+                results[index] = exc
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i, args)) for i, args in enumerate(args_list)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_borrows_never_oversell(self):
+        results = self.run_concurrently(circulation.borrow, [(member, self.book) for member in self.members])
+
+        loans = [result for result in results if isinstance(result, Loan)]
+        errors = [result for result in results if not isinstance(result, (Loan, circulation.BookUnavailable))]
+        self.assertEqual(errors, [])
+        self.assertEqual(len(loans), 5)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability, 0)
+        self.assertEqual(Loan.objects.filter(book=self.book).count(), 5)
+
+    def test_concurrent_returns_of_one_loan_return_once(self):
+        loan = circulation.borrow(self.members[0], self.book)
+        results = self.run_concurrently(circulation.return_loan, [(loan,)] * self.THREADS)
+
+        returned = [result for result in results if isinstance(result, Loan)]
+        errors = [result for result in results if not isinstance(result, (Loan, circulation.AlreadyReturned))]
+        self.assertEqual(errors, [])
+        self.assertEqual(len(returned), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability, 5)
+
+    def test_borrow_and_return_keep_copies_balanced(self):
+        loans = [circulation.borrow(member, self.book) for member in self.members[:5]]
+        args = [(circulation.return_loan, (loan,)) for loan in loans]
+        args += [(circulation.borrow, (member, self.book)) for member in self.members[5:]]
+        self.run_concurrently(lambda func, func_args: func(*func_args), args)
+
+        self.book.refresh_from_db()
+        open_loans = Loan.objects.filter(book=self.book, return_date__isnull=True).count()
+        self.assertGreaterEqual(self.book.availability, 0)
+        self.assertEqual(self.book.availability + open_loans, 5)
+
+
+class CirculationViewTests(LibraryTestCase):
+    """
+    Tests for the borrow, return and fulfil views.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.member = make_member()
+        self.book = make_book(availability=1)
+        self.login_member(self.member)
+
+    def test_borrow_last_copy(self):
+        self.client.get(reverse('borrow_book', args=[self.book.book_id]))
+        response = self.client.get(reverse('borrow_book', args=[self.book.book_id]), follow=True)
+        self.assertContains(response, 'Book is not available for borrowing')
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability, 0)
+        self.assertEqual(Loan.objects.count(), 1)
+
+    def test_return_calculates_fine_once(self):
+        loan = make_loan(self.member, self.book, loan_date=timezone.localdate() - timedelta(days=17))
+        self.client.get(reverse('return_book', args=[loan.loan_id]))
+        response = self.client.get(reverse('return_book', args=[loan.loan_id]), follow=True)
+        self.assertContains(response, 'This book has already been returned')
+        loan.refresh_from_db()
+        self.book.refresh_from_db()
+        self.assertEqual(loan.fine, Decimal('1.50'))
+        self.assertEqual(self.book.availability, 2)
+
+    def test_fulfill_unavailable_reservation_stays_pending(self):
+        self.book.availability = 0
+        self.book.save()
+        reservation = make_reservation(self.member, self.book)
+        self.client.get(reverse('fulfill_reservation', args=[reservation.reservation_id]))
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.status, 'pending')
+        self.assertFalse(Loan.objects.exists())
+
+
+@override_settings(BCRYPT_ROUNDS=4)
+class PasswordHashingTests(LibraryTestCase):
+    """
+    Tests for bcrypt hashing and rehash on login.
+    """
+
+    def test_hash_and_check(self):
+        hashed = passwords.hash_password('secret')
+        self.assertTrue(passwords.check_password('secret', hashed))
+        self.assertFalse(passwords.check_password('wrong', hashed))
+        self.assertFalse(passwords.needs_rehash(hashed))
+
+    def test_needs_rehash_when_cost_rises(self):
+        hashed = passwords.hash_password('secret')
+        with self.settings(BCRYPT_ROUNDS=5):
+            self.assertTrue(passwords.needs_rehash(hashed))
+
+    def test_higher_cost_is_kept(self):
+        with self.settings(BCRYPT_ROUNDS=5):
+            hashed = passwords.hash_password('secret')
+        self.assertFalse(passwords.needs_rehash(hashed))
+
+    def test_calibrated_cost_respects_minimum(self):
+        with self.settings(BCRYPT_ROUNDS=0, BCRYPT_TARGET_MS=1, BCRYPT_MIN_ROUNDS=6):
+            self.assertEqual(passwords.get_rounds(), 6)
+
+    def test_hash_latency_is_recorded(self):
+        checks = metric_sample('library_password_hash_duration_seconds_count', operation='check')
+        hash_seconds = metric_sample('library_password_hash_duration_seconds_sum', operation='hash')
+        passwords.check_password('secret', passwords.hash_password('secret'))
+        self.assertEqual(metric_sample('library_password_hash_duration_seconds_count', operation='check'), checks + 1)
+        self.assertGreater(metric_sample('library_password_hash_duration_seconds_sum', operation='hash'), hash_seconds)
+
+    def test_login_rehashes_credential_with_old_cost(self):
+        member = make_member(credential=passwords.hash_password('secret'))
+        with self.settings(BCRYPT_ROUNDS=5):
+            response = self.client.post(reverse('login'), {'email': member.email, 'password': 'secret'})
+        self.assertRedirects(response, reverse('home'))
+        member.refresh_from_db()
+        self.assertTrue(member.credential.startswith('$2b$05$'))
+        self.assertTrue(passwords.check_password('secret', member.credential))
+
+    def test_failed_login_keeps_credential(self):
+        with self.settings(BCRYPT_ROUNDS=5):
+            member = make_member(credential=passwords.hash_password('secret'))
+        credential = member.credential
+        response = self.client.post(reverse('login'), {'email': member.email, 'password': 'wrong'})
+        self.assertTrue(response.context['login_failed'])
+        member.refresh_from_db()
+        self.assertEqual(member.credential, credential)
+
+    def test_register_hashes_with_current_cost(self):
+        self.client.post(reverse('register'), {
+            'first_name': 'New', 'last_name': 'Member', 'email': 'new@test.ca',
+            'password': 'secret', 'address': '', 'contact': '',
+        })
+        member = Member.objects.get(email='new@test.ca')
+        self.assertTrue(member.credential.startswith('$2b$04$'))
+
+
+@override_settings(
+    BCRYPT_ROUNDS=4,
+    LOGIN_THROTTLE_IP_BURST=4,
+    LOGIN_THROTTLE_IP_RATE=60,
+    LOGIN_THROTTLE_EMAIL_BURST=2,
+    LOGIN_THROTTLE_EMAIL_RATE=1,
+)
+class LoginThrottleTests(LibraryTestCase):
+    """
+    Tests for the login token buckets.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.member = make_member(credential=passwords.hash_password('secret'))
+
+    def login(self, email=None, password='wrong', ip='10.0.0.1'):
+        return self.client.post(
+            reverse('login'), {'email': email or self.member.email, 'password': password}, REMOTE_ADDR=ip
+        )
+
+    def test_rejects_email_over_limit_before_hashing(self):
+        self.login()
+        self.login()
+        checks = metric_sample('library_password_hash_duration_seconds_count', operation='check')
+        rejected = metric_sample('library_login_throttled_total', scope='email')
+        response = self.login(password='secret')
+        self.assertEqual(response.status_code, 429)
+        self.assertContains(response, 'Too many login attempts', status_code=429)
+        self.assertEqual(metric_sample('library_password_hash_duration_seconds_count', operation='check'), checks)
+        self.assertEqual(metric_sample('library_login_throttled_total', scope='email'), rejected + 1)
+
+    def test_rejects_ip_over_limit(self):
+        for i in range(4):
+            self.assertEqual(self.login(email=f'unknown{i}@test.ca').status_code, 200)
+        self.assertEqual(self.login(email='unknown9@test.ca').status_code, 429)
+        self.assertEqual(self.login(email='unknown9@test.ca', ip='10.0.0.2').status_code, 200)
+
+    def test_bucket_refills(self):
+        start = 1_000_000.0
+        # The counters expire with the cache entries
+        with mock.patch('time.time', return_value=start):
+            self.login()
+            self.login()
+            self.assertEqual(self.login().status_code, 429)
+        # Two email attempts at one per minute take two minutes to come back
+        with mock.patch('time.time', return_value=start + 121):
+            response = self.login(password='secret')
+        self.assertRedirects(response, reverse('home'))
+
+    def test_email_bucket_ignores_case(self):
+        self.login(email=self.member.email.upper())
+        self.login()
+        self.assertEqual(self.login().status_code, 429)
+
+    @override_settings(USE_X_FORWARDED_FOR=True, TRUSTED_PROXY_COUNT=1)
+    def test_client_ip_from_forwarded_header(self):
+        # The client forges a new leftmost entry every time; the proxy appends the real address
+        for i in range(4):
+            self.client.post(
+                reverse('login'), {'email': f'unknown{i}@test.ca', 'password': 'x'},
+                HTTP_X_FORWARDED_FOR=f'198.51.100.{i}, 203.0.113.7'
+            )
+        response = self.client.post(
+            reverse('login'), {'email': 'other@test.ca', 'password': 'x'},
+            HTTP_X_FORWARDED_FOR='198.51.100.9, 203.0.113.7'
+        )
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(USE_X_FORWARDED_FOR=True, TRUSTED_PROXY_COUNT=2)
+    def test_client_ip_behind_several_proxies(self):
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='198.51.100.1, 203.0.113.7, 10.0.0.5')
+        self.assertEqual(throttling.get_client_ip(request), '203.0.113.7')
+        request = RequestFactory().get('/', HTTP_X_FORWARDED_FOR='10.0.0.5', REMOTE_ADDR='10.0.0.9')
+        self.assertEqual(throttling.get_client_ip(request), '10.0.0.9')
+
+    def test_concurrent_attempts_share_one_count(self):
+        results = []
+        barrier = threading.Barrier(8)
+
+        def attempt():
+            barrier.wait()
+            results.append(throttling._take('login-throttle:test', 4, 60))
+
+        threads = [threading.Thread(target=attempt) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(True), 4)
+
+
+class SessionModeTests(LibraryTestCase):
+    """
+    Tests that authenticated page views do not read sessions from the
+    database outside the 'db' session mode.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.member = make_member()
+
+    def session_queries(self):
+        self.login_member(self.member)
+        self.client.get(reverse('my_loans'))
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse('my_loans'))
+        self.assertEqual(response.status_code, 200)
+        return [query for query in context.captured_queries if 'django_session' in query['sql']]
+
+    def test_session_modes(self):
+        for mode, engine in settings.SESSION_ENGINES.items():
+            with self.subTest(mode=mode), self.settings(SESSION_ENGINE=engine):
+                # SessionMiddleware picks its engine when the client's handler loads
+                self.client = Client()
+                self.assertEqual(len(self.session_queries()), 1 if mode == 'db' else 0)
+
+    def test_cached_sessions_need_a_shared_cache(self):
+        path = os.path.join(settings.BASE_DIR, 'library_management_system', 'settings.py')
+        local = {'CACHE_BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+        with mock.patch.dict(os.environ, {**local, 'SESSION_MODE': 'cached_db'}):
+            with self.assertRaises(ImproperlyConfigured):
+                runpy.run_path(path)
+        with mock.patch.dict(os.environ, local):
+            os.environ.pop('SESSION_MODE', None)
+            self.assertEqual(runpy.run_path(path)['SESSION_MODE'], 'db')
+        shared = {'CACHE_BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache'}
+        with mock.patch.dict(os.environ, shared):
+            os.environ.pop('SESSION_MODE', None)
+            self.assertEqual(runpy.run_path(path)['SESSION_MODE'], 'cached_db')
+
+    def test_only_cross_pod_caches_are_shared(self):
+        path = os.path.join(settings.BASE_DIR, 'library_management_system', 'settings.py')
+        for backend, shared in [
+            ('django.core.cache.backends.filebased.FileBasedCache', False),
+            ('django.core.cache.backends.locmem.LocMemCache', False),
+            ('django.core.cache.backends.redis.RedisCache', True),
+        ]:
+            with mock.patch.dict(os.environ, {'CACHE_BACKEND': backend}):
+                os.environ.pop('SESSION_MODE', None)
+                self.assertEqual(runpy.run_path(path)['SHARED_CACHE'], shared)
+
+    def test_logout_clears_signed_cookie_session(self):
+        with self.settings(SESSION_ENGINE=settings.SESSION_ENGINES['signed_cookies']):
+            self.client = Client()
+            self.login_member(self.member)
+            self.client.get(reverse('logout'))
+            response = self.client.get(reverse('my_loans'))
+        self.assertRedirects(response, reverse('login'))
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.db')
+    def test_purge_sessions_deletes_only_expired(self):
+        from django.contrib.sessions.backends.db import SessionStore
+        from django.contrib.sessions.models import Session
+
+        for _ in range(5):
+            session = SessionStore()
+            session.set_expiry(-60)
+            session.save()
+        live = SessionStore()
+        live.save()
+        call_command('purge_sessions', '--batch-size', '2', stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), [live.session_key])
+
+
+# The test process is the only one using its local-memory cache
+@override_settings(SHARED_CACHE=True)
+class CatalogueCacheTests(QueryBudgetTestCase):
+    """
+    Tests for the versioned catalogue page cache.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(availability=1)
+        self.member = make_member()
+        self.staff = make_staff()
+
+    def test_repeat_views_are_served_from_cache(self):
+        self.client.get(reverse('book_list'))
+        response = self.assertWithinQueryBudget(reverse('book_list'), 0)
+        self.assertContains(response, self.book.title)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_pages_are_not_cached_in_a_per_process_cache(self):
+        response = self.client.get(reverse('book_list'))
+        self.assertNotIn('ETag', response.headers)
+        # Another worker's write that this process's cache never hears of
+        Book.objects.filter(pk=self.book.pk).update(title='Renamed')
+        self.assertContains(self.client.get(reverse('book_list')), 'Renamed')
+
+    def test_query_string_is_part_of_the_key(self):
+        make_book(1, title='Dune')
+        self.client.get(reverse('book_list'), {'q': 'Dune'})
+        response = self.client.get(reverse('book_list'), {'q': 'Book'})
+        self.assertContains(response, self.book.title)
+        self.assertNotContains(response, 'Dune')
+
+    def test_values_cannot_forge_another_query_key(self):
+        self.assertNotEqual(
+            catalogue_cache.page_key({'q': 'a&cursor=b'}, 'anonymous'),
+            catalogue_cache.page_key({'q': 'a', 'cursor': 'b&cursor='}, 'anonymous')
+        )
+
+    def test_edit_invalidates_cache(self):
+        self.client.get(reverse('book_list'))
+        self.book.title = 'Renamed'
+        self.book.save()
+        self.assertContains(self.client.get(reverse('book_list')), 'Renamed')
+
+    def test_delete_invalidates_cache(self):
+        self.client.get(reverse('book_list'))
+        self.book.delete()
+        self.assertContains(self.client.get(reverse('book_list')), 'No books found')
+
+    def test_borrow_invalidates_cache(self):
+        self.login_member(self.member)
+        self.assertContains(self.client.get(reverse('book_list')), 'Borrow</a>')
+        self.client.get(reverse('borrow_book', args=[self.book.book_id]))
+        response = self.client.get(reverse('book_list'))
+        self.assertContains(response, 'Available: 0')
+        self.assertContains(response, 'Reserve</a>')
+
+    def test_roles_get_their_own_pages(self):
+        self.assertContains(self.client.get(reverse('book_list')), 'Login to Borrow')
+        self.login_member(self.member)
+        self.assertNotContains(self.client.get(reverse('book_list')), 'Login to Borrow')
+
+    def test_staff_get_one_shared_manage_modal(self):
+        make_book(1)
+        self.login_staff(self.staff)
+        response = self.client.get(reverse('book_list'))
+        self.assertContains(response, 'id="bookManageModal"', count=1)
+        self.assertContains(response, f'data-book-url="{reverse("book_manage", args=[self.book.book_id])}"')
+        self.assertNotContains(response, 'name="editTitle"')
+
+    def test_book_manage_form(self):
+        self.login_staff(self.staff)
+        response = self.client.get(reverse('book_manage', args=[self.book.book_id]))
+        self.assertContains(response, f'action="{reverse("edit_book", args=[self.book.book_id])}"')
+        self.assertContains(response, f'href="{reverse("delete_book", args=[self.book.book_id])}"')
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+
+    def test_book_manage_form_is_staff_only(self):
+        self.login_member(self.member)
+        self.assertEqual(self.client.get(reverse('book_manage', args=[self.book.book_id])).status_code, 403)
+
+    def test_version_survives_cache_eviction(self):
+        version = catalogue_cache.get_catalogue_version()
+        cache.delete(catalogue_cache.VERSION_KEY)
+        self.assertNotEqual(catalogue_cache.get_catalogue_version(), version)
+
+
+@override_settings(SEARCH_BACKEND='tokens')
+class ImportBooksTests(LibraryTestCase):
+    """
+    Tests for the import_books management command.
+    """
+
+    CSV_HEADER = 'title,author,publisher,year,isbn,genre,availability\n'
+
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def run_import(self, path, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_books', path, *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_imports_csv_in_batches(self):
+        rows = ''.join(f'Title {i},Author {i},,2001,{9781000000000 + i},Fiction,2\n' for i in range(25))
+        path = self.write('books.csv', self.CSV_HEADER + rows)
+        with CaptureQueriesContext(connection) as context:
+            stdout, _ = self.run_import(path, '--batch-size', '10')
+        self.assertIn('25 created', stdout)
+        self.assertEqual(Book.objects.count(), 25)
+        inserts = [q for q in context.captured_queries if q['sql'].startswith('INSERT INTO "books"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(Book.objects.get(isbn='9781000000003').availability, 2)
+
+    def test_rejects_invalid_rows_like_add_book(self):
+        path = self.write('books.csv', self.CSV_HEADER + (
+            'Good,Author,,2001,9781000000001,,\n'
+            'Bad ISBN,Author,,2001,97810000X0002,,\n'
+            'Bad year,Author,,20x1,9781000000003,,\n'
+            'Superscript year,Author,,200²,9781000000004,,\n'
+            'Superscript copies,Author,,2001,9781000000005,,²\n'
+        ))
+        stdout, stderr = self.run_import(path)
+        self.assertIn('1 created', stdout)
+        self.assertIn('4 invalid', stdout)
+        self.assertIn('Line 2: Invalid ISBN', stderr)
+        self.assertIn('Line 3: Invalid year of publish', stderr)
+        self.assertIn('Line 4: Invalid year of publish', stderr)
+        self.assertIn('Line 5: Invalid availability', stderr)
+
+    def test_skips_existing_and_repeated_isbns(self):
+        make_book(isbn='9781000000001', title='Existing')
+        path = self.write('books.csv', self.CSV_HEADER + (
+            'New,Author,,2001,978-1000000001,,\n'
+            'Twice,Author,,2001,9781000000002,,\n'
+            'Twice again,Author,,2001,9781000000002,,\n'
+        ))
+        stdout, _ = self.run_import(path)
+        self.assertIn('1 created', stdout)
+        self.assertIn('2 duplicates skipped', stdout)
+        self.assertEqual(Book.objects.get(isbn='9781000000001').title, 'Existing')
+
+    def test_upsert_updates_existing(self):
+        # Two copies, one of them out on loan
+        book = make_book(isbn='9781000000001', title='Old title', availability=1)
+        make_loan(make_member(), book)
+        path = self.write('books.jsonl', json.dumps(
+            {'title': 'New title', 'author': 'Author', 'year': 2001, 'isbn': '9781000000001', 'availability': 4}
+        ) + '\n')
+        stdout, _ = self.run_import(path, '--upsert')
+        self.assertIn('1 updated', stdout)
+        book = Book.objects.get(isbn='9781000000001')
+        self.assertEqual((book.title, book.availability, book.active_loans), ('New title', 1, 1))
+        self.assertTrue(BookSearchToken.objects.filter(book=book, token='new').exists())
+        self.assertFalse(BookSearchToken.objects.filter(book=book, token='old').exists())
+
+    def test_imported_books_are_searchable(self):
+        path = self.write('books.jsonl', json.dumps(
+            {'title': 'Dune', 'author': 'Frank Herbert', 'year': 1965, 'isbn': '9780441172719'}
+        ) + '\n')
+        self.client.get(reverse('book_list'), {'q': 'dune'})
+        self.run_import(path)
+        books = self.client.get(reverse('book_list'), {'q': 'dune'}).context['books']
+        self.assertEqual([book.isbn for book in books], ['9780441172719'])
+
+    def test_resume_skips_committed_lines(self):
+        rows = ''.join(f'Title {i},Author,,2001,{9781000000000 + i},,\n' for i in range(6))
+        path = self.write('books.csv', self.CSV_HEADER + rows)
+        self.write('books.csv.checkpoint', '4')
+        stdout, _ = self.run_import(path, '--resume', '--batch-size', '10')
+        self.assertIn('Imported 2 rows', stdout)
+        self.assertEqual(
+            sorted(Book.objects.values_list('title', flat=True)), ['Title 4', 'Title 5']
+        )
+        with open(path + '.checkpoint') as checkpoint:
+            self.assertEqual(checkpoint.read(), '6')
+
+
+class ExportTests(LibraryTestCase):
+    """
+    Tests for the streaming loan, reservation and member exports.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.staff = make_staff()
+        self.member = make_member(credential='secret-hash')
+        self.books = [make_book(i) for i in range(5)]
+        self.loans = [
+            make_loan(self.member, book, loan_date=date(2025, 1, 1 + i)) for i, book in enumerate(self.books)
+        ]
+        make_reservation(self.member, self.books[0])
+
+    def export(self, dataset, file_format='csv', **params):
+        response = self.client.get(reverse('export_data', args=[dataset, file_format]), params)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_loans_csv(self):
+        self.login_staff(self.staff)
+        rows = list(csv.reader(StringIO(self.export('loans'))))
+        self.assertEqual(rows[0][:5], ['loan_id', 'member_id', 'member_first_name', 'member_last_name', 'member_email'])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][6], self.books[0].title)
+
+    def test_csv_formulas_are_written_as_text(self):
+        make_member(1, first_name='=HYPERLINK("http://evil.test")', last_name='@SUM(A1)', address='-1+2')
+        self.login_staff(self.staff)
+        row = list(csv.reader(StringIO(self.export('members'))))[-1]
+        self.assertEqual(row[1:3], ['\'=HYPERLINK("http://evil.test")', "'@SUM(A1)"])
+        self.assertEqual(row[5], "'-1+2")
+        # JSON Lines is not opened by spreadsheets and keeps the raw value
+        last = json.loads(self.export('members', 'jsonl').splitlines()[-1])
+        self.assertEqual(last['first_name'], '=HYPERLINK("http://evil.test")')
+
+    @override_settings(SERVER_MODE='asgi')
+    async def test_asgi_export_streams_asynchronously(self):
+        await sync_to_async(self.login_staff)(self.staff)
+        self.async_client.cookies = self.client.cookies
+        response = await self.async_client.get(reverse('export_data', args=['loans', 'csv']))
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertEqual(len(list(csv.reader(StringIO(content)))), 6)
+
+    def test_date_range(self):
+        self.login_staff(self.staff)
+        lines = self.export('loans', 'jsonl', **{'from': '2025-01-02', 'to': '2025-01-03'}).splitlines()
+        self.assertEqual([json.loads(line)['loan_date'] for line in lines], ['2025-01-02', '2025-01-03'])
+
+    def test_members_export_has_no_credentials(self):
+        self.login_staff(self.staff)
+        content = self.export('members', 'jsonl')
+        self.assertIn(self.member.email, content)
+        self.assertNotIn('secret-hash', content)
+
+    def test_reads_in_keyset_chunks(self):
+        rows = exports.export_rows('loans', chunk_size=2)
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual([row[0] for row in rows], [loan.loan_id for loan in self.loans])
+        self.assertEqual(len(context.captured_queries), 3)
+
+    def test_members_cannot_export(self):
+        self.login_member(self.member)
+        response = self.client.get(reverse('export_data', args=['loans', 'csv']))
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_date_and_dataset(self):
+        self.login_staff(self.staff)
+        self.assertEqual(self.client.get(reverse('export_data', args=['loans', 'csv']), {'from': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_data', args=['staffs', 'csv'])).status_code, 404)
+
+    def test_export_command(self):
+        stdout = StringIO()
+        call_command('export_data', 'reservations', '--format', 'jsonl', stdout=stdout)
+        self.assertEqual(json.loads(stdout.getvalue())['status'], 'pending')
+
+
+class FineAccrualTests(LibraryTestCase):
+    """
+    Tests for the batch overdue fine accrual.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.member = make_member()
+        self.today = date(2025, 3, 1)
+        # Due 10, 3 and 0 days before today, plus one overdue loan already returned
+        self.loans = [
+            make_loan(self.member, make_book(i), loan_date=self.today - timedelta(days=14 + overdue))
+            for i, overdue in enumerate([10, 3, 0])
+        ]
+        self.returned = make_loan(
+            self.member, make_book(3), loan_date=date(2025, 1, 1), return_date=date(2025, 1, 20), fine=Decimal('2.50')
+        )
+
+    def fines(self):
+        return [Loan.objects.get(pk=loan.pk).fine for loan in self.loans]
+
+    def test_accrues_open_overdue_loans(self):
+        self.assertEqual(fines.accrue_fines(self.today), 2)
+        self.assertEqual(self.fines(), [Decimal('5.00'), Decimal('1.50'), Decimal('0.00')])
+        self.returned.refresh_from_db()
+        self.assertEqual(self.returned.fine, Decimal('2.50'))
+
+    def test_second_run_changes_nothing(self):
+        fines.accrue_fines(self.today)
+        self.assertEqual(fines.accrue_fines(self.today), 0)
+        self.assertEqual(fines.accrue_fines(self.today + timedelta(days=1)), 3)
+        self.assertEqual(self.fines(), [Decimal('5.50'), Decimal('2.00'), Decimal('0.50')])
+
+    @override_settings(FINE_GRACE_DAYS=2, FINE_MAX_AMOUNT=Decimal('3.00'))
+    def test_grace_days_and_cap(self):
+        fines.accrue_fines(self.today)
+        self.assertEqual(self.fines(), [Decimal('3.00'), Decimal('0.50'), Decimal('0.00')])
+
+    def test_zero_rate_with_cap(self):
+        fines.accrue_fines(self.today)
+        with self.settings(FINE_DAILY_RATE=Decimal('0'), FINE_MAX_AMOUNT=Decimal('3.00')):
+            self.assertEqual(fines.accrue_fines(self.today), 2)
+        self.assertEqual(self.fines(), [Decimal('0.00')] * 3)
+
+    def test_updates_in_chunks(self):
+        book = make_book(10, availability=5)
+        for i in range(5):
+            make_loan(self.member, book, loan_date=self.today - timedelta(days=20))
+        with CaptureQueriesContext(connection) as context:
+            fines.accrue_fines(self.today, chunk_size=2)
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE')]
+        # Three chunks for the five loans due on one day, one for each other overdue due date
+        self.assertEqual(len(updates), 5)
+
+    def test_return_finalizes_accrued_fine(self):
+        fines.accrue_fines(timezone.localdate())
+        loan = make_loan(self.member, make_book(11), loan_date=timezone.localdate() - timedelta(days=16))
+        fines.accrue_fines()
+        loan.refresh_from_db()
+        self.assertEqual(loan.fine, Decimal('1.00'))
+        circulation.return_loan(loan)
+        loan.refresh_from_db()
+        self.assertEqual((loan.return_date, loan.fine), (timezone.localdate(), Decimal('1.00')))
+
+    def test_accrue_fines_command(self):
+        stdout = StringIO()
+        call_command('accrue_fines', '--date', self.today.isoformat(), stdout=stdout)
+        self.assertIn('Updated the fines of 2 loans', stdout.getvalue())
+
+
+class ReservationQueueTests(LibraryTestCase):
+    """
+    Tests for the FIFO reservation queue and the hand-off of returned copies.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.book = make_book(availability=0)
+        self.borrower = make_member(0)
+        self.loan = make_loan(self.borrower, self.book, loan_date=timezone.localdate())
+        self.waiting = [make_member(i) for i in range(1, 4)]
+        # Same day reservations are ordered by id
+        self.queue = [make_reservation(member, self.book, date(2025, 2, 1)) for member in self.waiting]
+
+    def refresh(self, reservation):
+        return Reservation.objects.get(pk=reservation.pk)
+
+    def test_next_in_line_and_positions(self):
+        self.queue[0].reservation_date = date(2025, 2, 2)
+        self.queue[0].save()
+        self.assertEqual(reservations.next_in_line(self.book.book_id), self.queue[1])
+        self.assertEqual([reservations.queue_position(self.refresh(r)) for r in self.queue], [3, 1, 2])
+        annotated = reservations.with_queue_position(Reservation.objects.order_by('reservation_id'))
+        self.assertEqual([r.queue_position for r in annotated], [3, 1, 2])
+
+    def test_return_holds_copy_for_head_of_queue(self):
+        circulation.return_loan(self.loan)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability, 0)
+        head = self.refresh(self.queue[0])
+        self.assertEqual(head.status, 'ready')
+        self.assertEqual(head.hold_expires, timezone.localdate() + timedelta(days=settings.RESERVATION_HOLD_DAYS))
+        self.assertEqual(reservations.queue_position(self.refresh(self.queue[1])), 1)
+
+    def test_return_without_queue_restocks(self):
+        Reservation.objects.update(status='cancelled')
+        circulation.return_loan(self.loan)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability, 1)
+
+    def test_collect_hold(self):
+        circulation.return_loan(self.loan)
+        self.login_member(self.waiting[0])
+        response = self.client.get(reverse('fulfill_reservation', args=[self.queue[0].reservation_id]))
+        self.assertRedirects(response, reverse('my_loans'), fetch_redirect_response=False)
+        self.assertEqual(self.refresh(self.queue[0]).status, 'confirmed')
+        self.assertTrue(Loan.objects.filter(member=self.waiting[0], return_date__isnull=True).exists())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.availability, 0)
+
+    def test_cannot_collect_someone_elses_hold(self):
+        circulation.return_loan(self.loan)
+        with self.assertRaises(circulation.HoldUnavailable):
+            circulation.collect_hold(self.waiting[1], self.queue[0])
+
+    def test_cancelling_a_hold_passes_the_copy_on(self):
+        circulation.return_loan(self.loan)
+        reservations.cancel(self.refresh(self.queue[0]))
+        self.assertEqual(self.refresh(self.queue[1]).status, 'ready')
+
+    def test_expired_holds_pass_the_copy_on(self):
+        circulation.return_loan(self.loan)
+        after_hold = timezone.localdate() + timedelta(days=settings.RESERVATION_HOLD_DAYS + 1)
+        self.assertEqual(reservations.expire_holds(timezone.localdate()), 0)
+        self.assertEqual(reservations.expire_holds(after_hold), 1)
+        self.assertEqual(
+            [self.refresh(r).status for r in self.queue], ['expired', 'ready', 'pending']
+        )
+        stdout = StringIO()
+        call_command('expire_holds', '--date', after_hold.isoformat(), stdout=stdout)
+        self.assertIn('Expired 0 reservation holds', stdout.getvalue())
+
+    def test_my_reservations_shows_position(self):
+        self.login_member(self.waiting[2])
+        self.assertContains(self.client.get(reverse('my_reservations')), '#3 in line')
+
+
+class QueryPlanTests(LibraryTestCase):
+    """
+    Runs EXPLAIN on the queries behind each view and fails on a full table
+    scan or a sort the index order could have avoided. Works on SQLite
+    (EXPLAIN QUERY PLAN) and MySQL (EXPLAIN).
+
+    A scan of an index or the primary key is accepted when the query has a
+    LIMIT and no sort step, since it stops after one page.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.admin = make_staff(role='Administrator')
+        self.member = make_member()
+        self.books = [make_book(i, availability=2) for i in range(20)]
+        for i, book in enumerate(self.books):
+            member = make_member(i + 1)
+            make_loan(member, book, loan_date=date(2025, 1, 1) + timedelta(days=i))
+            make_loan(self.member, book, return_date=date(2025, 1, 10))
+            make_reservation(member, book)
+            make_reservation(self.member, book, status='cancelled')
+            make_staff(i + 1)
+
+    def capture(self, url, data=None):
+        """
+        Requests ``url`` and returns the SELECT statements it ran, with params.
+        """
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith('SELECT'):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = self.client.get(url, data)
+        self.assertEqual(response.status_code, 200)
+        return statements
+
+    def plan_problems(self, sql, params, allow_sort=False):
+        """
+        Returns a description of every full scan or avoidable sort in the
+        plan of one statement.
+        """
+        limited = re.search(r'\bLIMIT\b', sql, re.IGNORECASE) is not None
+        problems = []
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql, params)
+                columns = [column[0] for column in cursor.description]
+                steps = [dict(zip(columns, row)) for row in cursor.fetchall()]
+                sorted_ = any('filesort' in (step['Extra'] or '') for step in steps)
+                for step in steps:
+                    scanned = step['type'] == 'ALL' or (step['type'] == 'index' and not limited)
+                    if scanned and step['table']:
+                        problems.append(f'full scan of {step["table"]}')
+                if sorted_ and not allow_sort:
+                    problems.append('filesort')
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                details = [row[-1] for row in cursor.fetchall()]
+                sorted_ = any('USE TEMP B-TREE FOR ORDER BY' in detail for detail in details)
+                for detail in details:
+                    scan = re.match(r'SCAN (\w+)( USING (COVERING )?INDEX \w+)?$', detail)
+                    if scan and (not limited or sorted_):
+                        problems.append(f'full scan of {scan.group(1)}')
+                if sorted_ and not allow_sort:
+                    problems.append('filesort')
+        return [f'{problem}: {sql}' for problem in problems]
+
+    def assertIndexedView(self, url, data=None, allow_sort=False):
+        problems = []
+        for sql, params in self.capture(url, data):
+            problems += self.plan_problems(sql, params, allow_sort)
+        self.assertEqual(problems, [])
+
+    def assertIndexedQuery(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        self.assertEqual(self.plan_problems(sql, params), [])
+
+    def test_book_list(self):
+        self.assertIndexedView(reverse('book_list'))
+        self.login_staff(self.admin)
+        self.assertIndexedView(reverse('book_list'), {'page_size': 5})
+
+    @override_settings(SEARCH_BACKEND='tokens')
+    def test_book_search(self):
+        call_command('rebuild_search_index', stdout=StringIO())
+        # Ranked results have to be sorted by relevance
+        self.assertIndexedView(reverse('book_list'), {'q': 'book author'}, allow_sort=True)
+        self.assertIndexedView(reverse('book_list'), {'q': self.books[3].isbn})
+
+    def test_member_views(self):
+        self.login_member(self.member)
+        self.assertIndexedView(reverse('my_loans'))
+        self.assertIndexedView(reverse('my_reservations'))
+
+    def test_manage_views(self):
+        self.login_staff(self.admin)
+        for name in ['manage_loans', 'manage_reservations', 'manage_members', 'manage_staff']:
+            with self.subTest(name):
+                self.assertIndexedView(reverse(name), {'page_size': 5})
+
+    def test_manage_loans_next_page(self):
+        self.login_staff(self.admin)
+        page = self.client.get(reverse('manage_loans'), {'page_size': 5}).context['loans']
+        self.assertIndexedView(reverse('manage_loans'), {'page_size': 5, 'cursor': page.next_cursor})
+
+    def test_write_path_lookups(self):
+        book = self.books[0]
+        self.assertIndexedQuery(Staff.objects.filter(role='Administrator').values('staff_id'))
+        self.assertIndexedQuery(Reservation.objects.filter(book=book, member=self.member, status='pending'))
+        self.assertIndexedQuery(Loan.objects.filter(book=book, return_date__isnull=True))
+        self.assertIndexedQuery(Loan.objects.filter(member=self.member, return_date__isnull=True))
+        self.assertIndexedQuery(Loan.objects.filter(return_date__isnull=True, due_date__lte=date(2025, 3, 1)))
+        self.assertIndexedQuery(reservations.queue(book.book_id)[:1])
+        self.assertIndexedQuery(Reservation.objects.filter(status='ready', hold_expires__lt=date(2025, 3, 1)))
+
+
+class CounterTests(LibraryTestCase):
+    """
+    Tests for the denormalized active loan and pending reservation counters.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.member = make_member()
+        self.other = make_member(1)
+        self.book = make_book(availability=1)
+
+    def counts(self):
+        book = Book.objects.get(pk=self.book.pk)
+        member = Member.objects.get(pk=self.member.pk)
+        return (book.active_loans, book.pending_reservations, member.active_loans, member.pending_reservations)
+
+    def test_loan_and_reservation_lifecycle(self):
+        loan = circulation.borrow(self.member, self.book)
+        self.assertEqual(self.counts(), (1, 0, 1, 0))
+        reservation = reservations.reserve(self.other, self.book)
+        self.assertEqual(Book.objects.get(pk=self.book.pk).pending_reservations, 1)
+        # The returned copy is held for the other member, who still counts as waiting
+        circulation.return_loan(loan)
+        self.assertEqual(self.counts(), (0, 1, 0, 0))
+        circulation.collect_hold(self.other, reservation)
+        self.assertEqual(self.counts(), (1, 0, 0, 0))
+        self.assertEqual(counters.reconcile(fix=False), {
+            'Book': {'active_loans': 0, 'pending_reservations': 0},
+            'Member': {'active_loans': 0, 'pending_reservations': 0},
+        })
+
+    def test_cancel_and_expiry(self):
+        first = reservations.reserve(self.member, self.book)
+        reservations.cancel(first)
+        self.assertEqual(self.counts(), (0, 0, 0, 0))
+        Book.objects.filter(pk=self.book.pk).update(availability=0)
+        loan = make_loan(self.other, self.book, loan_date=timezone.localdate())
+        reservations.reserve(self.member, self.book)
+        circulation.return_loan(loan)
+        reservations.expire_holds(timezone.localdate() + timedelta(days=settings.RESERVATION_HOLD_DAYS + 1))
+        self.assertEqual(self.counts(), (0, 0, 0, 0))
+
+    def test_reconcile_reports_and_fixes_drift(self):
+        Loan.objects.create(member=self.member, book=self.book, loan_date=date(2025, 1, 1), due_date=date(2025, 1, 15))
+        Member.objects.filter(pk=self.other.pk).update(pending_reservations=4)
+        stdout = StringIO()
+        call_command('reconcile_counters', '--dry-run', stdout=stdout)
+        self.assertIn('Book.active_loans: 1 rows drifted', stdout.getvalue())
+        self.assertIn('Member.pending_reservations: 1 rows drifted', stdout.getvalue())
+        self.assertEqual(self.counts(), (0, 0, 0, 0))
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.counts(), (1, 0, 1, 0))
+        self.assertEqual(Member.objects.get(pk=self.other.pk).pending_reservations, 0)
+
+    def test_fix_does_not_update_from_its_own_table(self):
+        for index in range(5):
+            make_member(index + 2)
+        Member.objects.update(pending_reservations=3)
+        with CaptureQueriesContext(connection) as context:
+            counters.reconcile(chunk_size=2)
+        updates = [query['sql'] for query in context.captured_queries if query['sql'].startswith('UPDATE "members"')]
+        # Seven drifted members in chunks of two
+        self.assertEqual(len(updates), 4)
+        for sql in updates:
+            self.assertNotIn('FROM "members"', sql)
+        self.assertFalse(Member.objects.exclude(pending_reservations=0).exists())
+
+    def test_delete_book_releases_reservations(self):
+        Book.objects.filter(pk=self.book.pk).update(availability=0)
+        reservations.reserve(self.member, self.book)
+        reservations.reserve(self.other, self.book)
+        self.login_staff(make_staff())
+        self.client.get(reverse('delete_book', args=[self.book.book_id]))
+        self.assertFalse(Book.objects.filter(pk=self.book.pk).exists())
+        self.assertEqual(set(Member.objects.values_list('pending_reservations', flat=True)), {0})
+
+    def test_delete_book_with_active_loans_is_refused(self):
+        make_loan(self.member, self.book)
+        self.login_staff(make_staff())
+        response = self.client.get(reverse('delete_book', args=[self.book.book_id]), follow=True)
+        self.assertContains(response, 'since there are pending book loans')
+        self.assertTrue(Book.objects.filter(pk=self.book.pk).exists())
+
+    def test_catalogue_shows_holds(self):
+        reservations.reserve(self.member, self.book)
+        self.assertContains(self.client.get(reverse('book_list')), 'On hold: 1')
+
+
+class AsyncViewTests(LibraryTestCase):
+    """
+    Runs the async read-only views through the ASGI handler, where any
+    synchronous database access raises SynchronousOnlyOperation.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.member = make_member()
+        self.staff = make_staff(role='Administrator')
+        self.book = make_book()
+        make_loan(self.member, self.book)
+        make_reservation(self.member, self.book)
+
+    def use_session_of(self, login, user):
+        login(user)
+        self.async_client.cookies = self.client.cookies
+
+    async def test_catalogue_anonymous(self):
+        response = await self.async_client.get(reverse('book_list'))
+        self.assertContains(response, self.book.title)
+        self.assertContains(await self.async_client.get(reverse('book_list'), {'q': 'Book'}), self.book.title)
+
+    async def test_member_pages(self):
+        await sync_to_async(self.use_session_of)(self.login_member, self.member)
+        for name in ['book_list', 'my_loans', 'my_reservations']:
+            with self.subTest(name):
+                response = await self.async_client.get(reverse(name))
+                self.assertContains(response, self.book.title)
+
+    async def test_manage_pages(self):
+        await sync_to_async(self.use_session_of)(self.login_staff, self.staff)
+        for name in ['book_list', 'manage_loans', 'manage_reservations', 'manage_members', 'manage_staff']:
+            with self.subTest(name):
+                response = await self.async_client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+
+    async def test_login_required(self):
+        response = await self.async_client.get(reverse('my_loans'))
+        self.assertRedirects(response, reverse('login'), fetch_redirect_response=False)
+
+
+class GunicornConfigTests(LibraryTestCase):
+    """
+    Tests for the worker settings derived in gunicorn.conf.py.
+    """
+
+    def load(self, **environ):
+        path = settings.BASE_DIR / 'gunicorn.conf.py'
+        with mock.patch.dict(os.environ, environ, clear=True), mock.patch('os.sched_getaffinity', return_value={0, 1}):
+            return runpy.run_path(str(path))
+
+    def write_cgroup(self, root, files):
+        for name, content in files.items():
+            os.makedirs(os.path.dirname(os.path.join(root, name)), exist_ok=True)
+            with open(os.path.join(root, name), 'w') as f:
+                f.write(content)
+
+    def test_cpu_limit_from_cgroup(self):
+        cpu_limit = self.load()['cpu_limit']
+        with tempfile.TemporaryDirectory() as root:
+            self.write_cgroup(root, {'cpu.max': '150000 100000\n'})
+            self.assertEqual(cpu_limit(root), 1.5)
+        with tempfile.TemporaryDirectory() as root:
+            self.write_cgroup(root, {'cpu/cpu.cfs_quota_us': '400000\n', 'cpu/cpu.cfs_period_us': '100000\n'})
+            self.assertEqual(cpu_limit(root), 4)
+        with tempfile.TemporaryDirectory() as root:
+            self.write_cgroup(root, {'cpu.max': 'max 100000\n'})
+            with mock.patch('os.sched_getaffinity', return_value={0, 1, 2}):
+                self.assertEqual(cpu_limit(root), 3)
+
+    def test_defaults_follow_cpus(self):
+        config = self.load()
+        config_cpus = config['cpus']
+        self.assertEqual((config['worker_class'], config['workers'], config['threads']), ('sync', 2 * config_cpus + 1, 1))
+        gthread = self.load(GUNICORN_WORKER_CLASS='gthread')
+        self.assertEqual((gthread['workers'], gthread['threads']), (gthread['cpus'], 4))
+        self.assertEqual(self.load(SERVER_MODE='asgi')['worker_class'], 'uvicorn_worker.UvicornWorker')
+
+    def test_environment_overrides(self):
+        config = self.load(
+            GUNICORN_WORKER_CLASS='gthread', GUNICORN_WORKERS='3', GUNICORN_THREADS='8',
+            GUNICORN_MAX_REQUESTS='500', GUNICORN_KEEPALIVE='2', GUNICORN_BACKLOG='64', METRICS_PORT='9100'
+        )
+        self.assertEqual(
+            [config[name] for name in ['workers', 'threads', 'max_requests', 'max_requests_jitter', 'keepalive', 'backlog']],
+            [3, 8, 500, 50, 2, 64]
+        )
+        self.assertEqual(config['bind'], ['0.0.0.0:8000', '0.0.0.0:9100'])
+
+    def test_connection_budget(self):
+        config = self.load(GUNICORN_WORKER_CLASS='gthread', GUNICORN_WORKERS='4', GUNICORN_THREADS='8',
+                           DB_MAX_CONNECTIONS_PER_PROCESS='4', DB_MAX_CONNECTIONS_PER_POD='10')
+        self.assertEqual((config['workers'], config['threads']), (2, 4))
+        config = self.load(GUNICORN_WORKERS='5', DB_MAX_CONNECTIONS_PER_POD='3')
+        self.assertEqual((config['workers'], config['threads']), (3, 1))
+        config = self.load(GUNICORN_WORKER_CLASS='gevent', GUNICORN_WORKERS='2', DB_MAX_CONNECTIONS_PER_POD='30')
+        self.assertEqual((config['workers'], config['worker_connections']), (1, 30))
+
+    def test_exited_workers_are_merged(self):
+        config = self.load()
+        key = mmap_dict.mmap_key('library_circulation_events', 'library_circulation_events_total',
+                                 ['event'], ['borrow'], 'Committed borrows')
+        with tempfile.TemporaryDirectory() as directory:
+            for pid, value in [(101, 2), (102, 3), (103, 4)]:
+                worker_file = mmap_dict.MmapedDict(os.path.join(directory, f'counter_{pid}.db'))
+                worker_file.write_value(key, value, 0.0)
+                worker_file.close()
+            config['merge_worker_metrics'](directory, 101)
+            config['merge_worker_metrics'](directory, 102)
+            self.assertEqual(sorted(os.listdir(directory)), ['counter_103.db', 'counter_archive.db'])
+            with mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+                self.assertIn(b'library_circulation_events_total{event="borrow"} 9.0', metrics.render())
+
+    def test_connections_are_not_kept_by_greenlets(self):
+        path = os.path.join(settings.BASE_DIR, 'library_management_system', 'settings.py')
+        for environ, conn_max_age in [({}, 60), ({'GUNICORN_WORKER_CLASS': 'gevent'}, 0), ({'SERVER_MODE': 'asgi'}, 0)]:
+            with mock.patch.dict(os.environ, {**environ, 'DB_CONN_MAX_AGE': '60'}):
+                for name in {'GUNICORN_WORKER_CLASS', 'SERVER_MODE'} - set(environ):
+                    os.environ.pop(name, None)
+                self.assertEqual(runpy.run_path(path)['DATABASES']['default']['CONN_MAX_AGE'], conn_max_age)
+
+
+class MetricsTests(LibraryTestCase):
+    """
+    Tests for the Prometheus metrics.
+    """
+
+    def test_request_latency_and_queries(self):
+        member = make_member()
+        make_loan(member, make_book())
+        self.login_member(member)
+        before = metric_sample('library_request_duration_seconds_count', view='my_loans', method='GET')
+        queries_before = metric_sample('library_request_db_queries_sum', view='my_loans')
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('my_loans'))
+        self.assertEqual(metric_sample('library_request_duration_seconds_count', view='my_loans', method='GET'), before + 1)
+        self.assertEqual(
+            metric_sample('library_request_db_queries_sum', view='my_loans') - queries_before,
+            len(context.captured_queries)
+        )
+        self.assertEqual(metric_sample('library_requests_in_flight'), 0)
+
+    def test_circulation_events_count_on_commit(self):
+        before = metric_sample('library_circulation_events_total', event='borrow')
+        with self.captureOnCommitCallbacks(execute=True):
+            circulation.borrow(make_member(), make_book())
+        self.assertEqual(metric_sample('library_circulation_events_total', event='borrow'), before + 1)
+
+    def test_metrics_endpoint(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'library_requests_in_flight', response.content)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer sécret'}).status_code, 403)
+        response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_PORT=9100)
+    def test_metrics_port(self):
+        self.assertEqual(self.client.get(reverse('metrics'), SERVER_PORT='8000').status_code, 404)
+        self.assertEqual(self.client.get(reverse('metrics'), SERVER_PORT='9100').status_code, 200)
+
+    def test_multiprocess_collector(self):
+        with tempfile.TemporaryDirectory() as directory, mock.patch.dict(os.environ, {'PROMETHEUS_MULTIPROC_DIR': directory}):
+            self.assertNotIn(b'library_requests_in_flight', metrics.render())
+
+
+@override_settings(SQL_PROFILER_ENABLED=True, SQL_PROFILER_SAMPLE_RATE=0, SQL_PROFILER_SLOW_MS=0)
+class SQLProfilerTests(LibraryTestCase):
+    """
+    Tests for the sampling SQL profiler.
+    """
+
+    def setUp(self):
+        super().setUp()
+        profiling.PROFILES.clear()
+        self.member = make_member()
+        for index in range(3):
+            make_loan(self.member, make_book(index))
+        self.login_member(self.member)
+
+    def test_not_profiled_without_sample_or_threshold(self):
+        self.client.get(reverse('my_loans'))
+        self.assertEqual(len(profiling.PROFILES), 0)
+
+    @override_settings(SQL_PROFILER_SAMPLE_RATE=1)
+    def test_sampled_request(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('my_loans'))
+        profile, = profiling.PROFILES
+        self.assertEqual(profile['reason'], 'sampled')
+        self.assertEqual(profile['view'], 'my_loans')
+        self.assertEqual(profile['query_count'], len(context.captured_queries))
+        self.assertNotIn(self.member.email, json.dumps(profile))
+
+    @override_settings(SQL_PROFILER_SLOW_MS=60000)
+    def test_slow_request(self):
+        self.client.get(reverse('my_loans'))
+        self.assertEqual(len(profiling.PROFILES), 0)
+        # Every clock reading is a minute after the previous one
+        with mock.patch.object(profiling.time, 'perf_counter', side_effect=itertools.count(step=60)):
+            self.client.get(reverse('my_loans'))
+        profile, = profiling.PROFILES
+        self.assertEqual(profile['reason'], 'slow')
+        self.assertGreater(profile['query_count'], 0)
+
+    def test_duplicate_groups(self):
+        groups = profiling.duplicate_groups([('SELECT 1', 0.001), ('SELECT 2', 0.001), ('SELECT 1', 0.002)])
+        self.assertEqual(groups, [{'sql': 'SELECT 1', 'count': 2, 'ms': 3.0}])
+
+    def test_profiles_page_for_admins_only(self):
+        profiling.store({
+            'time': '2026-01-01T00:00:00+00:00', 'pid': 1, 'reason': 'slow', 'view': 'manage_loans',
+            'method': 'GET', 'path': '/manage-loans/', 'ms': 900, 'query_count': 2, 'query_ms': 5,
+            'queries': [{'sql': 'SELECT "library_loan"', 'ms': 2.5}] * 2,
+            'duplicates': [{'sql': 'SELECT "library_loan"', 'count': 2, 'ms': 5}],
+        })
+        self.assertEqual(self.client.get(reverse('sql_profiles')).status_code, 403)
+        self.login_staff(make_staff(role='Administrator'))
+        response = self.client.get(reverse('sql_profiles'))
+        self.assertContains(response, 'manage_loans')
+        self.assertContains(response, 'SELECT &quot;library_loan&quot;', count=3)
+
+
+@override_settings(BCRYPT_ROUNDS=4)
+class SeedingTests(LibraryTestCase):
+    """
+    Tests for the synthetic data generator and the URL benchmark.
+    """
+
+    def test_seed_library(self):
+        stdout = StringIO()
+        call_command(
+            'seed_library', '--books', '200', '--members', '30', '--staff', '2', '--loans', '1000',
+            '--reservations', '100', '--years', '0.25', '--batch-size', '64', '--force', stdout=stdout
+        )
+        self.assertIn('Created 1332 rows', stdout.getvalue())
+        self.assertEqual(Book.objects.count(), 200)
+        self.assertEqual(Loan.objects.count(), 1000)
+        self.assertFalse(Staff.objects.filter(role='Administrator').exists())
+        self.assertTrue(Loan.objects.filter(return_date__isnull=True).exists())
+        self.assertTrue(Reservation.objects.filter(status='pending').exists())
+        self.assertFalse(Book.objects.filter(availability__lt=0).exists())
+        self.assertFalse(Loan.objects.filter(return_date__isnull=True).values('book').annotate(
+            open=Count('*')).filter(open__gt=1).exists())
+        # Counters and availability are consistent with the loans
+        self.assertEqual(counters.reconcile(fix=False), {
+            'Book': {'active_loans': 0, 'pending_reservations': 0},
+            'Member': {'active_loans': 0, 'pending_reservations': 0},
+        })
+        member = Member.objects.first()
+        self.assertTrue(passwords.check_password(seeding.SEED_PASSWORD, member.credential))
+
+    def test_seed_library_needs_debug_or_force(self):
+        with self.assertRaisesMessage(CommandError, '--force'):
+            call_command('seed_library', '--books', '1', '--members', '0', '--loans', '0', '--reservations', '0')
+        self.assertFalse(Book.objects.exists())
+        with self.settings(DEBUG=True):
+            call_command('seed_library', '--books', '1', '--members', '0', '--loans', '0', '--reservations', '0',
+                         '--staff', '2', '--admin-password', 'chosen-secret', stdout=StringIO())
+        admin = Staff.objects.get(role='Administrator')
+        self.assertTrue(passwords.check_password('chosen-secret', admin.credential))
+        self.assertEqual(Staff.objects.filter(role='Librarian').count(), 1)
+
+    def test_seed_is_repeatable_and_appends(self):
+        seeding.seed(books=20, members=5, loans=50, reservations=10, seed=7)
+        first = list(Loan.objects.order_by('loan_id').values_list('loan_date', 'return_date'))
+        seeding.seed(books=20, members=5, loans=50, reservations=10, seed=7)
+        second = list(Loan.objects.order_by('loan_id').values_list('loan_date', 'return_date'))[50:]
+        self.assertEqual(first, second)
+        self.assertEqual(Book.objects.values('isbn').distinct().count(), 40)
+
+    def test_every_url_has_a_route(self):
+        self.assertEqual(set(benchmarks.ROUTES), {pattern.name for pattern in urlpatterns})
+
+    @mock.patch.dict(benchmarks.URLS_DATASET, books=50, members=10, staff=2, loans=100, reservations=20)
+    def test_urls_scenario(self):
+        rows = benchmarks.urls_scenario(2)
+        self.assertEqual([row['name'] for row in rows], [pattern.name for pattern in urlpatterns])
+        self.assertGreater(next(row for row in rows if row['name'] == 'my_loans')['queries'], 0)
+
+
+class StaticFilesTests(LibraryTestCase):
+    """
+    Tests for the hashed, precompressed static files.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        cls.static_root = directory.name
+        settings_override = override_settings(STATIC_ROOT=cls.static_root)
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        call_command('collectstatic', '--noinput', verbosity=0)
+
+    def test_pages_reference_hashed_files(self):
+        response = self.client.get(reverse('home'))
+        self.assertRegex(response.content.decode(), r'/static/library/images/library_bg-1500\.[0-9a-f]{12}\.webp')
+
+    def test_hashed_files_are_immutable_and_precompressed(self):
+        url = static('admin/css/base.css')
+        name = staticfiles_storage.stored_name('admin/css/base.css')
+        for suffix in ('.gz', '.br'):
+            self.assertTrue(os.path.exists(os.path.join(self.static_root, name + suffix)))
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Cache-Control'], 'max-age=315360000, public, immutable')
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        response = self.client.get(url, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_debug_false_from_the_environment_serves_hashed_names(self):
+        path = os.path.join(settings.BASE_DIR, 'library_management_system', 'settings.py')
+        with mock.patch.dict(os.environ, {'DEBUG': 'false'}):
+            debug = runpy.run_path(path)['DEBUG']
+        self.assertIs(debug, False)
+        with self.settings(DEBUG=debug):
+            self.assertRegex(static('admin/css/base.css'), r'/static/admin/css/base\.[0-9a-f]{12}\.css$')
+
+    def test_asgi_middleware_is_not_adapted(self):
+        # Django logs "Asynchronous handler adapted for middleware ..." for
+        # each sync-only middleware it wraps
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            ASGIHandler()
+
+    async def test_files_are_served_in_async_mode(self):
+        name = staticfiles_storage.stored_name('admin/css/base.css')
+        with open(os.path.join(self.static_root, name), 'rb') as f:
+            content = f.read()
+        response = await self.async_client.get(static('admin/css/base.css'))
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([chunk async for chunk in response.streaming_content]), content)
+
+
+class CompressionTests(LibraryTestCase):
+    """
+    Tests for the compression of dynamic responses.
+    """
+
+    def setUp(self):
+        super().setUp()
+        for i in range(20):
+            make_book(i)
+
+    def test_brotli_and_gzip(self):
+        plain = self.client.get(reverse('book_list')).content
+        response = self.client.get(reverse('book_list'), headers={'Accept-Encoding': 'gzip, deflate, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(brotli.decompress(response.content), plain)
+        response = self.client.get(reverse('book_list'), headers={'Accept-Encoding': 'gzip, br;q=0'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), plain)
+
+    def test_pages_with_csrf_tokens_are_not_compressed(self):
+        self.login_staff(make_staff())
+        response = self.client.get(reverse('book_list'), headers={'Accept-Encoding': 'br'})
+        self.assertContains(response, 'csrfmiddlewaretoken')
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    @override_settings(COMPRESSION_MIN_SIZE=10 ** 6)
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get(reverse('book_list'), headers={'Accept-Encoding': 'br'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_streamed_export(self):
+        member = make_member()
+        for book in Book.objects.all():
+            make_loan(member, book)
+        self.login_staff(make_staff())
+        url = reverse('export_data', args=['loans', 'csv'])
+        plain = b''.join(self.client.get(url).streaming_content)
+        response = self.client.get(url, headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+
+@override_settings(SHARED_CACHE=True)
+class ConditionalCatalogueTests(LibraryTestCase):
+    """
+    Tests for the ETag and Last-Modified headers of the catalogue.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.book = make_book()
+
+    def revalidate(self, response):
+        return self.client.get(reverse('book_list'), headers={'If-None-Match': response.headers['ETag']})
+
+    def test_unchanged_catalogue_is_not_modified(self):
+        response = self.client.get(reverse('book_list'))
+        self.assertIn('Last-Modified', response.headers)
+        self.assertIn('no-cache', response.headers['Cache-Control'])
+        with self.assertNumQueries(0), mock.patch('library.views.render_to_string') as render_cards:
+            revalidated = self.revalidate(response)
+        self.assertEqual(revalidated.status_code, 304)
+        render_cards.assert_not_called()
+        since = self.client.get(reverse('book_list'), headers={'If-Modified-Since': response.headers['Last-Modified']})
+        self.assertEqual(since.status_code, 304)
+
+    def test_changed_catalogue_is_rendered(self):
+        response = self.client.get(reverse('book_list'))
+        self.book.title = 'Renamed'
+        self.book.save()
+        self.assertContains(self.revalidate(response), 'Renamed')
+
+    def test_viewers_get_their_own_etags(self):
+        self.login_member(make_member(1))
+        response = self.client.get(reverse('book_list'))
+        self.login_member(make_member(2))
+        self.assertEqual(self.revalidate(response).status_code, 200)
+
+    def test_pending_messages_are_shown(self):
+        member = make_member()
+        self.login_member(member)
+        response = self.client.get(reverse('book_list'))
+        Book.objects.filter(pk=self.book.pk).update(availability=0)
+        # Refused without changing the catalogue; the redirect lands on book_list
+        self.client.get(reverse('borrow_book', args=[self.book.book_id]))
+        self.assertContains(self.revalidate(response), 'not available for borrowing')
+
+
+class ReplicaRoutingTests(LibraryTestCase):
+    """
+    Tests for the read replica router. The tests have no replica, so reads
+    the router sends to it are recorded and run on the primary.
+    """
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(routers, 'replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # A fresh client, so the middleware is loaded with the replica configured
+        self.client = Client()
+        self.reads = []
+        original = routers.ReplicaRouter.db_for_read
+
+        def record(router, model, **hints):
+            self.reads.append((model._meta.label, original(router, model, **hints)))
+            return routers.DEFAULT
+
+        patcher = mock.patch.object(routers.ReplicaRouter, 'db_for_read', autospec=True, side_effect=record)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.member = make_member()
+        self.book = make_book()
+        self.login_member(self.member)
+
+    def aliases(self, label):
+        return {alias for model, alias in self.reads if model == label}
+
+    def test_list_pages_read_from_replica(self):
+        self.client.get(reverse('my_loans'))
+        self.assertEqual(self.aliases('library.Loan'), {routers.REPLICA})
+        self.assertEqual(self.aliases('sessions.Session'), {routers.DEFAULT})
+
+    def test_other_views_read_from_primary(self):
+        self.client.get(reverse('book_list'))
+        self.assertTrue(self.reads)
+        self.assertEqual({alias for _, alias in self.reads}, {routers.DEFAULT})
+
+    def test_own_writes_pin_to_primary(self):
+        response = self.client.get(reverse('borrow_book', args=[self.book.book_id]))
+        self.assertEqual(response.cookies[routers.PIN_COOKIE]['max-age'], settings.DB_REPLICA_PIN_SECONDS)
+        self.reads.clear()
+        response = self.client.get(reverse('my_loans'))
+        self.assertContains(response, self.book.title)
+        self.assertEqual(self.aliases('library.Loan'), {routers.DEFAULT})
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_reads_do_not_pin(self):
+        response = self.client.get(reverse('my_loans'))
+        self.assertNotIn(routers.PIN_COOKIE, response.cookies)
+
+    def test_export_reads_from_replica(self):
+        self.login_staff(make_staff())
+        with mock.patch.object(exports, 'stream_export', return_value=iter([])) as stream_export:
+            self.client.get(reverse('export_data', args=['loans', 'csv']))
+        self.assertEqual(stream_export.call_args.kwargs['using'], routers.REPLICA)
+
+    def test_outside_requests_use_primary(self):
+        router = routers.ReplicaRouter()
+        self.assertEqual(router.db_for_write(Loan), routers.DEFAULT)
+        self.assertEqual(routers.read_alias(), routers.DEFAULT)
+        self.assertFalse(router.allow_migrate(routers.REPLICA, 'library'))
+
+
+@override_settings(LOAN_RETENTION_DAYS=365)
+class LoanArchiveTests(LibraryTestCase):
+    """
+    Tests for the archival of old returned loans.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.member = make_member()
+        self.today = date(2026, 6, 1)
+        long_ago = self.today - timedelta(days=500)
+        self.old = [
+            make_loan(self.member, make_book(index), loan_date=long_ago, return_date=long_ago + timedelta(days=10))
+            for index in range(5)
+        ]
+        self.recent = make_loan(
+            self.member, make_book(10), loan_date=self.today - timedelta(days=30), return_date=self.today
+        )
+        self.open = make_loan(self.member, make_book(11), loan_date=long_ago)
+
+    def test_archives_old_returned_loans_in_chunks(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(archive.archive_loans(self.today, chunk_size=2), 5)
+        inserts = [query for query in context.captured_queries if query['sql'].startswith('INSERT INTO "loan_archive"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertCountEqual(Loan.objects.values_list('loan_id', flat=True), [self.recent.loan_id, self.open.loan_id])
+        self.assertCountEqual(
+            ArchivedLoan.objects.values_list('loan_id', flat=True), [loan.loan_id for loan in self.old]
+        )
+        self.assertEqual(archive.archive_loans(self.today), 0)
+        for drift in counters.reconcile(fix=False).values():
+            self.assertFalse(any(drift.values()))
+
+    def test_history_pages(self):
+        archive.archive_loans(self.today)
+        self.login_member(self.member)
+        self.assertNotContains(self.client.get(reverse('my_loans')), 'Book 0<')
+        self.assertContains(self.client.get(reverse('my_loans'), {'history': '1'}), 'Book 0<')
+        self.login_staff(make_staff())
+        response = self.client.get(reverse('manage_loans'), {'history': '1'})
+        self.assertContains(response, 'Loan History')
+        self.assertContains(response, 'Book 4<')
+        self.assertNotContains(response, 'Book 11<')
+
+    def test_loan_history_export(self):
+        archive.archive_loans(self.today)
+        self.login_staff(make_staff())
+        response = self.client.get(reverse('export_data', args=['loan_history', 'csv']))
+        rows = list(csv.reader(line.decode() for line in response.streaming_content))
+        self.assertEqual(rows[0], exports.header('loan_history'))
+        self.assertCountEqual([int(row[0]) for row in rows[1:]], [loan.loan_id for loan in self.old])
+
+    def test_command(self):
+        out = StringIO()
+        call_command('archive_loans', '--date', self.today.isoformat(), '--dry-run', stdout=out)
+        self.assertIn('5 loans would be archived', out.getvalue())
+        self.assertFalse(ArchivedLoan.objects.exists())
+        call_command('archive_loans', '--date', self.today.isoformat(), stdout=StringIO())
+        self.assertEqual(ArchivedLoan.objects.count(), 5)
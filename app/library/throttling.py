@@ -0,0 +1,73 @@
+"""
+This module contains the throttle for login attempts.
+
+Each client IP and each email address has a counter in Django's cache that
+allows ``burst`` attempts in the window it takes to refill them at ``rate``
+attempts per minute, starting with the first attempt. A login attempt
+counts against both before any password is hashed, so repeated attempts
+against one account, or from one client, are rejected without spending
+bcrypt CPU time.
+
+Counters are updated with cache.add and cache.incr, which are atomic, so
+concurrent attempts cannot all pass on the same count. The limits hold
+across workers and pods only with a shared cache (CACHE_BACKEND set to
+memcached or Redis); the local-memory default counts per process.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import LOGIN_THROTTLED
+
+def _take(key, burst, rate_per_minute):
+    """
+    Counts one attempt against the counter stored at ``key``.
+    Returns False if the window's ``burst`` attempts are used up.
+    """
+    window = max(1, round(burst * 60 / rate_per_minute))
+    cache.add(key, 0, window)
+    try:
+        attempts = cache.incr(key)
+    except ValueError:
+        # The window ran out between add and incr
+        cache.add(key, 1, window)
+        attempts = 1
+    return attempts <= burst
+
+
+def get_client_ip(request):
+    """
+    Returns the client IP address. Behind proxies (USE_X_FORWARDED_FOR) it
+    is the X-Forwarded-For entry added by the outermost of the
+    TRUSTED_PROXY_COUNT trusted proxies; the entries left of it come from
+    the client and can be forged.
+    """
+    if settings.USE_X_FORWARDED_FOR:
+        forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(forwarded) >= settings.TRUSTED_PROXY_COUNT > 0:
+            return forwarded[-settings.TRUSTED_PROXY_COUNT]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def allow_login_attempt(request, email):
+    """
+    Returns True if a login attempt for ``email`` from this client is within
+    both the per-IP and the per-email limit. Each call uses up one attempt.
+    """
+    if not settings.LOGIN_THROTTLE_ENABLED:
+        return True
+    email_digest = hashlib.sha256((email or '').strip().lower().encode()).hexdigest()
+    buckets = [
+        ('ip', f'login-throttle:ip:{get_client_ip(request)}',
+         settings.LOGIN_THROTTLE_IP_BURST, settings.LOGIN_THROTTLE_IP_RATE),
+        ('email', f'login-throttle:email:{email_digest}',
+         settings.LOGIN_THROTTLE_EMAIL_BURST, settings.LOGIN_THROTTLE_EMAIL_RATE),
+    ]
+    for scope, key, burst, rate in buckets:
+        if not _take(key, burst, rate):
+            LOGIN_THROTTLED.labels(scope).inc()
+            return False
+    return True
+
@@ -13,6 +13,7 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('books/', views.book_list, name='book_list'),
     path('books/add', views.add_book, name='add_book'),
+    path('books/<int:book_id>/manage', views.book_manage, name='book_manage'),
     path('books/<int:book_id>/edit', views.edit_book, name='edit_book'),
     path('books/<int:book_id>/borrow/', views.borrow_book, name='borrow_book'),
     path('books/<int:book_id>/reserve/', views.reserve_book, name='reserve_book'),
@@ -27,7 +28,10 @@ urlpatterns = [
     path('manage-reservations/<int:reservation_id>/cancel', views.cancel_reservation, name='manage_cancel_reservation'),
     path('manage-members', views.manage_members, name='manage_members'),
     path('manage-members/<int:member_id>/remove', views.remove_member, name='manage_members_remove'),
+    path('exports/<slug:dataset>.<slug:file_format>', views.export_data, name='export_data'),
     path('manage-staff/', views.manage_staff, name='manage_staff'),
     path('manage-staff/register', views.register_staff, name='register_staff'),
     path('manage-staff/<int:staff_id>/resign', views.resign_staff, name='resign_staff'),
+    path('manage-profiles/', views.sql_profiles, name='sql_profiles'),
+    path('metrics', views.metrics_view, name='metrics'),
 ] 
\ No newline at end of file
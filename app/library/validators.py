@@ -0,0 +1,25 @@
+"""
+This module contains validation shared by the book forms and the bulk importer.
+"""
+
+from .models import Book
+
+
+def is_number(value):
+    """
+    Returns True if ``value`` is made only of the ASCII digits 0-9. str.isnumeric
+    also accepts characters like "²" that int() rejects.
+    """
+    return value.isascii() and value.isdigit()
+
+
+def validate_book(isbn, year):
+    """
+    Checks the ISBN and year of publication of a new book.
+    Returns the error message to show, or None if both are valid.
+    """
+    if not isbn or not is_number(isbn) or len(isbn) > Book._meta.get_field('isbn').max_length:
+        return 'Invalid ISBN'
+    if not year or not is_number(year):
+        return 'Invalid year of publish'
+    return None
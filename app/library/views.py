@@ -1,14 +1,25 @@
-from datetime import datetime, timedelta
-from decimal import Decimal
+import hmac
+from datetime import date, datetime
 
-import bcrypt
+from django.conf import settings
 from django.contrib import messages
-from django.db.models import Q
-from django.http import HttpResponseForbidden
-from django.shortcuts import get_object_or_404, redirect, render
-
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404, get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils.safestring import mark_safe
+
+from . import (
+    catalogue_cache, circulation, counters, exports, metrics, passwords, profiling, reservations, routers, throttling
+)
 from .decorators import login_required_custom
-from .models import Book, Loan, Member, Reservation, Staff
+from .models import ArchivedLoan, Book, Loan, Member, Reservation, Staff
+from .pagination import apaginate, get_page_size
+from .routers import replica_reads
+from .search import asearch_books
+from .validators import validate_book
 
 
 def home(request):
@@ -41,7 +52,7 @@ def register(request):
             first_name=first_name,
             last_name=last_name,
             email=email,
-            credential=bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode(),
+            credential=passwords.hash_password(password),
             address=address,
             contact=contact,
             date_joined=datetime.now().date()
@@ -54,6 +65,15 @@ def register(request):
     
     return render(request, 'library/register.html')
 
+def _upgrade_credential(user, password):
+    """
+    Rehashes a member's or staff member's password after a successful login
+    if it was hashed with a different bcrypt cost than the current one.
+    """
+    if passwords.needs_rehash(user.credential):
+        user.credential = passwords.hash_password(password)
+        type(user).objects.filter(pk=user.pk).update(credential=user.credential)
+
 def login_view(request):
     """
     Handles user authentication for both members and staff.
@@ -63,13 +83,20 @@ def login_view(request):
         password = request.POST.get('password')
         login_status = {}
 
+        # Rejected before any database lookup or bcrypt work
+        if not throttling.allow_login_attempt(request, email):
+            login_status['login_failed'] = True
+            login_status['login_throttled'] = True
+            return render(request, 'library/login.html', login_status, status=429)
+
         if 'staffLogin' in request.POST:
             # Handle staff login
             try:
                 staff = Staff.objects.get(email=email)
-                if not bcrypt.checkpw(password.encode('utf-8'),staff.credential.encode('utf-8')):
+                if not passwords.check_password(password, staff.credential):
                     login_status['login_failed'] = True
                     return render(request, 'library/login.html', login_status)
+                _upgrade_credential(staff, password)
                 
                 # Set session variables for staff
                 request.session['staff_id'] = staff.staff_id
@@ -88,9 +115,10 @@ def login_view(request):
             # Handle member login
             try:
                 member = Member.objects.get(email=email)
-                if not bcrypt.checkpw(password.encode('utf-8'),member.credential.encode('utf-8')):
+                if not passwords.check_password(password, member.credential):
                     login_status['login_failed'] = True
                     return render(request, 'library/login.html', login_status)
+                _upgrade_credential(member, password)
                 
                 # Set session variables for member
                 request.session['member_id'] = member.member_id
@@ -114,21 +142,72 @@ def logout_view(request):
     messages.success(request, 'Logged out successfully')
     return redirect('home')
 
-def book_list(request):
+async def book_list(request):
     """
     Displays a list of books with optional search functionality.
+    Search results are ranked by relevance (see library.search).
+
+    The book cards are rendered once per catalogue version, query and viewer
+    role and then served from the cache. Staff get one shared manage modal
+    that loads the form of a book from book_manage when it opens.
+
+    The ETag and Last-Modified headers follow the catalogue version too, so
+    a browser revalidating an unchanged page gets a 304 before anything is
+    rendered. Pages with pending messages are always rendered in full, and
+    without a shared cache nothing is cached or revalidated.
+    """
+    if await request.session.aget('is_staff'):
+        role = 'staff'
+        viewer = await request.session.aget('staff_id')
+    elif await request.session.aget('is_authenticated'):
+        role = 'member'
+        viewer = await request.session.aget('member_id')
+    else:
+        role = 'anonymous'
+        viewer = None
+
+    # The session is loaded by now, so reading the messages does not query
+    validators = None
+    if catalogue_cache.enabled() and not messages.get_messages(request):
+        validators = await catalogue_cache.aget_validators(request.GET, role, viewer)
+        response = get_conditional_response(request, *validators)
+        if response is not None:
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+    key = await catalogue_cache.apage_key(request.GET, role)
+    body = await catalogue_cache.aget_page(key)
+    if body is None:
+        query = request.GET.get('q', '')
+        books = Book.objects.all()
+        ordering = ['book_id']
+
+        if query:
+            books, ordering = await asearch_books(books, query)
+
+        books = await apaginate(books, ordering, request.GET.get('cursor'), get_page_size(request))
+        body = render_to_string('library/book_cards.html', {'books': books}, request)
+        await catalogue_cache.aset_page(key, body)
+
+    response = render(request, 'library/book_list.html', {'catalogue': mark_safe(body)})
+    if validators is not None:
+        etag, last_modified = validators
+        response.headers['ETag'] = etag
+        response.headers['Last-Modified'] = http_date(last_modified)
+    # Browsers revalidate every time instead of guessing a freshness lifetime
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+@login_required_custom
+async def book_manage(request, book_id):
     """
-    query = request.GET.get('q', '')
-    books = Book.objects.all()
-    
-    if query:
-        books = books.filter(
-            Q(title__icontains=query) |
-            Q(author__icontains=query) |
-            Q(isbn__icontains=query)
-        )
-    
-    return render(request, 'library/book_list.html', {'books': books})
+    Renders the edit and delete form of one book for the shared manage
+    modal of the catalogue (staff view).
+    """
+    if not await request.session.aget('is_staff'):
+        return HttpResponseForbidden('Only staff members can manage books')
+    book = await aget_object_or_404(Book, book_id=book_id)
+    return render(request, 'library/book_manage_form.html', {'book': book})
 
 @login_required_custom
 def edit_book(request, book_id):
@@ -179,11 +258,9 @@ def add_book(request):
         available = request.POST.get('newAvailable')
 
         # Validate input
-        if not ISBN.isnumeric():
-            messages.error(request, 'Invalid ISBN')
-            return redirect('book_list')
-        elif not year.isnumeric():
-            messages.error(request, 'Invalid year of publish')
+        error = validate_book(ISBN, year)
+        if error:
+            messages.error(request, error)
             return redirect('book_list')
         elif Book.objects.filter(isbn=ISBN).exists():
             messages.error(request, 'The book with this ISBN already exist')
@@ -214,11 +291,14 @@ def delete_book(request, book_id):
     """
     book = get_object_or_404(Book, book_id=book_id)
 
-    if Loan.objects.filter(book=book).exclude(return_date__isnull=False).exists():
+    if book.active_loans:
         messages.error(request, f'Unable to remove the book {book.title} since there are pending book loans')
         return redirect('book_list')
 
-    book.delete()
+    with transaction.atomic():
+        # The delete takes the book's reservations with it
+        counters.drop_open_reservations(book)
+        book.delete()
     messages.success(request, f'Successfully removed {book.title}')
     return redirect('book_list')
 
@@ -237,26 +317,13 @@ def borrow_book(request, book_id):
         messages.error(request, 'Please login to borrow books')
         return redirect('login')
     
-    if book.availability <= 0:
+    member = get_object_or_404(Member, member_id=member_id)
+    try:
+        circulation.borrow(member, book)
+    except circulation.BookUnavailable:
         messages.error(request, 'Book is not available for borrowing')
         return redirect('book_list')
     
-    # Create new loan record
-    member = get_object_or_404(Member, member_id=member_id)
-    loan_date = datetime.now().date()
-    due_date = loan_date + timedelta(days=14)  # 2 weeks loan period
-    
-    Loan.objects.create(
-        member=member,
-        book=book,
-        loan_date=loan_date,
-        due_date=due_date
-    )
-    
-    # Update book availability
-    book.availability -= 1
-    book.save()
-    
     messages.success(request, f'Successfully borrowed {book.title}')
     return redirect('my_loans')
 
@@ -265,11 +332,34 @@ def fulfill_reservation(request, reservation_id):
     """
     Handles fulfillment of book reservations.
     """
-    reservation = get_object_or_404(Reservation, reservation_id=reservation_id)
-    book_id = reservation.book.book_id
-    result = borrow_book(request, book_id)
-    reservation.status = 'confirmed'
-    reservation.save()
+    reservation = get_object_or_404(Reservation.objects.select_related('book'), reservation_id=reservation_id)
+    member_id = request.session.get('member_id')
+
+    if not member_id:
+        messages.error(request, 'Please login to borrow books')
+        return redirect('login')
+
+    member = get_object_or_404(Member, member_id=member_id)
+    book = reservation.book
+    if reservation.status == 'ready':
+        try:
+            circulation.collect_hold(member, reservation)
+        except circulation.HoldUnavailable:
+            messages.error(request, 'This book is no longer held for you')
+            return redirect('my_reservations')
+        messages.success(request, f'Successfully borrowed {book.title}')
+        return redirect('my_loans')
+
+    try:
+        circulation.fulfill(member, reservation)
+    except circulation.BookUnavailable:
+        messages.error(request, 'Book is not available for borrowing')
+        return redirect('my_reservations')
+    except circulation.HoldUnavailable:
+        messages.error(request, 'This reservation is no longer pending')
+        return redirect('my_reservations')
+
+    messages.success(request, f'Successfully borrowed {book.title}')
     return redirect('my_loans')
 
 @login_required_custom
@@ -278,8 +368,7 @@ def cancel_reservation(request, reservation_id):
     Handles cancellation of book reservations.
     """
     reservation = get_object_or_404(Reservation, reservation_id=reservation_id)
-    reservation.status = 'cancelled'
-    reservation.save()
+    reservations.cancel(reservation)
     if request.session.get('is_staff'):
         return redirect('manage_reservations')
     return redirect('my_reservations')
@@ -289,53 +378,53 @@ def return_book(request, loan_id):
     """
     Handles book return process and calculates fines if overdue.
     """
-    loan = get_object_or_404(Loan, loan_id=loan_id)
-    member_id = request.session.get('member_id')
+    loan = get_object_or_404(Loan.objects.select_related('book'), loan_id=loan_id)
     
-    if loan.return_date:
+    try:
+        circulation.return_loan(loan)
+    except circulation.AlreadyReturned:
         messages.error(request, 'This book has already been returned')
         return redirect('my_loans')
     
-    # Set return date and calculate fine if overdue
-    return_date = datetime.now().date()
-    loan.return_date = return_date
-    
-    if return_date > loan.due_date:
-        days_overdue = (return_date - loan.due_date).days
-        loan.fine = Decimal(days_overdue) * Decimal('0.50')  # $0.50 per day
-    
-    loan.save()
-    
-    # Update book availability
     book = loan.book
-    book.availability += 1
-    book.save()
-    
     messages.success(request, f'Successfully returned {book.title}')
     if request.session.get('is_staff'):
         return redirect('manage_loans')
     return redirect('my_loans')
 
 @login_required_custom
-def my_loans(request):
+@replica_reads
+async def my_loans(request):
     """
-    Displays list of books borrowed by the current member.
+    Displays list of books borrowed by the current member, or with
+    ``history=1`` their archived loans (see library.archive).
     """
-    member_id = request.session.get('member_id')
+    member_id = await request.session.aget('member_id')
     if not member_id:
         return redirect('login')
     
-    member = get_object_or_404(Member, member_id=member_id)
-    loans = Loan.objects.filter(member=member).order_by('-loan_date')
-    return render(request, 'library/my_loans.html', {'loans': loans})
+    member = await aget_object_or_404(Member, member_id=member_id)
+    history = request.GET.get('history') == '1'
+    model = ArchivedLoan if history else Loan
+    loans = [loan async for loan in model.objects.filter(member=member).select_related('book').order_by('-loan_date')]
+    return render(request, 'library/my_loans.html', {'loans': loans, 'history': history})
 
 @login_required_custom
-def manage_loans(request):
-    """
-    Displays all loans in the system (staff view).
-    """
-    loans = Loan.objects.all()
-    return render(request, 'library/manage_loans.html', {'loans': loans})
+@replica_reads
+async def manage_loans(request):
+    """
+    Displays all loans in the system, or with ``history=1`` the archived
+    loans (staff view).
+    """
+    history = request.GET.get('history') == '1'
+    model = ArchivedLoan if history else Loan
+    loans = await apaginate(
+        model.objects.select_related('member', 'book'),
+        ['-loan_date', '-loan_id'],
+        request.GET.get('cursor'),
+        get_page_size(request)
+    )
+    return render(request, 'library/manage_loans.html', {'loans': loans, 'history': history})
 
 @login_required_custom
 def reserve_book(request, book_id):
@@ -352,50 +441,82 @@ def reserve_book(request, book_id):
     member = get_object_or_404(Member, member_id=member_id)
     
     # Check for existing reservation
-    if Reservation.objects.filter(book=book, member=member, status='pending').exists():
+    if Reservation.objects.filter(book=book, member=member, status__in=['pending', 'ready']).exists():
         messages.error(request, 'You have already reserved this book')
         return redirect('book_list')
 
     # Create new reservation
-    Reservation.objects.create(
-        member=member,
-        book=book,
-        reservation_date=datetime.now().date(),
-        status='pending'
-    )
+    reservations.reserve(member, book)
     
     messages.success(request, f'Successfully reserved {book.title}')
     return redirect('my_reservations')
 
 @login_required_custom
-def my_reservations(request):
+@replica_reads
+async def my_reservations(request):
     """
     Displays list of reservations made by the current member.
     """
-    member_id = request.session.get('member_id')
+    member_id = await request.session.aget('member_id')
     if not member_id:
         return redirect('login')
     
-    member = get_object_or_404(Member, member_id=member_id)
-    reservations = Reservation.objects.filter(member=member).order_by('-reservation_date')
-    return render(request, 'library/my_reservations.html', {'reservations': reservations})
+    member = await aget_object_or_404(Member, member_id=member_id)
+    member_reservations = [reservation async for reservation in reservations.with_queue_position(
+        Reservation.objects.filter(member=member).select_related('book').order_by('-reservation_date')
+    )]
+    return render(request, 'library/my_reservations.html', {'reservations': member_reservations})
 
 @login_required_custom
-def manage_reservations(request):
+@replica_reads
+async def manage_reservations(request):
     """
     Displays all reservations in the system (staff view).
     """
-    reservations = Reservation.objects.all()
-    return render(request, 'library/manage_reservations.html', {'reservations': reservations})
+    page = await apaginate(
+        reservations.with_queue_position(Reservation.objects.select_related('member', 'book')),
+        ['-reservation_date', '-reservation_id'],
+        request.GET.get('cursor'),
+        get_page_size(request)
+    )
+    return render(request, 'library/manage_reservations.html', {'reservations': page})
 
 @login_required_custom
-def manage_members(request):
+@replica_reads
+async def manage_members(request):
     """
     Displays all members in the system (staff view).
     """
-    members = Member.objects.all()
+    members = await apaginate(Member.objects.all(), ['member_id'], request.GET.get('cursor'), get_page_size(request))
     return render(request, 'library/manage_members.html', {'members': members})
 
+@login_required_custom
+@replica_reads
+def export_data(request, dataset, file_format):
+    """
+    Streams all loans, reservations or members as CSV or JSON Lines (staff view).
+    Optional ``from`` and ``to`` parameters (YYYY-MM-DD) limit the export to
+    a date range.
+    """
+    if not request.session.get('is_staff'):
+        return HttpResponseForbidden('Only staff members can export data')
+    if dataset not in exports.EXPORTS or file_format not in exports.FORMATS:
+        raise Http404('Unknown export')
+
+    try:
+        date_from = date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        date_to = date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+    except ValueError:
+        return HttpResponseBadRequest('Dates must be in YYYY-MM-DD format')
+
+    # The rows are read after the view returns, so the database is picked now
+    lines = exports.stream_export(dataset, file_format, date_from, date_to, using=routers.read_alias())
+    if settings.SERVER_MODE == 'asgi':
+        lines = exports.aiterate(lines)
+    response = StreamingHttpResponse(lines, content_type=exports.FORMATS[file_format])
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{file_format}"'
+    return response
+
 @login_required_custom
 def remove_member(request, member_id):
     """
@@ -404,7 +525,7 @@ def remove_member(request, member_id):
     member = get_object_or_404(Member, member_id=member_id)
 
     # Check for pending loans or reservations
-    if Reservation.objects.filter(member=member, status='pending').exists() or Loan.objects.filter(member=member).exclude(return_date__isnull=False).exists():
+    if member.pending_reservations or member.active_loans:
         messages.error(request, f'Unable to remove {member.first_name + " " + member.last_name} since there are pending book loans or reservation for this member')
         return redirect('manage_members')
     member.delete()
@@ -412,11 +533,12 @@ def remove_member(request, member_id):
     return redirect('manage_members')
 
 @login_required_custom
-def manage_staff(request):
+@replica_reads
+async def manage_staff(request):
     """
     Displays all staff members in the system (admin view).
     """
-    staffs = Staff.objects.all()
+    staffs = await apaginate(Staff.objects.all(), ['staff_id'], request.GET.get('cursor'), get_page_size(request))
     return render(request, 'library/manage_staffs.html', {'staffs': staffs})
 
 @login_required_custom
@@ -443,7 +565,7 @@ def register_staff(request):
             first_name=first_name,
             last_name=last_name,
             role=role,
-            credential=bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode(),
+            credential=passwords.hash_password(password),
             contact=contact,
             email=email
         )
@@ -466,6 +588,32 @@ def resign_staff(request, staff_id):
     messages.success(request, f'Successfully removed {staff.first_name + " " + staff.last_name}')
     return redirect('manage_staff')
 
+@login_required_custom
+def sql_profiles(request):
+    """
+    Displays the SQL profiles recorded by the worker that serves the request,
+    newest first (admin view).
+    """
+    if not request.session.get('is_admin'):
+        return HttpResponseForbidden('Only administrators can view SQL profiles')
+    return render(request, 'library/sql_profiles.html', {
+        'enabled': settings.SQL_PROFILER_ENABLED,
+        'profiles': list(reversed(profiling.PROFILES)),
+    })
+
+def metrics_view(request):
+    """
+    Serves the Prometheus metrics of this pod, summed over its workers.
+    """
+    if settings.METRICS_PORT and request.get_port() != str(settings.METRICS_PORT):
+        raise Http404
+    authorization = request.headers.get('Authorization', '')
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        authorization.encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()
+    ):
+        return HttpResponseForbidden('Invalid metrics token')
+    return HttpResponse(metrics.render(), content_type=metrics.CONTENT_TYPE_LATEST)
+
 def some_protected_view(request):
     """
     Example of a protected view that requires authentication.
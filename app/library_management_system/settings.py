@@ -10,7 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from decimal import Decimal
 from decouple import config
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 from django.contrib.messages import constants as messages
 
@@ -25,7 +27,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY', default='unsafe-secret-key')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = config('DEBUG', default=True)
+DEBUG = config('DEBUG', default=False, cast=bool)
 
 ALLOWED_HOSTS = config('ALLOWED_HOSTS', default='').split(",")
 
@@ -43,7 +45,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings and query counts cover the whole request
+    'library.middleware.MetricsMiddleware',
+    'library.middleware.SQLProfilerMiddleware',
+    'library.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Serves static files (with WhiteNoise) before sessions are loaded
+    'library.middleware.StaticFilesMiddleware',
+    # Outside everything that renders, so it sees the finished body
+    'library.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -58,8 +68,15 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'library' / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
+            # Compiled templates are kept in memory, also with DEBUG on
+            # (runserver's autoreloader clears them when a template changes)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -76,16 +93,108 @@ WSGI_APPLICATION = 'library_management_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE=sqlite runs the app and the test suite without a MySQL server.
+DB_ENGINE = config('DB_ENGINE', default='mysql')
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            # Take the write lock when a transaction starts, so concurrent
+            # writers wait for each other instead of failing
+            'OPTIONS': {'transaction_mode': 'IMMEDIATE', 'timeout': 20},
+            # A file rather than an in-memory database, so threads in the
+            # concurrency tests get connections of their own
+            'TEST': {'NAME': str(BASE_DIR / 'test_db.sqlite3')},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.mysql',
+            'NAME': config('DB_NAME'),
+            'USER': config('DB_USER'),
+            'PASSWORD': config('DB_PASSWORD'),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='3306'),
+        }
+    }
+
+# Persistent connections: each worker thread keeps its connection open for
+# DB_CONN_MAX_AGE seconds (0 reconnects on every request) and pings it before
+# reusing it after a request, so a connection MySQL dropped is replaced
+# instead of failing the request. Django recommends against persistent
+# connections in async code, so SERVER_MODE=asgi turns them off. So does a
+# gevent worker: each greenlet gets its own connection, and a kept one is
+# never closed once its greenlet is gone.
+SERVER_MODE = config('SERVER_MODE', default='wsgi')
+if SERVER_MODE == 'asgi' or config('GUNICORN_WORKER_CLASS', default='') == 'gevent':
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = config('DB_CONN_MAX_AGE', default=60, cast=int)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool)
+
+# Read replica: with DB_REPLICA_HOST set, the list pages and exports read
+# from a MySQL replica (see library.routers). A client that wrote reads from
+# the primary for the next DB_REPLICA_PIN_SECONDS, which should exceed the
+# replica's usual lag, so it sees its own changes.
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+DB_REPLICA_PIN_SECONDS = config('DB_REPLICA_PIN_SECONDS', default=10, cast=int)
+if DB_REPLICA_HOST and DB_ENGINE != 'sqlite':
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DB_REPLICA_HOST,
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        'USER': config('DB_REPLICA_USER', default=DATABASES['default']['USER']),
+        'PASSWORD': config('DB_REPLICA_PASSWORD', default=DATABASES['default']['PASSWORD']),
+        # Tests read the test database through this alias
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['library.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# The local-memory default is per process; point CACHE_BACKEND/CACHE_LOCATION
+# at memcached or Redis to share the cache between workers and pods.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
-        'NAME': config('DB_NAME'),
-        'USER': config('DB_USER'),
-        'PASSWORD': config('DB_PASSWORD'),
-        'HOST': config('DB_HOST', default='localhost'),
-        'PORT': config('DB_PORT', default='3306'),
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
     }
 }
+# Whether every worker and pod sees the same cache. Local memory is per
+# process and the file cache per pod, so only these backends count
+SHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+    'django.core.cache.backends.db.DatabaseCache',
+)
+SHARED_CACHE = CACHES['default']['BACKEND'] in SHARED_CACHE_BACKENDS
+
+
+# Sessions
+# https://docs.djangoproject.com/en/4.2/topics/http/sessions/
+# 'cached_db' reads sessions from the cache and writes them through to the
+# database, 'cache' keeps them only in the cache (needs a shared cache),
+# 'signed_cookies' keeps them in the client's cookie and 'db' always reads
+# them from the database. The cache modes need a shared cache: with a
+# per-process cache, a logout on one worker would leave the session alive
+# on every other worker that cached it. Without one the default is 'db'.
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+SESSION_MODE = config('SESSION_MODE', default='cached_db' if SHARED_CACHE else 'db')
+if SESSION_MODE in ('cached_db', 'cache') and not SHARED_CACHE:
+    raise ImproperlyConfigured(f"SESSION_MODE '{SESSION_MODE}' needs a shared CACHE_BACKEND such as memcached or Redis")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
 
 
 # Password validation
@@ -125,6 +234,21 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# collectstatic (run when the image is built) gives every file a content
+# hash in its name and writes gzip and brotli copies next to it. WhiteNoise
+# serves them from the app with far-future immutable caching, choosing the
+# compressed copy the browser accepts
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'library.storage.StaticStorage',
+    },
+}
+# Only the hashed names are referenced, so the originals need not be kept
+WHITENOISE_KEEP_ONLY_HASHED_FILES = True
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -135,6 +259,90 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',  # Keep the default backend
 ]
 
+# Password hashing: BCRYPT_ROUNDS fixes the bcrypt cost, 0 calibrates it in
+# each process so that one hash takes about BCRYPT_TARGET_MS (never below
+# BCRYPT_MIN_ROUNDS). The Helm chart fixes it so every pod hashes alike
+BCRYPT_ROUNDS = config('BCRYPT_ROUNDS', default=0, cast=int)
+BCRYPT_TARGET_MS = config('BCRYPT_TARGET_MS', default=250, cast=int)
+BCRYPT_MIN_ROUNDS = config('BCRYPT_MIN_ROUNDS', default=10, cast=int)
+
+# Login throttling: counters per client IP and per email allowing *_BURST
+# attempts per window of *_BURST / *_RATE minutes. Needs a shared cache to
+# hold across workers and pods
+LOGIN_THROTTLE_ENABLED = config('LOGIN_THROTTLE_ENABLED', default=True, cast=bool)
+LOGIN_THROTTLE_IP_BURST = config('LOGIN_THROTTLE_IP_BURST', default=20, cast=int)
+LOGIN_THROTTLE_IP_RATE = config('LOGIN_THROTTLE_IP_RATE', default=10, cast=float)
+LOGIN_THROTTLE_EMAIL_BURST = config('LOGIN_THROTTLE_EMAIL_BURST', default=5, cast=int)
+LOGIN_THROTTLE_EMAIL_RATE = config('LOGIN_THROTTLE_EMAIL_RATE', default=1, cast=float)
+# Set when running behind a proxy or ingress that sets X-Forwarded-For;
+# TRUSTED_PROXY_COUNT is the number of proxies that append to it
+USE_X_FORWARDED_FOR = config('USE_X_FORWARDED_FOR', default=False, cast=bool)
+TRUSTED_PROXY_COUNT = config('TRUSTED_PROXY_COUNT', default=1, cast=int)
+
+# Keyset pagination of the catalogue and management tables
+PAGE_SIZE = config('PAGE_SIZE', default=50, cast=int)
+MAX_PAGE_SIZE = config('MAX_PAGE_SIZE', default=200, cast=int)
+
+# Seconds a rendered catalogue page stays cached. Writes invalidate pages
+# through a version number, so this only bounds memory use
+CATALOGUE_CACHE_TIMEOUT = config('CATALOGUE_CACHE_TIMEOUT', default=300, cast=int)
+
+# Catalogue search: 'auto' uses a FULLTEXT index on MySQL and the token
+# table everywhere else; 'fulltext' or 'tokens' forces one of them
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='auto')
+
+# Overdue fines: FINE_DAILY_RATE per day after FINE_GRACE_DAYS days past the
+# due date, capped at FINE_MAX_AMOUNT (0 means no cap)
+FINE_DAILY_RATE = config('FINE_DAILY_RATE', default='0.50', cast=Decimal)
+FINE_GRACE_DAYS = config('FINE_GRACE_DAYS', default=0, cast=int)
+FINE_MAX_AMOUNT = config('FINE_MAX_AMOUNT', default='0', cast=Decimal)
+
+# Bearer token required to read /metrics. With METRICS_PORT set gunicorn
+# also listens on that port and /metrics answers there only, so a Service
+# or ingress that forwards the application port does not publish it
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+METRICS_PORT = config('METRICS_PORT', default=0, cast=int)
+
+# Compression of dynamic responses (see library/compression.py); responses
+# smaller than COMPRESSION_MIN_SIZE bytes are not worth it
+COMPRESSION_ENABLED = config('COMPRESSION_ENABLED', default=True, cast=bool)
+COMPRESSION_MIN_SIZE = config('COMPRESSION_MIN_SIZE', default=1024, cast=int)
+
+# Sampling SQL profiler (see library/profiling.py)
+SQL_PROFILER_ENABLED = config('SQL_PROFILER_ENABLED', default=False, cast=bool)
+SQL_PROFILER_SAMPLE_RATE = config('SQL_PROFILER_SAMPLE_RATE', default=0.01, cast=float)
+SQL_PROFILER_SLOW_MS = config('SQL_PROFILER_SLOW_MS', default=500, cast=int)
+SQL_PROFILER_BUFFER_SIZE = config('SQL_PROFILER_BUFFER_SIZE', default=100, cast=int)
+SQL_PROFILER_LOG_FILE = config('SQL_PROFILER_LOG_FILE', default='')
+
+if SQL_PROFILER_LOG_FILE:
+    LOGGING = {
+        'version': 1,
+        'disable_existing_loggers': False,
+        'handlers': {
+            'sql_profiler': {
+                'class': 'logging.handlers.RotatingFileHandler',
+                'filename': SQL_PROFILER_LOG_FILE,
+                'maxBytes': 10 * 1024 * 1024,
+                'backupCount': 5,
+            },
+        },
+        'loggers': {
+            'library.sql_profiler': {
+                'handlers': ['sql_profiler'],
+                'level': 'INFO',
+                'propagate': False,
+            },
+        },
+    }
+
+# Days a returned copy is held for the next member in the reservation queue
+RESERVATION_HOLD_DAYS = config('RESERVATION_HOLD_DAYS', default=3, cast=int)
+
+# Days a returned loan stays in the loans table before archive_loans moves it
+# to the loan archive
+LOAN_RETENTION_DAYS = config('LOAN_RETENTION_DAYS', default=365, cast=int)
+
 MESSAGE_TAGS = {
     messages.DEBUG: 'secondary',
     messages.INFO: 'info',
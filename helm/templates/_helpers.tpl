@@ -60,3 +60,115 @@ Create the name of the service account to use
 {{- default "default" .Values.serviceAccount.name }}
 {{- end }}
 {{- end }}
+
+
+{{/*
+Database connections one pod may hold: MySQL's max_connections, less the
+reserved connections, divided by the most pods that can run at once
+(including the 25% surge of a rolling update)
+*/}}
+{{- define "library-management-system.connectionBudget" -}}
+{{- $pods := int .Values.replicaCount }}
+{{- if .Values.autoscaling.enabled }}
+{{- $pods = int .Values.autoscaling.maxReplicas }}
+{{- end }}
+{{- $pods = add $pods (div (add $pods 3) 4) }}
+{{- $available := sub (int .Values.database.maxConnections) (int .Values.database.reservedConnections) }}
+{{- max 1 (div $available $pods) }}
+{{- end }}
+
+{{/*
+Environment of the Django containers, shared by the Deployment and the CronJobs
+*/}}
+{{- define "library-management-system.env" -}}
+- name: SECRET_KEY
+  value: {{ .Values.django.secretKey | quote }}
+- name: DEBUG
+  value: {{ .Values.django.debug | quote }}
+- name: ALLOWED_HOSTS
+  value: {{ .Values.django.allowedHosts | quote }}
+- name: METRICS_TOKEN
+  value: {{ .Values.metrics.token | quote }}
+- name: METRICS_PORT
+  value: {{ .Values.metrics.port | quote }}
+{{- with .Values.cache.backend }}
+- name: CACHE_BACKEND
+  value: {{ . | quote }}
+- name: CACHE_LOCATION
+  value: {{ $.Values.cache.location | quote }}
+{{- end }}
+{{- with .Values.sessions.mode }}
+- name: SESSION_MODE
+  value: {{ . | quote }}
+{{- end }}
+- name: BCRYPT_ROUNDS
+  value: {{ .Values.passwords.bcryptRounds | quote }}
+- name: SQL_PROFILER_ENABLED
+  value: {{ .Values.sqlProfiler.enabled | quote }}
+- name: SQL_PROFILER_SAMPLE_RATE
+  value: {{ .Values.sqlProfiler.sampleRate | quote }}
+- name: SQL_PROFILER_SLOW_MS
+  value: {{ .Values.sqlProfiler.slowMs | quote }}
+- name: SERVER_MODE
+  value: {{ .Values.server.mode | quote }}
+- name: GUNICORN_WORKER_CLASS
+  value: {{ .Values.gunicorn.workerClass | quote }}
+- name: GUNICORN_WORKERS
+  value: {{ .Values.gunicorn.workers | quote }}
+- name: GUNICORN_THREADS
+  value: {{ .Values.gunicorn.threads | quote }}
+- name: GUNICORN_MAX_REQUESTS
+  value: {{ .Values.gunicorn.maxRequests | quote }}
+- name: GUNICORN_MAX_REQUESTS_JITTER
+  value: {{ .Values.gunicorn.maxRequestsJitter | quote }}
+- name: GUNICORN_KEEPALIVE
+  value: {{ .Values.gunicorn.keepalive | quote }}
+- name: GUNICORN_BACKLOG
+  value: {{ .Values.gunicorn.backlog | quote }}
+- name: GUNICORN_TIMEOUT
+  value: {{ .Values.gunicorn.timeout | quote }}
+- name: DB_NAME
+  value: {{ .Values.database.name | quote }}
+- name: DB_USER
+  value: {{ .Values.database.user | quote }}
+- name: DB_PASSWORD
+  value: {{ .Values.database.password | quote }}
+- name: DB_HOST
+  value: {{ .Values.database.host | quote }}
+- name: DB_PORT
+  value: {{ .Values.database.port | quote }}
+- name: DB_CONN_MAX_AGE
+  value: {{ .Values.database.connMaxAge | quote }}
+- name: DB_CONN_HEALTH_CHECKS
+  value: {{ .Values.database.connHealthChecks | quote }}
+- name: DB_MAX_CONNECTIONS_PER_PROCESS
+  value: {{ .Values.database.maxConnectionsPerProcess | quote }}
+- name: DB_MAX_CONNECTIONS_PER_POD
+  value: {{ include "library-management-system.connectionBudget" . | quote }}
+- name: DB_REPLICA_HOST
+  value: {{ .Values.database.replica.host | quote }}
+{{- with .Values.database.replica.port }}
+- name: DB_REPLICA_PORT
+  value: {{ . | quote }}
+{{- end }}
+{{- with .Values.database.replica.user }}
+- name: DB_REPLICA_USER
+  value: {{ . | quote }}
+{{- end }}
+{{- with .Values.database.replica.password }}
+- name: DB_REPLICA_PASSWORD
+  value: {{ . | quote }}
+{{- end }}
+- name: DB_REPLICA_PIN_SECONDS
+  value: {{ .Values.database.replica.pinSeconds | quote }}
+- name: FINE_DAILY_RATE
+  value: {{ .Values.fines.dailyRate | quote }}
+- name: FINE_GRACE_DAYS
+  value: {{ .Values.fines.graceDays | quote }}
+- name: FINE_MAX_AMOUNT
+  value: {{ .Values.fines.maxAmount | quote }}
+- name: RESERVATION_HOLD_DAYS
+  value: {{ .Values.reservations.holdDays | quote }}
+- name: LOAN_RETENTION_DAYS
+  value: {{ .Values.loans.retentionDays | quote }}
+{{- end }}